@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers the rest of the stack
+    'core.instrumentation.RequestTimingMiddleware',
+    'core.querystats.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,15 +92,104 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Django's postgresql backend plus connection health checks and
+        # metrics (core.db.backends.postgresql)
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
-        "PASSWORD": os.environ.get("DB_PASS")
+        "PASSWORD": os.environ.get("DB_PASS"),
+        # Seconds a connection is reused across requests before it is
+        # recycled, 0 opens one per request
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 300)),
+        # Check a reused connection still works before each request uses it
+        "CONN_HEALTH_CHECKS": bool(
+            int(os.environ.get("DB_CONN_HEALTH_CHECKS", 1))
+        ),
+        "OPTIONS": {
+            # Identifies our connections in pg_stat_activity
+            "application_name": os.environ.get(
+                "DB_APPLICATION_NAME", "recipe-api"
+            ),
+        },
+    }
+}
+
+# Read replicas as comma separated "host[:port][/name]", using the default
+# database's credentials. Safe requests of views using
+# core.routers.ReplicaReadsMixin read from them.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(","))
+):
+    address, _, replica_name = replica.strip().partition("/")
+    replica_host, _, replica_port = address.partition(":")
+    alias = f"replica{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "PORT": replica_port,
+        "NAME": replica_name or DATABASES["default"]["NAME"],
+        # Tests run against the primary's test database
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"]
+
+# Tests read from the primary unless they opt in to replicas
+TEST_RUNNER = "core.test_runner.PrimaryOnlyTestRunner"
+
+# Seconds a user's reads stay on the primary after they write
+DB_REPLICA_PIN_SECONDS = int(os.environ.get("DB_REPLICA_PIN_SECONDS", 10))
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Per-user list responses (recipe.cache), bounded in age and size
+    "api": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "api-responses",
+        "TIMEOUT": int(os.environ.get("API_CACHE_TIMEOUT", 300)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("API_CACHE_MAX_ENTRIES", 1000)),
+        },
+    },
+    # Per-user tag/ingredient autocomplete (?q=) responses, one per typed
+    # prefix so kept apart from the list responses; AUTOCOMPLETE_CACHE=0
+    # turns it off
+    "autocomplete": {
+        "BACKEND": (
+            "django.core.cache.backends.locmem.LocMemCache"
+            if int(os.environ.get("AUTOCOMPLETE_CACHE", 1))
+            else "django.core.cache.backends.dummy.DummyCache"
+        ),
+        "LOCATION": "autocomplete-responses",
+        "TIMEOUT": int(os.environ.get("AUTOCOMPLETE_CACHE_TIMEOUT", 60)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(
+                os.environ.get("AUTOCOMPLETE_CACHE_MAX_ENTRIES", 10000)
+            ),
+        },
+    },
 }
 
 
+# In-process token authentication cache (user.authentication). Each
+# worker only evicts entries for changes it saw itself, so for up to
+# AUTH_TOKEN_CACHE_TTL seconds other workers still accept a deleted token
+# or a deactivated user; changes made without model signals (queryset
+# .update()) aren't evicted anywhere. Keep the TTL at a few seconds: it is
+# how long a revoked credential may keep working.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get("AUTH_TOKEN_CACHE_TTL", 5))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -139,6 +232,9 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = "/vol/web/media"
 STATIC_ROOT = '/vol/web/static'
 
+# Threads per worker building resized recipe images (0 = inline)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -152,6 +248,44 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS" : "drf_spectacular.openapi.AutoSchema",
 }
 
+# Default page size for recipe list endpoints (clients may pass ?page_size=)
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 100))
+
+# Most tags/ingredients returned for a name prefix (?q=), whatever the
+# page_size asked for
+AUTOCOMPLETE_PAGE_SIZE = int(os.environ.get("AUTOCOMPLETE_PAGE_SIZE", 10))
+
 SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True
 }
+
+# Server-Timing header on every response, plus a JSON log line per request
+# with REQUEST_TIMING_LOG (core.instrumentation)
+REQUEST_TIMING = bool(int(os.environ.get("REQUEST_TIMING", 0)))
+REQUEST_TIMING_LOG = bool(int(os.environ.get("REQUEST_TIMING_LOG", 0)))
+
+# Per fingerprint SQL statistics shown in the admin (core.querystats),
+# flushed from each worker every QUERY_STATS_FLUSH_INTERVAL seconds
+QUERY_STATS = bool(int(os.environ.get("QUERY_STATS", 0)))
+QUERY_STATS_FLUSH_INTERVAL = int(
+    os.environ.get("QUERY_STATS_FLUSH_INTERVAL", 10)
+)
+
+# Threads serving requests, each with its own persistent database
+# connection, per ASGI worker process (core.asgi)
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 8))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "core.instrumentation": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
@@ -55,3 +55,58 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Recipe)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
+
+
+class QueryStatAdmin(admin.ModelAdmin):
+    # Read-only view of the SQL statistics collected by core.querystats
+    list_display = [
+        "short_sql", "view", "count", "total", "mean", "p95",
+        "max_per_request", "last_seen",
+    ]
+    list_filter = ["view"]
+    search_fields = ["sql", "view"]
+    ordering = ["-total_ms"]
+    readonly_fields = [
+        "fingerprint", "view", "sql", "count", "total", "mean", "p95",
+        "max_per_request", "histogram", "last_seen",
+    ]
+    exclude = ["total_ms"]
+    actions = ["reset"]
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_active and request.user.is_staff
+
+    def has_module_permission(self, request):
+        return self.has_view_permission(request)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return self.has_view_permission(request)
+
+    @admin.display(description="SQL")
+    def short_sql(self, obj):
+        return obj.sql if len(obj.sql) <= 120 else f"{obj.sql[:117]}..."
+
+    @admin.display(description="Total (ms)", ordering="total_ms")
+    def total(self, obj):
+        return round(obj.total_ms, 1)
+
+    @admin.display(description="Mean (ms)")
+    def mean(self, obj):
+        return round(obj.mean_ms, 2)
+
+    @admin.display(description="p95 (ms)")
+    def p95(self, obj):
+        return round(obj.p95_ms, 1)
+
+    @admin.action(description="Reset selected statistics")
+    def reset(self, request, queryset):
+        queryset.delete()
+
+
+admin.site.register(models.QueryStat, QueryStatAdmin)
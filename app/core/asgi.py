@@ -0,0 +1,175 @@
+"""
+ASGI handler running requests on a bounded pool of database threads
+
+Under uWSGI each worker process serves one request at a time, so a slow
+query, a slow client or a large image upload holds a whole worker. Under
+an ASGI server the event loop receives request bodies and sends responses
+for any number of connections, and only the Django part of a request runs
+on one of ASGI_THREADS threads per worker process. Each thread keeps its
+database connection between requests (CONN_MAX_AGE and CONN_HEALTH_CHECKS
+apply as under uWSGI), so a worker never holds more than ASGI_THREADS
+connections.
+
+Django 4.0 has no async ORM and DRF views are synchronous, so Django's own
+ASGI handler runs every request's middleware and view on a new thread
+(with a new database connection), switching threads for each middleware.
+Here the whole synchronous request runs in one hop to a pool thread, the
+way it would under WSGI.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+from django.db import close_old_connections
+from django.http import FileResponse
+from django.urls import set_script_prefix
+
+_executor = None
+
+
+def get_executor():
+    """Return the process wide request thread pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS,
+            thread_name_prefix="asgi",
+        )
+    return _executor
+
+
+def _with_connection(func, *args):
+    # Broken or expired connections are closed before and after each
+    # call, healthy ones are kept for the next
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_in_thread(func, *args):
+    """Call func on a request thread, in a copy of the current context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), context.run, _with_connection, func, *args
+    )
+
+
+class ASGIHandler(BaseASGIHandler):
+    """Serve Django over ASGI with synchronous requests on a thread pool"""
+
+    # Chunks of a streamed body produced ahead of sending
+    streaming_window = 4
+
+    def __init__(self):
+        # The synchronous middleware chain, as under WSGI
+        self.load_middleware(is_async=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise ValueError(
+                f"Django can only handle ASGI/HTTP connections, "
+                f"not {scope['type']}."
+            )
+        await self.handle(scope, receive, send)
+
+    async def handle(self, scope, receive, send):
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        response = await run_in_thread(self.respond, scope, body_file)
+        response._handler_class = self.__class__
+        if isinstance(response, FileResponse):
+            response.block_size = self.chunk_size
+        await self.send_response(response, send)
+
+    def respond(self, scope, body_file):
+        """Return the response to a request (on a request thread)"""
+        set_script_prefix(self.get_script_prefix(scope))
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        request, response = self.create_request(scope, body_file)
+        if request is not None:
+            response = self.get_response(request)
+        if not response.streaming:
+            # The body is ready, finish the request without another hop
+            response.close()  # Sends request_finished
+        return response
+
+    async def send_response(self, response, send):
+        """Encode and send a response out over ASGI"""
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((
+                b"Set-Cookie",
+                cookie.output(header="").encode("ascii").strip(),
+            ))
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": response_headers,
+        })
+
+        if response.streaming:
+            await self.send_streaming_content(response, send)
+            await run_in_thread(response.close)  # Sends request_finished
+        else:
+            for chunk, last in self.chunk_bytes(response.content):
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": not last,
+                })
+
+    async def send_streaming_content(self, response, send):
+        """Send a streamed body as a request thread produces it
+
+        The thread is held until the body is sent, and never gets more
+        than streaming_window chunks ahead of the client.
+        """
+        loop = asyncio.get_running_loop()
+        parts = asyncio.Queue()
+        window = threading.Semaphore(self.streaming_window)
+        stopped = threading.Event()
+        end = object()
+
+        def produce():
+            try:
+                for part in response:
+                    window.acquire()
+                    if stopped.is_set():  # Sending failed
+                        break
+                    loop.call_soon_threadsafe(parts.put_nowait, part)
+            finally:
+                loop.call_soon_threadsafe(parts.put_nowait, end)
+
+        producer = asyncio.ensure_future(run_in_thread(produce))
+        try:
+            while True:
+                part = await parts.get()
+                if part is end:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": True,
+                    })
+                window.release()
+        finally:
+            stopped.set()
+            window.release()
+            await producer  # Raises what the body raised
+        await send({"type": "http.response.body"})
@@ -0,0 +1,86 @@
+"""
+PostgreSQL backend with persistent connection health checks and metrics
+
+Django keeps connections open between requests for CONN_MAX_AGE seconds
+and closes them at the first request boundary after that, which recycles
+connections before the server or a proxy drops them. With
+CONN_HEALTH_CHECKS (native from Django 4.1, backported here) a reused
+connection is checked with SELECT 1 before its first query in each
+request, and replaced if the server went away.
+
+connection_stats() reports how often this process connected, reused,
+recycled and replaced connections.
+"""
+import threading
+import time
+
+from django.db.backends.postgresql import base
+
+_stats_lock = threading.Lock()
+_stats = {
+    "connects": 0,
+    "closes": 0,
+    "recycled": 0,
+    "health_checks": 0,
+    "health_check_failures": 0,
+}
+
+
+def _record(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def connection_stats():
+    """Return this process's connection counters"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["open"] = stats["connects"] - stats["closes"]
+    return stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL connection with CONN_HEALTH_CHECKS support"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return bool(self.settings_dict.get("CONN_HEALTH_CHECKS", False))
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True  # Brand new, nothing to check
+        _record("connects")
+
+    def _close(self):
+        super()._close()
+        _record("closes")
+
+    def close_if_unusable_or_obsolete(self):
+        # Called when each request starts and finishes
+        if self.connection is not None:
+            self.health_check_done = False
+            if self.close_at is not None and time.monotonic() >= self.close_at:
+                _record("recycled")
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        """Close a reused connection that no longer works"""
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+        ):
+            return
+        _record("health_checks")
+        if not self.is_usable():
+            _record("health_check_failures")
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
@@ -0,0 +1,190 @@
+"""
+Per-request performance instrumentation
+
+With REQUEST_TIMING on, RequestTimingMiddleware measures every request
+and adds a Server-Timing header that browsers' dev tools and load testing
+tools can read:
+
+    Server-Timing: db;dur=3.1;desc="4 queries", view;dur=9.8,
+                   serialize;dur=4.2, render;dur=1.0, total;dur=11.5,
+                   bytes;desc="20481"
+
+view includes the db and serialize time spent inside it. With
+REQUEST_TIMING_LOG on, the same figures are also logged as one JSON line
+per request. When REQUEST_TIMING is off the middleware removes itself from
+the stack and timed() only costs a context variable lookup.
+"""
+import contextvars
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Timings collected while handling a single request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}  # name: seconds
+        self.active = set()  # Names currently being timed
+        self.queries = 0
+        self.view_start = None
+        self.view_end = None
+        self.render_start = None
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Count and time every query (connection.execute_wrapper hook)"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add("db", time.perf_counter() - start)
+
+    def summary(self, response_bytes=None):
+        """Return the timings as {"name": milliseconds, ...}"""
+        now = time.perf_counter()
+        durations = dict(self.durations)
+        if self.view_start is not None:
+            durations["view"] = (self.view_end or now) - self.view_start
+        durations["total"] = now - self.start
+        summary = {
+            f"{name}_ms": round(seconds * 1000, 3)
+            for name, seconds in durations.items()
+        }
+        summary["queries"] = self.queries
+        if response_bytes is not None:
+            summary["bytes"] = response_bytes
+        return summary
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's timings
+
+    Nested blocks with the same name are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.add(name, time.perf_counter() - start)
+
+
+def server_timing(summary):
+    """Format a timings summary as a Server-Timing header value"""
+    metrics = []
+    for name in ("db", "view", "serialize", "render", "total"):
+        duration = summary.get(f"{name}_ms")
+        if duration is None:
+            continue
+        metric = f"{name};dur={duration}"
+        if name == "db":
+            metric += f';desc="{summary["queries"]} queries"'
+        metrics.append(metric)
+    if "bytes" in summary:
+        metrics.append(f'bytes;desc="{summary["bytes"]}"')
+    return ", ".join(metrics)
+
+
+def _instrument_serializers():
+    """Time DRF serializers' .data as "serialize"
+
+    Serializer.data and ListSerializer.data both end up in
+    BaseSerializer.data, so wrapping it once covers every serializer.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    def timed_data(self):
+        with timed("serialize"):
+            return data.fget(self)
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+class RequestTimingMiddleware:
+    """Report per-request db, view, serializer and render timings"""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        _instrument_serializers()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        if timings.render_start is not None:
+            timings.add("render", time.perf_counter() - timings.render_start)
+        if response.streaming:
+            # Size isn't known until the body has been sent
+            response["Server-Timing"] = server_timing(timings.summary())
+            response.streaming_content = self._log_after_stream(
+                request, response, response.streaming_content, timings
+            )
+        else:
+            summary = timings.summary(len(response.content))
+            response["Server-Timing"] = server_timing(summary)
+            self._log(request, response, summary)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current.get().view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called between the view returning and the response rendering
+        timings = _current.get()
+        timings.view_end = timings.render_start = time.perf_counter()
+        return response
+
+    def _log_after_stream(self, request, response, content, timings):
+        response_bytes = 0
+        for chunk in content:
+            response_bytes += len(chunk)
+            yield chunk
+        self._log(request, response, timings.summary(response_bytes))
+
+    def _log(self, request, response, summary):
+        if not settings.REQUEST_TIMING_LOG:
+            return
+        match = request.resolver_match
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            **summary,
+        }))
@@ -0,0 +1,431 @@
+"""
+Django command benchmarking every recipe and user API endpoint
+
+Seeds a reproducible dataset into a throwaway database, times each
+endpoint through the full request stack and reports latency percentiles,
+query counts and peak memory as JSON. With --compare the results are
+checked against a stored baseline and regressions fail the command.
+"""
+import io
+import json
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, Tag, Ingredient
+from core.seeding import SEED_PASSWORD, seed_dataset, seed_email
+from recipe import urls as recipe_urls
+from recipe.cache import api_cache, autocomplete_cache
+from user import urls as user_urls
+
+
+def url_names():
+    # Every namespaced URL name exposed by the recipe and user apps
+    names = {f"recipe:{p.name}" for p in recipe_urls.router.urls}
+    names.add("recipe:api-root")
+    names.update(f"user:{p.name}" for p in user_urls.urlpatterns)
+    return names
+
+
+def percentile(cut_points, pct):
+    # Value below which pct percent of the timings fall
+    return round(cut_points[pct - 1], 3)
+
+
+def image_file():
+    # Small JPEG to upload
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), color=(200, 120, 40)).save(buffer, "JPEG")
+    buffer.seek(0)
+    buffer.name = "benchmark.jpg"
+    return buffer
+
+
+class Scenarios:
+    # Request builders for each endpoint. A builder runs untimed before
+    # every request and returns (method, path, client kwargs).
+
+    def __init__(self, user):
+        self.user = user
+        self.counter = 0
+        # Keeps created names unique when --keepdb reuses the data
+        self.run_id = uuid.uuid4().hex[:8]
+        self.recipe = Recipe.objects.filter(user=user).order_by("-id")[0]
+        self.tags = list(Tag.objects.filter(user=user)[:3])
+        self.ingredients = list(Ingredient.objects.filter(user=user)[:5])
+        # Half of the user's ingredients
+        self.pantry = list(Ingredient.objects.filter(user=user).values_list(
+            "id", flat=True
+        ))[::2]
+
+    def _next(self):
+        self.counter += 1
+        return f"{self.run_id}-{self.counter}"
+
+    def _json(self, data):
+        return {"data": json.dumps(data), "content_type": "application/json"}
+
+    def _recipe_payload(self):
+        return {
+            "title": f"Benchmark recipe {self._next()}",
+            "time_minutes": 30,
+            "price": "7.50",
+            "tags": [{"name": t.name} for t in self.tags],
+            "ingredients": [{"name": i.name} for i in self.ingredients],
+        }
+
+    def _new_recipe(self):
+        return Recipe.objects.create(
+            user=self.user, title="Disposable", time_minutes=1, price=1
+        )
+
+    def _new_attr(self, model):
+        return model.objects.create(
+            user=self.user, name=f"Disposable {self._next()}"
+        )
+
+    def _recipe_url(self):
+        return reverse("recipe:recipe-detail", args=[self.recipe.id])
+
+    def all(self):
+        # name: (url name, builder)
+        tag_ids = ",".join(str(t.id) for t in self.tags)
+        return {
+            "recipe-api-root": ("recipe:api-root", lambda: (
+                "get", reverse("recipe:api-root"), {})),
+            "recipe-list": ("recipe:recipe-list", self.cold(lambda: (
+                "get", reverse("recipe:recipe-list"), {}))),
+            "recipe-list-cached": ("recipe:recipe-list", lambda: (
+                "get", reverse("recipe:recipe-list"), {})),
+            "recipe-list-filtered": ("recipe:recipe-list", self.cold(
+                lambda: ("get", reverse("recipe:recipe-list"), {
+                    "data": {"tags": tag_ids}}))),
+            "recipe-list-search": ("recipe:recipe-list", self.cold(
+                lambda: ("get", reverse("recipe:recipe-list"), {
+                    "data": {"search": "chicken curry"}}))),
+            "recipe-list-ranged": ("recipe:recipe-list", self.cold(
+                lambda: ("get", reverse("recipe:recipe-list"), {
+                    "data": {"max_time_minutes": 30, "max_price": "10",
+                             "ordering": "price"}}))),
+            "recipe-create": ("recipe:recipe-list", lambda: (
+                "post", reverse("recipe:recipe-list"),
+                self._json(self._recipe_payload()))),
+            "recipe-retrieve": ("recipe:recipe-detail", lambda: (
+                "get", self._recipe_url(), {})),
+            "recipe-update": ("recipe:recipe-detail", lambda: (
+                "put", self._recipe_url(),
+                self._json(self._recipe_payload()))),
+            "recipe-partial-update": ("recipe:recipe-detail", lambda: (
+                "patch", self._recipe_url(),
+                self._json({"title": f"Renamed {self._next()}"}))),
+            "recipe-destroy": ("recipe:recipe-detail", lambda: (
+                "delete", reverse(
+                    "recipe:recipe-detail", args=[self._new_recipe().id]
+                ), {})),
+            "recipe-upload-image": ("recipe:recipe-upload-image", lambda: (
+                "post", reverse(
+                    "recipe:recipe-upload-image", args=[self.recipe.id]
+                ), {"data": {"image": image_file()}})),
+            "recipe-batch": ("recipe:recipe-batch", lambda: (
+                "post", reverse("recipe:recipe-batch"),
+                self._json([self._recipe_payload() for _ in range(20)]))),
+            "recipe-export": ("recipe:recipe-export", lambda: (
+                "get", reverse("recipe:recipe-export"), {})),
+            "recipe-pantry": ("recipe:recipe-pantry", lambda: (
+                "post", reverse("recipe:recipe-pantry"),
+                self._json({"ingredients": self.pantry}))),
+            "recipe-similar": ("recipe:recipe-similar", lambda: (
+                "get", reverse(
+                    "recipe:recipe-similar", args=[self.recipe.id]
+                ), {})),
+            "recipe-stats": ("recipe:recipe-stats", lambda: (
+                "get", reverse("recipe:recipe-stats"), {})),
+            **self.attr_scenarios("tag", Tag),
+            **self.attr_scenarios("ingredient", Ingredient),
+            "user-create": ("user:create", lambda: (
+                "post", reverse("user:create"), self._json({
+                    "email": f"benchmark-{self._next()}@example.com",
+                    "password": "benchmark-pass",
+                    "name": "Benchmark",
+                }))),
+            "user-token": ("user:token", lambda: (
+                "post", reverse("user:token"), {"data": {
+                    "email": self.user.email, "password": SEED_PASSWORD,
+                }})),
+            "user-me": ("user:me", lambda: (
+                "get", reverse("user:me"), {})),
+            "user-me-update": ("user:me", lambda: (
+                "patch", reverse("user:me"),
+                self._json({"name": f"Seed User {self._next()}"}))),
+        }
+
+    def attr_scenarios(self, basename, model):
+        list_url = reverse(f"recipe:{basename}-list")
+        existing = self._new_attr(model)
+
+        def detail(obj):
+            return reverse(f"recipe:{basename}-detail", args=[obj.id])
+
+        list_name = f"recipe:{basename}-list"
+        detail_name = f"recipe:{basename}-detail"
+        assigned = {"data": {"assigned_only": 1}}
+        # A prefix typed in the recipe editor
+        prefix = {"data": {"q": model.objects.filter(
+            user=self.user
+        ).order_by("name").values_list("name", flat=True)[0][:3]}}
+        return {
+            f"{basename}-list": (list_name, self.cold(
+                lambda: ("get", list_url, {}))),
+            f"{basename}-list-assigned": (list_name, self.cold(
+                lambda: ("get", list_url, assigned))),
+            f"{basename}-autocomplete": (list_name, self.cold(
+                lambda: ("get", list_url, prefix))),
+            f"{basename}-autocomplete-cached": (list_name, lambda: (
+                "get", list_url, prefix)),
+            f"{basename}-update": (detail_name, lambda: (
+                "patch", detail(existing),
+                self._json({"name": f"Renamed {self._next()}"}))),
+            f"{basename}-destroy": (detail_name, lambda: (
+                "delete", detail(self._new_attr(model)), {})),
+        }
+
+    def cold(self, builder):
+        # Measure a list without the response caches
+        def build():
+            api_cache().clear()
+            autocomplete_cache().clear()
+            return builder()
+        return build
+
+
+class Command(BaseCommand):
+    # Django command benchmarking the API endpoints
+
+    help = (
+        "Seed a reproducible dataset into a throwaway database and report "
+        "latency percentiles, query counts and peak memory per endpoint as "
+        "JSON. --compare fails on regressions against a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--recipes", type=int, default=1000)
+        parser.add_argument("--tags-per-user", type=int, default=30)
+        parser.add_argument("--ingredients-per-user", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--iterations", type=int, default=50,
+            help="Timed requests per endpoint",
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=3,
+            help="Untimed requests per endpoint before timing",
+        )
+        parser.add_argument(
+            "--only", default="",
+            help="Comma separated scenario names to run",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file",
+        )
+        parser.add_argument(
+            "--compare", help="Baseline JSON report to compare against",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Allowed relative p95 latency and memory growth",
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Reuse the benchmark database and its data between runs",
+        )
+
+    def setup_database(self, keepdb):
+        # Run against a separate database, never the configured one
+        self.old_name = connection.settings_dict["NAME"]
+        connection.settings_dict["TEST"]["NAME"] = f"benchmark_{self.old_name}"
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=keepdb
+        )
+
+    def teardown_database(self, keepdb):
+        connection.creation.destroy_test_db(
+            self.old_name, verbosity=0, keepdb=keepdb
+        )
+
+    def seed(self, options):
+        if Recipe.objects.exists():  # Kept from an earlier --keepdb run
+            return
+        self.stderr.write(
+            f"Seeding {options['recipes']} recipes for "
+            f"{options['users']} users..."
+        )
+        seed_dataset(
+            users=options["users"],
+            recipes=options["recipes"],
+            tags_per_user=options["tags_per_user"],
+            ingredients_per_user=options["ingredients_per_user"],
+            seed=options["seed"],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def send(self, client, method, path, kwargs):
+        response = getattr(client, method)(path, **kwargs)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{method.upper()} {path} returned {response.status_code}"
+            )
+        return response
+
+    def measure(self, client, build, iterations, warmup):
+        for _ in range(warmup):
+            self.send(client, *build())
+
+        timings = []
+        for _ in range(iterations):
+            method, path, kwargs = build()
+            start = time.perf_counter()
+            self.send(client, method, path, kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        # Counting queries and tracing allocations slow requests down, so
+        # they get a separate untimed request
+        method, path, kwargs = build()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.send(client, method, path, kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        cut_points = statistics.quantiles(
+            timings * 2 if len(timings) == 1 else timings,
+            n=100, method="inclusive",
+        )
+        return {
+            "p50_ms": percentile(cut_points, 50),
+            "p95_ms": percentile(cut_points, 95),
+            "p99_ms": percentile(cut_points, 99),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "queries": len(queries),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+
+    def run_scenarios(self, options):
+        # The first seeded user owns the most recipes
+        user = get_user_model().objects.get(email=seed_email(0))
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        scenarios = Scenarios(user).all()
+
+        uncovered = url_names() - {url for url, _ in scenarios.values()}
+        if uncovered:
+            raise CommandError(
+                f"No benchmark for: {', '.join(sorted(uncovered))}"
+            )
+
+        only = [name for name in options["only"].split(",") if name]
+        results = {}
+        for name, (_, build) in scenarios.items():
+            if only and name not in only:
+                continue
+            results[name] = self.measure(
+                client, build, options["iterations"], options["warmup"]
+            )
+            self.stderr.write(
+                f"{name:<28} p50 {results[name]['p50_ms']:>9.2f} ms  "
+                f"p95 {results[name]['p95_ms']:>9.2f} ms  "
+                f"{results[name]['queries']:>3} queries"
+            )
+        return results
+
+    def compare(self, report, baseline, threshold):
+        # Return a description of every regression against the baseline
+        regressions = []
+        if report["dataset"] != baseline.get("dataset"):
+            self.stderr.write(
+                self.style.WARNING("Baseline was run on a different dataset")
+            )
+        for name, result in report["results"].items():
+            base = baseline["results"].get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                regressions.append(
+                    f"{name}: queries {base['queries']} -> "
+                    f"{result['queries']}"
+                )
+            for metric in ("p95_ms", "peak_memory_kb"):
+                if result[metric] > base[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{name}: {metric} {base[metric]} -> "
+                        f"{result[metric]}"
+                    )
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        self.setup_database(options["keepdb"])
+        try:
+            # Image variants are rendered inline so their cost is counted
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                        MEDIA_ROOT=media_root, IMAGE_WORKERS=0,
+                    ):
+                self.seed(options)
+                results = self.run_scenarios(options)
+        finally:
+            self.teardown_database(options["keepdb"])
+
+        report = {
+            "dataset": {
+                key: options[key] for key in (
+                    "users", "recipes", "tags_per_user",
+                    "ingredients_per_user", "seed",
+                )
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": settings.DATABASES["default"]["ENGINE"],
+                "iterations": options["iterations"],
+            },
+            "results": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                output_file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = self.compare(report, baseline, options["threshold"])
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) found")
+            self.stderr.write(self.style.SUCCESS("No regressions"))
@@ -0,0 +1,108 @@
+"""
+Django command comparing per-request and persistent DB connections
+"""
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from core.db.backends.postgresql.base import connection_stats
+
+
+class Command(BaseCommand):
+    # Django command benchmarking connection reuse on a small request
+
+    help = (
+        "Time requests to /api/health-check/ opening a new database "
+        "connection per request (CONN_MAX_AGE=0) against reusing one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument(
+            "--conn-max-age", type=int, default=300,
+            help="CONN_MAX_AGE of the persistent run",
+        )
+        parser.add_argument(
+            "--no-health-checks", action="store_true",
+            help="Don't check reused connections before each request",
+        )
+
+    def request(self, handler, environ):
+        # Serve one request the way uWSGI does, closing the response fires
+        # request_finished which closes or keeps the DB connection
+        statuses = []
+        response = handler(
+            dict(environ), lambda status, headers: statuses.append(status)
+        )
+        try:
+            b"".join(response)
+        finally:
+            response.close()
+        return int(statuses[0].split()[0])
+
+    def run(self, handler, environ, conn_max_age, options):
+        # Time requests with connections kept for conn_max_age seconds
+        connection.close()
+        connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+        connection.settings_dict["CONN_HEALTH_CHECKS"] = (
+            not options["no_health_checks"]
+        )
+        for _ in range(options["warmup"]):
+            self.request(handler, environ)
+
+        before = connection_stats()
+        timings = []
+        for _ in range(options["requests"]):
+            start = time.perf_counter()
+            status = self.request(handler, environ)
+            timings.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                raise CommandError(f"Health check returned {status}")
+        after = connection_stats()
+
+        cut_points = statistics.quantiles(timings, n=100, method="inclusive")
+        return {
+            "p50": cut_points[49],
+            "p95": cut_points[94],
+            "p99": cut_points[98],
+            "connects": after["connects"] - before["connects"],
+        }
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2")
+        handler = WSGIHandler()
+        environ = RequestFactory().get(reverse("health-check")).environ
+        saved = dict(connection.settings_dict)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                results = [
+                    ("per request", self.run(handler, environ, 0, options)),
+                    ("persistent", self.run(
+                        handler, environ, options["conn_max_age"], options
+                    )),
+                ]
+        finally:
+            connection.close()
+            connection.settings_dict.update(saved)
+
+        self.stdout.write(
+            f"{'connections':<12} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+            f"{'p99 (ms)':>9} {'connects':>9}"
+        )
+        for name, result in results:
+            self.stdout.write(
+                f"{name:<12} {result['p50']:>9.3f} {result['p95']:>9.3f} "
+                f"{result['p99']:>9.3f} {result['connects']:>9}"
+            )
+        speedup = results[0][1]["p50"] / results[1][1]["p50"]
+        self.stdout.write(f"Persistent connections: {speedup:.1f}x at p50")
@@ -0,0 +1,129 @@
+"""
+Django command comparing the fast read serializers with the DRF ones
+"""
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import serializers
+
+
+class InMemoryFastRecipeSerializer(serializers.FastRecipeSerializer):
+    # Fast serializer reading nested objects from prebuilt maps, not the DB
+    related = {}
+
+    def _related_map(self, field, recipe_ids):
+        return self.related[field]
+
+
+def build_dataset(size, tags_per_recipe, ingredients_per_recipe):
+    # Build matching model instances and .values() rows without a database
+    tags = [Tag(id=i, name=f"Tag {i}") for i in range(1, 51)]
+    ingredients = [
+        Ingredient(id=i, name=f"Ingredient {i}") for i in range(1, 201)
+    ]
+    recipes, rows = [], []
+    related = {"tags": {}, "ingredients": {}}
+    for i in range(1, size + 1):
+        recipe = Recipe(
+            id=i,
+            title=f"Recipe {i}",
+            time_minutes=i % 120,
+            price=Decimal(i % 10000) / 100,
+            link=f"https://example.com/{i}",
+            image=f"uploads/recipe/{i}.jpg" if i % 2 else None,
+            image_status="ready" if i % 2 else "",
+            image_variants={
+                "thumbnail": f"uploads/recipe/{i}_thumbnail.jpg",
+            } if i % 2 else {},
+        )
+        recipe_tags = [
+            tags[(i + j) % len(tags)] for j in range(tags_per_recipe)
+        ]
+        recipe_ingredients = [
+            ingredients[(i * 7 + j) % len(ingredients)]
+            for j in range(ingredients_per_recipe)
+        ]
+        recipe._prefetched_objects_cache = {
+            "tags": recipe_tags,
+            "ingredients": recipe_ingredients,
+        }
+        recipes.append(recipe)
+        rows.append({
+            "id": recipe.id,
+            "title": recipe.title,
+            "time_minutes": recipe.time_minutes,
+            "price": recipe.price,
+            "link": recipe.link,
+            "image": recipe.image.name,
+            "image_status": recipe.image_status,
+            "image_variants": recipe.image_variants,
+        })
+        related["tags"][i] = [
+            {"id": t.id, "name": t.name} for t in recipe_tags
+        ]
+        related["ingredients"][i] = [
+            {"id": t.id, "name": t.name} for t in recipe_ingredients
+        ]
+    return recipes, rows, related
+
+
+def best_of(repeat, func):
+    # Return the fastest wall time of func over repeat runs and its result
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    # Django command benchmarking list serialization
+
+    help = (
+        "Time RecipeSerializer against FastRecipeSerializer on synthetic "
+        "in-memory recipes and check both render identical JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="1000,10000,100000",
+            help="Comma separated recipe counts to benchmark",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--tags", type=int, default=4)
+        parser.add_argument("--ingredients", type=int, default=8)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        renderer = JSONRenderer()
+        self.stdout.write(
+            f"{'recipes':>10} {'drf (s)':>10} {'fast (s)':>10} "
+            f"{'speedup':>8}"
+        )
+        for size in sizes:
+            recipes, rows, related = build_dataset(
+                size, options["tags"], options["ingredients"]
+            )
+            InMemoryFastRecipeSerializer.related = related
+
+            slow_time, slow_data = best_of(
+                options["repeat"],
+                lambda: serializers.RecipeSerializer(recipes, many=True).data,
+            )
+            fast_time, fast_data = best_of(
+                options["repeat"],
+                lambda: InMemoryFastRecipeSerializer(rows, many=True).data,
+            )
+            if renderer.render(slow_data) != renderer.render(fast_data):
+                raise CommandError(f"Output differs for {size} recipes")
+
+            self.stdout.write(
+                f"{size:>10} {slow_time:>10.3f} {fast_time:>10.3f} "
+                f"{slow_time / fast_time:>7.1f}x"
+            )
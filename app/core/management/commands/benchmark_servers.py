@@ -0,0 +1,367 @@
+"""
+Django command load testing the API under uWSGI and under uvicorn (ASGI)
+
+Seeds the same throwaway database as benchmark_api, starts each server with
+the same number of worker processes and hammers the recipe, tag, ingredient
+and user endpoints from many concurrent clients. A fraction of the
+requests are slow recipe exports, which show how a long request holds up
+the others. Reports throughput, errors and latency percentiles
+per server.
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.error import URLError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.management.commands import benchmark_api
+from core.models import Recipe
+from core.seeding import seed_email
+
+SERVERS = ("uwsgi", "uvicorn")
+
+
+def free_port():
+    # Port nothing is listening on right now
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, backlog):
+    # The deployed command line (scripts/run.sh), serving plain HTTP
+    if server == "uwsgi":
+        uwsgi = shutil.which("uwsgi")
+        if uwsgi is None:
+            raise CommandError("uwsgi isn't installed")
+        return [
+            uwsgi, "--http-socket", f"127.0.0.1:{port}",
+            "--workers", str(workers), "--master", "--enable-threads",
+            "--module", "app.wsgi", "--listen", str(backlog),
+            "--disable-logging", "--die-on-term",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", "app.asgi:application",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--backlog", str(backlog),
+        "--no-access-log", "--log-level", "warning",
+    ]
+
+
+async def read_response(reader):
+    # Read one HTTP/1.1 response and return its status
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()  # Body ends with the connection
+    return status
+
+
+def latency_summary(latencies):
+    # Percentiles of a list of request latencies
+    cut_points = statistics.quantiles(
+        latencies * 2 if len(latencies) == 1 else latencies,
+        n=100, method="inclusive",
+    )
+    return {
+        "p50_ms": benchmark_api.percentile(cut_points, 50),
+        "p95_ms": benchmark_api.percentile(cut_points, 95),
+        "p99_ms": benchmark_api.percentile(cut_points, 99),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+class LoadTest:
+    # Closed loop load: each of the concurrent clients sends its next
+    # request as soon as the previous response has been read
+
+    def __init__(self, port, plans, timeout):
+        self.port = port
+        self.plans = plans  # Per user lists of (kind, request bytes)
+        self.timeout = timeout
+        self.latencies = {"fast": [], "slow": []}
+        self.errors = 0
+        self.failed = 0  # Responses with 4xx/5xx status
+
+    async def exchange(self, request):
+        # One request on a new connection, as nginx sends them upstream
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            writer.write(request)
+            return await read_response(reader)
+        finally:
+            writer.close()
+
+    async def connection(self, index, deadline):
+        plan = self.plans[index % len(self.plans)]
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            kind, request = rng.choice(plan)
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    self.exchange(request), self.timeout
+                )
+            except (OSError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError, asyncio.TimeoutError,
+                    ValueError):
+                self.errors += 1
+                continue
+            self.latencies[kind].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                self.failed += 1
+
+    async def run(self, concurrency, duration):
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(
+            self.connection(index, deadline) for index in range(concurrency)
+        ))
+
+    def report(self, duration):
+        # Latencies of fast requests and of slow exports are reported
+        # separately, the former show how much the latter hold them up
+        if not self.latencies["fast"]:
+            raise CommandError("No request succeeded")
+        requests = sum(map(len, self.latencies.values()))
+        report = {
+            "requests": requests,
+            "throughput_rps": round(requests / duration, 1),
+            "errors": self.errors,
+            "failed": self.failed,
+        }
+        for kind, latencies in self.latencies.items():
+            if latencies:
+                report[kind] = latency_summary(latencies)
+        return report
+
+
+class Command(benchmark_api.Command):
+    # Django command comparing uWSGI and uvicorn under concurrent load
+
+    help = (
+        "Seed a throwaway database, then load test the API under uWSGI "
+        "and uvicorn with the same number of workers at high concurrency. "
+        "Reports throughput and latency percentiles per server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--recipes", type=int, default=20000)
+        parser.add_argument("--tags-per-user", type=int, default=30)
+        parser.add_argument("--ingredients-per-user", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--servers", default=",".join(SERVERS),
+            help="Comma separated servers to test (uwsgi, uvicorn)",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Worker processes per server, as in scripts/run.sh",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=200,
+            help="Concurrent clients",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=15,
+            help="Seconds of measured load per server",
+        )
+        parser.add_argument(
+            "--warmup", type=float, default=3,
+            help="Seconds of unmeasured load before measuring",
+        )
+        parser.add_argument(
+            "--slow-fraction", type=float, default=0.02,
+            help="Share of requests that are (slow) recipe exports",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=30,
+            help="Seconds before a request counts as an error",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file",
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Reuse the benchmark database and its data between runs",
+        )
+
+    def request_plans(self, options):
+        # Raw requests for each seeded user, exports mixed in at
+        # --slow-fraction
+        paths = [
+            reverse("recipe:recipe-list"),
+            reverse("recipe:tag-list"),
+            reverse("recipe:ingredient-list"),
+            reverse("user:me"),
+        ]
+        export = reverse("recipe:recipe-export")
+        plans = []
+        for index in range(options["users"]):
+            user = get_user_model().objects.get(email=seed_email(index))
+            recipe = Recipe.objects.filter(user=user).first()
+            if recipe is None:
+                continue
+            token, _ = Token.objects.get_or_create(user=user)
+            user_paths = [
+                *paths, reverse("recipe:recipe-detail", args=[recipe.id])
+            ]
+            weighted = [("fast", path) for path in user_paths]
+            if options["slow_fraction"]:
+                # One export among every 1 / slow_fraction requests
+                fast = max(
+                    len(user_paths), round(1 / options["slow_fraction"]) - 1
+                )
+                weighted = [
+                    *(weighted[i % len(weighted)] for i in range(fast)),
+                    ("slow", export),
+                ]
+            plans.append([
+                (kind, (
+                    f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                    f"Authorization: Token {token.key}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("ascii"))
+                for kind, path in weighted
+            ])
+        if not plans:
+            raise CommandError("No seeded users with recipes")
+        return plans
+
+    def start_server(self, server, port, options):
+        environ = {
+            **os.environ,
+            "DB_NAME": connection.settings_dict["NAME"],
+            "ALLOWED_HOSTS": "127.0.0.1",
+            "DJANGO_SETTINGS_MODULE": "app.settings",
+        }
+        log = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            server_command(
+                server, port, options["workers"], options["concurrency"]
+            ),
+            cwd=settings.BASE_DIR, env=environ,
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+        url = f"http://127.0.0.1:{port}{reverse('health-check')}"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return process, log
+            except (URLError, OSError):
+                time.sleep(0.1)
+        self.stop_server(process)
+        log.seek(0)
+        raise CommandError(
+            f"{server} didn't start:\n{log.read().decode(errors='replace')}"
+        )
+
+    def stop_server(self, process):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def load_test(self, server, plans, options):
+        port = free_port()
+        process, log = self.start_server(server, port, options)
+        try:
+            if options["warmup"]:
+                asyncio.run(LoadTest(port, plans, options["timeout"]).run(
+                    options["concurrency"], options["warmup"]
+                ))
+            load = LoadTest(port, plans, options["timeout"])
+            start = time.monotonic()
+            asyncio.run(load.run(options["concurrency"], options["duration"]))
+            return load.report(time.monotonic() - start)
+        finally:
+            self.stop_server(process)
+            log.close()
+
+    def handle(self, *args, **options):
+        servers = [name for name in options["servers"].split(",") if name]
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(f"Unknown servers: {', '.join(unknown)}")
+        if not 0 <= options["slow_fraction"] < 1:
+            raise CommandError("--slow-fraction must be in [0, 1)")
+
+        self.setup_database(options["keepdb"])
+        try:
+            self.seed(options)
+            plans = self.request_plans(options)
+            # The servers connect to the benchmark database on their own
+            connection.close()
+            results = {}
+            for server in servers:
+                self.stderr.write(
+                    f"Load testing {server} with {options['workers']} "
+                    f"workers and {options['concurrency']} clients..."
+                )
+                results[server] = self.load_test(server, plans, options)
+        finally:
+            self.teardown_database(options["keepdb"])
+
+        # Percentiles of the fast requests, median of the exports
+        self.stdout.write(
+            f"{'server':<8} {'req/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+            f"{'p99 (ms)':>9} {'export (ms)':>12} {'errors':>7}"
+        )
+        for server, result in results.items():
+            fast = result["fast"]
+            export = result.get("slow", {}).get("p50_ms", 0)
+            self.stdout.write(
+                f"{server:<8} {result['throughput_rps']:>9.1f} "
+                f"{fast['p50_ms']:>9.2f} {fast['p95_ms']:>9.2f} "
+                f"{fast['p99_ms']:>9.2f} {export:>12.2f} "
+                f"{result['errors'] + result['failed']:>7}"
+            )
+
+        if options["output"]:
+            report = {
+                "options": {
+                    key: options[key] for key in (
+                        "users", "recipes", "seed", "workers",
+                        "concurrency", "duration", "slow_fraction",
+                    )
+                },
+                "results": results,
+            }
+            with open(options["output"], "w") as output_file:
+                output_file.write(json.dumps(report, indent=2) + "\n")
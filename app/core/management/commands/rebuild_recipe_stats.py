@@ -0,0 +1,64 @@
+"""
+Django command checking and rebuilding the recipe summary tables
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.pantry import (
+    ingredient_count_drift,
+    refresh_ingredient_counts,
+)
+from recipe.similarity import refresh_similarity, similarity_drift
+from recipe.stats import (
+    rebuild_recipe_stats,
+    recipe_count_drift,
+    recipe_stats_drift,
+    refresh_recipe_counts,
+)
+
+
+class Command(BaseCommand):
+    # Django command recomputing the trigger maintained recipe summaries
+
+    help = (
+        "Compare the per-user recipe stats, the tag/ingredient recipe "
+        "counts, the recipe ingredient counts and similarity signatures "
+        "with the recipes, then rebuild them from scratch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report drift, failing if there is any",
+        )
+
+    def handle(self, *args, **options):
+        stats_drift = recipe_stats_drift()
+        count_drift = recipe_count_drift()
+        ingredient_drift = ingredient_count_drift()
+        signature_drift = similarity_drift()
+        self.stdout.write(f"Recipe stats: {stats_drift} rows drifted")
+        self.stdout.write(
+            f"Tag and ingredient recipe counts: {count_drift} rows drifted"
+        )
+        self.stdout.write(
+            f"Recipe ingredient counts: {ingredient_drift} rows drifted"
+        )
+        self.stdout.write(
+            f"Recipe similarity signatures: {signature_drift} rows drifted"
+        )
+        if options["check"]:
+            if (stats_drift or count_drift or ingredient_drift
+                    or signature_drift):
+                raise CommandError(
+                    "Recipe summaries drifted, run rebuild_recipe_stats"
+                )
+            return
+
+        rows = rebuild_recipe_stats()
+        corrected = refresh_recipe_counts()
+        corrected += refresh_ingredient_counts()
+        signatures = refresh_similarity()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} recipe stats rows, corrected {corrected} "
+            f"counts and {signatures} similarity signatures"
+        ))
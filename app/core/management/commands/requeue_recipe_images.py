@@ -0,0 +1,44 @@
+"""
+Django command processing recipe images left pending
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.images import process_image
+
+
+class Command(BaseCommand):
+    # Django command building the variants of images whose job was lost,
+    # e.g. queued in a worker that was recycled or restarted
+
+    help = (
+        "Build the variants of every recipe image still pending, in this "
+        "process. An upload a worker is processing at the same time is "
+        "built twice, which can leave unused variant files behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report how many images are pending",
+        )
+
+    def handle(self, *args, **options):
+        pending = list(
+            Recipe.objects.filter(image_status="pending")
+            .order_by("id")
+            .values_list("id", "image")
+        )
+        self.stdout.write(f"Pending recipe images: {len(pending)}")
+        if options["check"]:
+            return
+
+        for recipe_id, image_name in pending:
+            process_image(recipe_id, image_name)
+        ready = Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, _ in pending],
+            image_status="ready",
+        ).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(pending)} images, {ready} ready"
+        ))
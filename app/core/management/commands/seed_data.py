@@ -0,0 +1,250 @@
+"""
+Django command to fill the database with a large synthetic dataset
+
+Builds staging sized data (millions of recipes and links) with COPY from
+several worker processes. Secondary indexes are dropped for the load and
+rebuilt afterwards, then the tables are analyzed so the planner sees
+production-like statistics. The triggers maintaining the recipe summaries
+(recipe.stats) are disabled for the load, and the summaries rebuilt in one
+pass at the end.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from core.models import Recipe, Tag, Ingredient
+from core.seeding import (
+    copy_owners,
+    copy_recipes,
+    reserve_ids,
+    zipf_cum_weights,
+)
+from recipe.stats import (
+    SUMMARY_TRIGGERS,
+    rebuild_recipe_stats,
+    refresh_recipe_counts,
+)
+
+DISTRIBUTIONS = ("uniform", "zipf")
+
+
+def size_range(value):
+    # Parse "MIN-MAX" (or a single number) into a (min, max) tuple
+    low, _, high = value.partition("-")
+    low, high = int(low), int(high or low)
+    if low < 0 or high < low:
+        raise ValueError(value)
+    return low, high
+
+
+def seeded_models():
+    # Every table the command writes to
+    return [
+        get_user_model(), Tag, Ingredient, Recipe,
+        Recipe.tags.through, Recipe.ingredients.through,
+    ]
+
+
+def load_part(plan, part, first_id, count):
+    # Worker process entry point, forked connections can't be shared
+    connections.close_all()
+    try:
+        return copy_recipes(plan, part, first_id, count)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    # Django command seeding users, recipes, tags and ingredients
+
+    help = (
+        "Generate users, tags, ingredients, recipes and their links with "
+        "COPY across several processes, then rebuild indexes and ANALYZE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--recipes", type=int, default=1000000)
+        parser.add_argument("--tags-per-user", type=int, default=30)
+        parser.add_argument("--ingredients-per-user", type=int, default=150)
+        parser.add_argument(
+            "--tags-per-recipe", type=size_range, default=(0, 5),
+            help="MIN-MAX tags on each recipe",
+        )
+        parser.add_argument(
+            "--ingredients-per-recipe", type=size_range, default=(2, 12),
+            help="MIN-MAX ingredients on each recipe",
+        )
+        parser.add_argument(
+            "--owner-distribution", choices=DISTRIBUTIONS, default="zipf",
+            help="How recipes are spread over users",
+        )
+        parser.add_argument(
+            "--popularity", choices=DISTRIBUTIONS, default="zipf",
+            help="How often each of a user's tags/ingredients is used",
+        )
+        parser.add_argument(
+            "--zipf-exponent", type=float, default=1.0,
+            help="Skew of the zipf distributions",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Processes loading recipes, 1 loads in this process",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=50000,
+            help="Recipes per COPY and transaction",
+        )
+        parser.add_argument(
+            "--keep-indexes", action="store_true",
+            help="Maintain secondary indexes during the load",
+        )
+
+    def cum_weights(self, distribution, size, exponent):
+        if distribution == "uniform":
+            return None
+        return zipf_cum_weights(size, exponent)
+
+    def make_plan(self, options):
+        users = options["users"]
+        if users < 1:
+            raise CommandError("--users must be at least 1")
+        return {
+            "users": users,
+            "tags_per_user": options["tags_per_user"],
+            "ingredients_per_user": options["ingredients_per_user"],
+            "tags_per_recipe": options["tags_per_recipe"],
+            "ingredients_per_recipe": options["ingredients_per_recipe"],
+            "seed": options["seed"],
+            "batch_size": options["batch_size"],
+            "owner_cum_weights": self.cum_weights(
+                options["owner_distribution"], users,
+                options["zipf_exponent"],
+            ),
+            "tag_cum_weights": self.cum_weights(
+                options["popularity"], options["tags_per_user"],
+                options["zipf_exponent"],
+            ),
+            "ingredient_cum_weights": self.cum_weights(
+                options["popularity"], options["ingredients_per_user"],
+                options["zipf_exponent"],
+            ),
+            # Ids are handed out before loading so workers never need
+            # RETURNING or lookups to link rows together
+            "first_user": reserve_ids(get_user_model(), users),
+            "first_tag": reserve_ids(
+                Tag, users * options["tags_per_user"]
+            ),
+            "first_ingredient": reserve_ids(
+                Ingredient, users * options["ingredients_per_user"]
+            ),
+            "first_recipe": reserve_ids(Recipe, options["recipes"]),
+        }
+
+    def table_indexes(self):
+        # (name, definition, backs a constraint) of the seeded tables
+        tables = [model._meta.db_table for model in seeded_models()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT i.indexrelid::regclass::text, "
+                "pg_get_indexdef(i.indexrelid), EXISTS ("
+                "SELECT 1 FROM pg_constraint c "
+                "WHERE c.conindid = i.indexrelid) "
+                "FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid "
+                "WHERE t.relname = ANY(%s)",
+                [tables],
+            )
+            return cursor.fetchall()
+
+    def load_recipes(self, plan, recipes, workers):
+        # Split the recipe id range into one part per worker
+        workers = max(1, min(workers, recipes))
+        per_part = -(-recipes // workers)
+        parts = [
+            (part, plan["first_recipe"] + part * per_part,
+             min(per_part, recipes - part * per_part))
+            for part in range(workers)
+        ]
+        if workers == 1:
+            return [copy_recipes(plan, *parts[0])]
+
+        connections.close_all()  # Children must not inherit the socket
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as pool:
+            futures = [pool.submit(load_part, plan, *part) for part in parts]
+            return [future.result() for future in futures]
+
+    def step(self, message, started):
+        self.stdout.write(f"{message} ({time.monotonic() - started:.1f}s)")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        plan = self.make_plan(options)
+
+        indexes = self.table_indexes()
+        # Indexes backing primary keys and unique constraints have to stay,
+        # the others are cheaper to build once over the loaded rows
+        deferred = [] if options["keep_indexes"] else [
+            (name, definition)
+            for name, definition, constraint in indexes if not constraint
+        ]
+        with connection.cursor() as cursor:
+            for name, _ in deferred:
+                cursor.execute(f"DROP INDEX {name}")
+            # Parallel COPYs would all update (and lock) the same summary
+            # rows, they're rebuilt once after the load
+            for table, trigger in SUMMARY_TRIGGERS:
+                cursor.execute(
+                    f"ALTER TABLE {table} DISABLE TRIGGER {trigger}"
+                )
+        try:
+            copy_owners(plan)
+            self.step(f"Loaded {plan['users']} users", started)
+
+            written = [0, 0, 0]
+            if options["recipes"] > 0:
+                for counts in self.load_recipes(
+                    plan, options["recipes"], options["workers"]
+                ):
+                    written = [a + b for a, b in zip(written, counts)]
+            self.step(
+                f"Loaded {written[0]} recipes, {written[1]} tag links and "
+                f"{written[2]} ingredient links",
+                started,
+            )
+        finally:
+            # Put dropped indexes and triggers back even if the load failed
+            with connection.cursor() as cursor:
+                # Run deferred FK checks now when called inside an outer
+                # transaction, Postgres won't index tables with them pending
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                for table, trigger in SUMMARY_TRIGGERS:
+                    cursor.execute(
+                        f"ALTER TABLE {table} ENABLE TRIGGER {trigger}"
+                    )
+                refresh_recipe_counts()
+                rebuild_recipe_stats()
+                for _, definition in deferred:
+                    cursor.execute(definition)
+
+        with connection.cursor() as cursor:
+            # The rest were grown row by row; rebuild them compactly
+            deferred_names = {name for name, _ in deferred}
+            for name, _, _ in indexes:
+                if name not in deferred_names:
+                    cursor.execute(f"REINDEX INDEX {name}")
+            self.step(f"Rebuilt {len(indexes)} indexes", started)
+            for model in seeded_models():
+                table = connection.ops.quote_name(model._meta.db_table)
+                cursor.execute(f"ANALYZE {table}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded and analyzed in {time.monotonic() - started:.1f}s"
+        ))
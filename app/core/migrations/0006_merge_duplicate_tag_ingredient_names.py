@@ -0,0 +1,48 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:27
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Fold duplicate (user, name) tags/ingredients into the oldest row"""
+    Recipe = apps.get_model("core", "Recipe")
+    for model_name, field in (("Tag", "tags"), ("Ingredient", "ingredients")):
+        model = apps.get_model("core", model_name)
+        through = getattr(Recipe, field).through
+        target = f"{model_name.lower()}_id"
+        duplicates = (
+            model.objects.values("user", "name")
+            .annotate(keep=Min("id"), rows=Count("id"))
+            .filter(rows__gt=1)
+        )
+        for dup in duplicates:
+            drop_ids = list(
+                model.objects.filter(user=dup["user"], name=dup["name"])
+                .exclude(id=dup["keep"])
+                .values_list("id", flat=True)
+            )
+            recipe_ids = set(
+                through.objects.filter(**{f"{target}__in": drop_ids})
+                .values_list("recipe_id", flat=True)
+            )
+            recipe_ids -= set(
+                through.objects.filter(**{target: dup["keep"]})
+                .values_list("recipe_id", flat=True)
+            )
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{target: dup["keep"]})
+                for recipe_id in recipe_ids
+            ])
+            model.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_unique_tag_ingredient_name'),
+    ]
+
+    # The auto-created M2M tables only index (recipe_id, target_id); add the
+    # reverse pair so EXISTS probes from tags/ingredients are index-only.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX recipe_tags_tag_recipe_idx "
+            "ON core_recipe_tags (tag_id, recipe_id);",
+            "DROP INDEX recipe_tags_tag_recipe_idx;",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX recipe_ingredients_ingredient_recipe_idx "
+            "ON core_recipe_ingredients (ingredient_id, recipe_id);",
+            "DROP INDEX recipe_ingredients_ingredient_recipe_idx;",
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+    ]
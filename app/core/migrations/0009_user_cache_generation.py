@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cache_generation',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:39
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Fill search_vector for existing recipes in short transactions"""
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            # Touching title fires the search vector trigger
+            cursor.execute(
+                "UPDATE core_recipe SET title = title WHERE id IN ("
+                "SELECT id FROM core_recipe WHERE search_vector IS NULL "
+                "LIMIT %s)",
+                [BATCH_SIZE],
+            )
+            if cursor.rowcount < BATCH_SIZE:
+                break
+
+
+class Migration(migrations.Migration):
+
+    # Each batch commits on its own and CREATE INDEX CONCURRENTLY can't run
+    # in a transaction, so writes to core_recipe carry on during the build.
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:58
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32)),
+                ('view', models.CharField(max_length=255)),
+                ('sql', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_per_request', models.IntegerField(default=0)),
+                ('histogram', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None)),
+                ('last_seen', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='querystat',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'view'), name='unique_query_stat_per_view'),
+        ),
+        # Statistics are cheap to lose in a crash, skip the WAL for them
+        migrations.RunSQL(
+            'ALTER TABLE core_querystat SET UNLOGGED',
+            'ALTER TABLE core_querystat SET LOGGED',
+        ),
+    ]
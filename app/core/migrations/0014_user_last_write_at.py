@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_query_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_write_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+# Keeps Tag/Ingredient.recipe_count in sync with the recipe link tables.
+# Statement level triggers apply one aggregated UPDATE per statement, so a
+# bulk insert, COPY or cascading delete of many links costs one UPDATE per
+# distinct tag/ingredient rather than one per link. Rows are locked in id
+# order first so concurrent link writes can't deadlock on them.
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_count_update() RETURNS trigger AS $$
+DECLARE
+    links text := CASE TG_OP WHEN 'INSERT' THEN 'new_links' ELSE 'old_links' END;
+    delta int := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    -- TG_ARGV: counted table, its column in the link table
+    EXECUTE format(
+        'SELECT 1 FROM %1$I WHERE id IN (SELECT %2$I FROM %3$I) '
+        'ORDER BY id FOR UPDATE',
+        TG_ARGV[0], TG_ARGV[1], links
+    );
+    EXECUTE format(
+        'UPDATE %1$I c SET recipe_count = c.recipe_count + d.n '
+        'FROM (SELECT %2$I AS id, count(*) * %4$s AS n FROM %3$I GROUP BY 1) d '
+        'WHERE c.id = d.id',
+        TG_ARGV[0], TG_ARGV[1], links, delta
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_count_insert
+    AFTER INSERT ON core_recipe_tags REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_count_update('core_tag', 'tag_id');
+CREATE TRIGGER core_recipe_tags_count_delete
+    AFTER DELETE ON core_recipe_tags REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_count_update('core_tag', 'tag_id');
+CREATE TRIGGER core_recipe_ingredients_count_insert
+    AFTER INSERT ON core_recipe_ingredients REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_count_update('core_ingredient', 'ingredient_id');
+CREATE TRIGGER core_recipe_ingredients_count_delete
+    AFTER DELETE ON core_recipe_ingredients REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_count_update('core_ingredient', 'ingredient_id');
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_tags_count_insert ON core_recipe_tags;
+DROP TRIGGER core_recipe_tags_count_delete ON core_recipe_tags;
+DROP TRIGGER core_recipe_ingredients_count_insert ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_count_delete ON core_recipe_ingredients;
+DROP FUNCTION core_recipe_count_update();
+"""
+
+# One aggregated pass per link table; runs after the triggers exist, which
+# hold off link writes until the migration commits
+BACKFILL = """
+UPDATE core_tag t SET recipe_count = l.n
+FROM (SELECT tag_id, count(*) AS n FROM core_recipe_tags GROUP BY 1) l
+WHERE t.id = l.tag_id;
+UPDATE core_ingredient i SET recipe_count = l.n
+FROM (SELECT ingredient_id, count(*) AS n FROM core_recipe_ingredients GROUP BY 1) l
+WHERE i.id = l.ingredient_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_last_write_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', '-name'], name='ingredient_user_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', '-name'], name='tag_user_popular_idx'),
+        ),
+    ]
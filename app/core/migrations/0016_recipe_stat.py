@@ -0,0 +1,111 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Keeps core_recipestat in sync with core_recipe. Like the recipe_count
+# triggers (0015) they run once per statement over its transition tables:
+# the changed rows are reduced to a net +/- count per (user, field, value),
+# unchanged prices and times cancel out, and only the keys left are
+# written. Existing rows are locked in key order first so concurrent
+# writes by one user can't deadlock.
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_stat_update() RETURNS trigger AS $$
+DECLARE
+    changes text;
+    deltas text;
+BEGIN
+    changes := CASE TG_OP
+        WHEN 'INSERT' THEN
+            'SELECT user_id, price, time_minutes, 1 AS n FROM new_recipes'
+        WHEN 'DELETE' THEN
+            'SELECT user_id, price, time_minutes, -1 AS n FROM old_recipes'
+        ELSE
+            'SELECT user_id, price, time_minutes, 1 AS n FROM new_recipes '
+            || 'UNION ALL '
+            || 'SELECT user_id, price, time_minutes, -1 FROM old_recipes'
+    END;
+    deltas := 'SELECT user_id, field, value, sum(n)::int AS n FROM ('
+        || 'SELECT user_id, ''price'' AS field, (price * 100)::int AS value, n '
+        || 'FROM (' || changes || ') c UNION ALL '
+        || 'SELECT user_id, ''time_minutes'', time_minutes, n '
+        || 'FROM (' || changes || ') c'
+        || ') k GROUP BY 1, 2, 3 HAVING sum(n) <> 0';
+
+    EXECUTE 'SELECT 1 FROM core_recipestat s JOIN (' || deltas || ') d '
+        || 'USING (user_id, field, value) '
+        || 'ORDER BY s.user_id, s.field, s.value FOR UPDATE OF s';
+    EXECUTE 'INSERT INTO core_recipestat (user_id, field, value, recipes) '
+        || 'SELECT user_id, field, value, n FROM (' || deltas || ') d '
+        || 'WHERE n > 0 ORDER BY 1, 2, 3 '
+        || 'ON CONFLICT (user_id, field, value) DO UPDATE '
+        || 'SET recipes = core_recipestat.recipes + excluded.recipes';
+    -- Rows of a deleted user may already be gone, they're not recreated
+    EXECUTE 'UPDATE core_recipestat s SET recipes = s.recipes + d.n '
+        || 'FROM (' || deltas || ') d WHERE d.n < 0 '
+        || 'AND s.user_id = d.user_id AND s.field = d.field '
+        || 'AND s.value = d.value';
+    EXECUTE 'DELETE FROM core_recipestat s USING (' || deltas || ') d '
+        || 'WHERE d.n < 0 AND s.user_id = d.user_id '
+        || 'AND s.field = d.field AND s.value = d.value AND s.recipes = 0';
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_stat_insert
+    AFTER INSERT ON core_recipe REFERENCING NEW TABLE AS new_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stat_update();
+CREATE TRIGGER core_recipe_stat_update
+    AFTER UPDATE ON core_recipe
+    REFERENCING OLD TABLE AS old_recipes NEW TABLE AS new_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stat_update();
+CREATE TRIGGER core_recipe_stat_delete
+    AFTER DELETE ON core_recipe REFERENCING OLD TABLE AS old_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stat_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_stat_insert ON core_recipe;
+DROP TRIGGER core_recipe_stat_update ON core_recipe;
+DROP TRIGGER core_recipe_stat_delete ON core_recipe;
+DROP FUNCTION core_recipe_stat_update();
+"""
+
+# Runs after the triggers exist, which hold off recipe writes until the
+# migration commits
+BACKFILL = """
+INSERT INTO core_recipestat (user_id, field, value, recipes)
+SELECT user_id, 'price', (price * 100)::int, count(*)
+FROM core_recipe GROUP BY 1, 3
+UNION ALL
+SELECT user_id, 'time_minutes', time_minutes, count(*)
+FROM core_recipe GROUP BY 1, 3;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('price', 'Price (cents)'), ('time_minutes', 'Time (minutes)')], max_length=20)),
+                ('value', models.IntegerField()),
+                ('recipes', models.PositiveIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recipestat',
+            constraint=models.UniqueConstraint(fields=('user', 'field', 'value'), name='unique_recipe_stat_value'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
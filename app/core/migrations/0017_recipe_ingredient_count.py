@@ -0,0 +1,66 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+# Keeps Recipe.ingredient_count in sync with core_recipe_ingredients, with
+# one aggregated UPDATE per statement like the recipe_count triggers (0015)
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_ingredient_count_update() RETURNS trigger AS $$
+DECLARE
+    links text := CASE TG_OP WHEN 'INSERT' THEN 'new_links' ELSE 'old_links' END;
+    delta int := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    EXECUTE format(
+        'SELECT 1 FROM core_recipe WHERE id IN (SELECT recipe_id FROM %1$I) '
+        'ORDER BY id FOR UPDATE',
+        links
+    );
+    EXECUTE format(
+        'UPDATE core_recipe r SET ingredient_count = r.ingredient_count + d.n '
+        'FROM (SELECT recipe_id, count(*) * %2$s AS n FROM %1$I GROUP BY 1) d '
+        'WHERE r.id = d.recipe_id',
+        links, delta
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_ingredients_ingredient_count_insert
+    AFTER INSERT ON core_recipe_ingredients REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_ingredient_count_update();
+CREATE TRIGGER core_recipe_ingredients_ingredient_count_delete
+    AFTER DELETE ON core_recipe_ingredients REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_ingredient_count_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_ingredients_ingredient_count_insert ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_ingredient_count_delete ON core_recipe_ingredients;
+DROP FUNCTION core_recipe_ingredient_count_update();
+"""
+
+# Runs after the triggers exist, which hold off link writes until the
+# migration commits
+BACKFILL = """
+UPDATE core_recipe r SET ingredient_count = l.n
+FROM (SELECT recipe_id, count(*) AS n FROM core_recipe_ingredients GROUP BY 1) l
+WHERE r.id = l.recipe_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recipe_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:47
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+# MinHash signature and LSH band keys of a recipe's tags and ingredients,
+# must match recipe.similarity: 30 hash functions (a * x + b) % (2^31 - 1),
+# tags hashed as 2 * id and ingredients as 2 * id + 1, 10 bands of 3
+FUNCTIONS = """
+CREATE FUNCTION core_recipe_minhash(recipe bigint) RETURNS bigint[] AS $$
+    SELECT coalesce(array_agg(value ORDER BY i), '{}') FROM (
+        SELECT h.i, min((h.a * e.x + h.b) % 2147483647) AS value
+        FROM (
+            SELECT tag_id * 2 AS x FROM core_recipe_tags
+            WHERE recipe_id = recipe
+            UNION ALL
+            SELECT ingredient_id * 2 + 1 FROM core_recipe_ingredients
+            WHERE recipe_id = recipe
+        ) e, (
+            SELECT i, i * 2654435761 % 2147483647 AS a,
+                i * 2246822519 % 2147483647 AS b
+            FROM generate_series(1, 30) AS i
+        ) h
+        GROUP BY h.i
+    ) m
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION core_recipe_similarity_bands(minhash bigint[])
+RETURNS bigint[] AS $$
+    SELECT coalesce(array_agg((band::bigint << 31) + (((
+        (band + 1) * 1000003 + minhash[band * 3 + 1]) % 2147483647
+        * 1000003 + minhash[band * 3 + 2]) % 2147483647
+        * 1000003 + minhash[band * 3 + 3]) % 2147483647
+        ORDER BY band), '{}')
+    FROM generate_series(0, 9) AS band
+    WHERE cardinality(minhash) = 30
+$$ LANGUAGE sql IMMUTABLE;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION core_recipe_similarity_bands(bigint[]);
+DROP FUNCTION core_recipe_minhash(bigint);
+"""
+
+# Recomputes the signatures of the recipes whose links a statement changed,
+# locking them in id order like the ingredient_count triggers (0017)
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_similarity_update() RETURNS trigger AS $$
+DECLARE
+    links text := CASE TG_OP WHEN 'INSERT' THEN 'new_links' ELSE 'old_links' END;
+BEGIN
+    EXECUTE format(
+        'SELECT 1 FROM core_recipe WHERE id IN (SELECT recipe_id FROM %1$I) '
+        'ORDER BY id FOR UPDATE',
+        links
+    );
+    EXECUTE format(
+        'UPDATE core_recipe r SET minhash = s.minhash, '
+        'similarity_bands = core_recipe_similarity_bands(s.minhash) '
+        'FROM (SELECT recipe_id, core_recipe_minhash(recipe_id) AS minhash '
+        'FROM (SELECT DISTINCT recipe_id FROM %1$I) l) s '
+        'WHERE r.id = s.recipe_id AND r.minhash <> s.minhash',
+        links
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_similarity_insert
+    AFTER INSERT ON core_recipe_tags REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_similarity_update();
+CREATE TRIGGER core_recipe_tags_similarity_delete
+    AFTER DELETE ON core_recipe_tags REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_similarity_update();
+CREATE TRIGGER core_recipe_ingredients_similarity_insert
+    AFTER INSERT ON core_recipe_ingredients REFERENCING NEW TABLE AS new_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_similarity_update();
+CREATE TRIGGER core_recipe_ingredients_similarity_delete
+    AFTER DELETE ON core_recipe_ingredients REFERENCING OLD TABLE AS old_links
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_similarity_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_tags_similarity_insert ON core_recipe_tags;
+DROP TRIGGER core_recipe_tags_similarity_delete ON core_recipe_tags;
+DROP TRIGGER core_recipe_ingredients_similarity_insert ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_similarity_delete ON core_recipe_ingredients;
+DROP FUNCTION core_recipe_similarity_update();
+"""
+
+# Runs after the triggers exist, which hold off link writes until the
+# migration commits
+BACKFILL = """
+UPDATE core_recipe r SET minhash = s.minhash,
+    similarity_bands = core_recipe_similarity_bands(s.minhash)
+FROM (SELECT id, core_recipe_minhash(id) AS minhash FROM core_recipe) s
+WHERE r.id = s.id AND s.minhash <> '{}';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_ingredient_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='similarity_bands',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None),
+        ),
+        migrations.RunSQL(FUNCTIONS, DROP_FUNCTIONS),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['similarity_bands'], name='recipe_similarity_bands_idx'),
+        ),
+    ]
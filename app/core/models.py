@@ -4,7 +4,12 @@ import uuid
 import os
 
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -22,6 +27,17 @@ def recipe_image_file_path(instance, filename):
     return os.path.join("uploads", "recipe", filename)
 
 
+IMAGE_STATUS_CHOICES = [
+    ("pending", "Pending"),
+    ("ready", "Ready"),
+    ("failed", "Failed"),
+]
+
+
+# Upper bounds of the QueryStat histogram buckets, doubling from 0.1ms
+QUERY_STAT_BUCKETS_MS = [0.1 * 2 ** i for i in range(20)] + [float("inf")]
+
+
 class UserManager(BaseUserManager):
     # Manager for Users
 
@@ -52,13 +68,36 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped with every change to the user's recipe data (recipe.cache)
+    cache_generation = models.BigIntegerField(default=0)
+    # Last API write, reads stay on the primary shortly after (core.routers)
+    last_write_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()  # How to connect a Model Manager to a model
 
     USERNAME_FIELD = 'email'
 
 
-class Recipe(models.Model):  # models.Model is base Model Class
+class TriggerFieldsMixin:
+    """Never write trigger_fields when saving an existing row
+
+    These columns are kept up to date by database triggers, so the values
+    loaded with the row may already be stale and saving them back would
+    undo concurrent changes.
+    """
+    trigger_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.trigger_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Recipe(TriggerFieldsMixin, models.Model):  # Model is the base class
     """Recipe Object."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,  # Connect User Model to Recipe Model
@@ -72,30 +111,203 @@ class Recipe(models.Model):  # models.Model is base Model Class
     tags = models.ManyToManyField("Tag")  # Multiple Tags connected to Recipe
     ingredients = models.ManyToManyField("Ingredient")
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Resized copies of image, built in the background (recipe.images)
+    image_status = models.CharField(
+        max_length=10, blank=True, choices=IMAGE_STATUS_CHOICES
+    )
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Weighted title (A) + description (B) tsvector, kept up to date by a
+    # database trigger (migration 0010) so never written from Python
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Number of linked ingredients, kept up to date by triggers on the link
+    # table (migration 0017) for pantry matching (recipe.pantry)
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+    # MinHash signature of the tags and ingredients and its LSH band keys,
+    # kept up to date by triggers on the link tables (migration 0018) for
+    # similar recipe lookups (recipe.similarity)
+    minhash = ArrayField(
+        models.BigIntegerField(), default=list, editable=False
+    )
+    similarity_bands = ArrayField(
+        models.BigIntegerField(), default=list, editable=False
+    )
+
+    trigger_fields = (
+        "search_vector", "ingredient_count", "minhash", "similarity_bands",
+    )
+
+    class Meta:
+        indexes = [
+            # Serves the per-user, newest first recipe list and its cursor
+            models.Index(
+                fields=["user", "-id"], name="recipe_user_id_desc_idx"
+            ),
+            # Serve ?ordering= by time or price in either direction, and
+            # the matching range filters
+            models.Index(
+                fields=["user", "time_minutes", "id"],
+                name="recipe_user_time_idx",
+            ),
+            models.Index(
+                fields=["user", "price", "id"], name="recipe_user_price_idx"
+            ),
+            GinIndex(
+                fields=["search_vector"], name="recipe_search_vector_idx"
+            ),
+            GinIndex(
+                fields=["similarity_bands"],
+                name="recipe_similarity_bands_idx",
+            ),
+        ]
 
     def __str__(self):  # String Representation of recipe (to_string in java)
         return self.title
 
 
-class Tag(models.Model):
+class Tag(TriggerFieldsMixin, models.Model):
     """Tag Model"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
     name = models.CharField(max_length=255)
+    # Recipes linked to the tag, maintained by a database trigger
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    trigger_fields = ("recipe_count",)
+
+    class Meta:
+        constraints = [
+            # Lets recipe writes insert tags with ON CONFLICT DO NOTHING
+            models.UniqueConstraint(
+                fields=["user", "name"], name="unique_tag_name_per_user"
+            ),
+        ]
+        indexes = [
+            # Serves the most used first list (?ordering=popular)
+            models.Index(
+                fields=["user", "-recipe_count", "-name"],
+                name="tag_user_popular_idx",
+            ),
+            # Serves case-insensitive name prefix lookups (?q=)
+            models.Index(
+                F("user"), OpClass(Upper("name"), name="text_pattern_ops"),
+                name="tag_user_prefix_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(TriggerFieldsMixin, models.Model):
     """Ingredient Model"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
     name = models.CharField(max_length=255)
+    # Recipes using the ingredient, maintained by a database trigger
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    trigger_fields = ("recipe_count",)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "name"],
+                name="unique_ingredient_name_per_user",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-recipe_count", "-name"],
+                name="ingredient_user_popular_idx",
+            ),
+            # Serves case-insensitive name prefix lookups (?q=)
+            models.Index(
+                F("user"), OpClass(Upper("name"), name="text_pattern_ops"),
+                name="ingredient_user_prefix_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+RECIPE_STAT_FIELD_CHOICES = [
+    ("price", "Price (cents)"),
+    ("time_minutes", "Time (minutes)"),
+]
+
+
+class RecipeStat(models.Model):
+    """Number of a user's recipes with one price or time_minutes value
+
+    A summary of core_recipe kept up to date by database triggers
+    (migration 0016), read by the recipe stats endpoint (recipe.stats).
+    Rows are removed when their count drops to zero.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    field = models.CharField(max_length=20, choices=RECIPE_STAT_FIELD_CHOICES)
+    value = models.IntegerField()  # Price in cents or minutes
+    recipes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # Upserted by the triggers with ON CONFLICT
+            models.UniqueConstraint(
+                fields=["user", "field", "value"],
+                name="unique_recipe_stat_value",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.field}={self.value}: {self.recipes}"
+
+
+class QueryStat(models.Model):
+    """Aggregated timings of one SQL fingerprint issued by one view
+
+    Rows are upserted by every worker process (core.querystats), so the
+    numbers cover the whole deployment. Timings are kept as a histogram
+    with QUERY_STAT_BUCKETS_MS upper bounds to estimate percentiles.
+    """
+    fingerprint = models.CharField(max_length=32)  # md5 of sql
+    view = models.CharField(max_length=255)
+    sql = models.TextField()
+    count = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    # Most times the query ran while handling a single request (N+1 hint)
+    max_per_request = models.IntegerField(default=0)
+    histogram = ArrayField(models.BigIntegerField(), default=list)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fingerprint", "view"],
+                name="unique_query_stat_per_view",
+            ),
+        ]
+
+    def __str__(self):
+        return self.sql
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+    @property
+    def p95_ms(self):
+        """Upper bound of the histogram bucket holding the 95th percentile"""
+        target = self.count * 0.95
+        seen = 0
+        for bound, count in zip(QUERY_STAT_BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return QUERY_STAT_BUCKETS_MS[-1]
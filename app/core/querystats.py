@@ -0,0 +1,160 @@
+"""
+Aggregated SQL statistics per query fingerprint and view
+
+With QUERY_STATS on, QueryStatsMiddleware records every query a request
+runs. Queries are reduced to fingerprints (literals, placeholders and IN
+lists stripped) and counted per request, then merged into a buffer in the
+worker process. Every QUERY_STATS_FLUSH_INTERVAL seconds the buffer is
+added to the QueryStat table with one upsert, so all uWSGI workers share
+the same totals, which staff can browse in the Django admin.
+"""
+import bisect
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection, connections
+
+from core.models import QueryStat, QUERY_STAT_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # String literals
+    (re.compile(r"%s|\b\d+(?:\.\d+)?\b"), "?"),  # Placeholders and numbers
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),  # IN (?, ?, ...)
+    (re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+"), "(?+)+"),  # Multi-row
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Return (md5, normalized sql) with literals replaced by ?"""
+    for pattern, replacement in _NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    sql = sql.strip()
+    return hashlib.md5(sql.encode()).hexdigest(), sql
+
+
+def bucket(duration_ms):
+    """Return the histogram bucket index for a duration"""
+    return bisect.bisect_left(QUERY_STAT_BUCKETS_MS, duration_ms)
+
+
+class QueryStatsBuffer:
+    """Per process totals waiting to be flushed to QueryStat"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # (fingerprint, view): [sql, count, ms, max, hist]
+        self.last_flush = time.monotonic()
+
+    def add(self, view, request_stats):
+        """Merge the per fingerprint stats of one request"""
+        with self.lock:
+            for key, (sql, count, total_ms, histogram) in (
+                request_stats.items()
+            ):
+                stat = self.stats.get((key, view))
+                if stat is None:
+                    stat = self.stats[(key, view)] = [
+                        sql, 0, 0.0, 0, [0] * len(QUERY_STAT_BUCKETS_MS),
+                    ]
+                stat[1] += count
+                stat[2] += total_ms
+                stat[3] = max(stat[3], count)
+                for index, value in histogram.items():
+                    stat[4][index] += value
+
+    def due(self):
+        interval = settings.QUERY_STATS_FLUSH_INTERVAL
+        return time.monotonic() - self.last_flush >= interval
+
+    def flush(self):
+        """Add the buffered totals to the QueryStat table"""
+        with self.lock:
+            stats, self.stats = self.stats, {}
+            self.last_flush = time.monotonic()
+        if not stats:
+            return
+
+        table = QueryStat._meta.db_table
+        rows = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, now())"] * len(stats))
+        params = []
+        for (key, view), (sql, count, total_ms, most, histogram) in sorted(
+            stats.items()
+        ):
+            params += [key, view, sql, count, total_ms, most, histogram]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} AS s (fingerprint, view, sql, count, "
+                "total_ms, max_per_request, histogram, last_seen) "
+                f"VALUES {rows} "
+                "ON CONFLICT (fingerprint, view) DO UPDATE SET "
+                "count = s.count + EXCLUDED.count, "
+                "total_ms = s.total_ms + EXCLUDED.total_ms, "
+                "max_per_request = GREATEST("
+                "s.max_per_request, EXCLUDED.max_per_request), "
+                "histogram = ARRAY(SELECT coalesce(a, 0) + coalesce(b, 0) "
+                "FROM unnest(s.histogram, EXCLUDED.histogram) AS h(a, b)), "
+                "last_seen = EXCLUDED.last_seen",
+                params,
+            )
+
+
+buffer = QueryStatsBuffer()
+
+
+class RequestQueries:
+    """execute_wrapper collecting the queries of one request"""
+
+    def __init__(self):
+        self.stats = {}  # fingerprint: [sql, count, ms, {bucket: count}]
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            key, normalized = fingerprint(sql)
+            stat = self.stats.get(key)
+            if stat is None:
+                stat = self.stats[key] = [normalized, 0, 0.0, {}]
+            stat[1] += 1
+            stat[2] += duration_ms
+            index = bucket(duration_ms)
+            stat[3][index] = stat[3].get(index, 0) + 1
+
+
+class QueryStatsMiddleware:
+    """Record the queries of every request by fingerprint and view"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = RequestQueries()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(queries))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        if queries.stats and match is not None:
+            buffer.add(f"{request.method} {match.view_name}", queries.stats)
+        if buffer.due():
+            try:
+                buffer.flush()
+            except DatabaseError:  # Statistics must never fail a request
+                logger.exception("Flushing query statistics failed")
+        return response
@@ -0,0 +1,118 @@
+"""
+Read replica routing with read-your-writes stickiness
+
+Views using ReplicaReadsMixin serve safe (GET/HEAD/OPTIONS) requests from
+one of settings.DATABASE_REPLICAS, picked once per request so every query
+sees the same snapshot. Everything else, including writes, transactions and
+migrations, stays on "default".
+
+Replicas lag behind the primary, so a user whose last write was less than
+DB_REPLICA_PIN_SECONDS ago is served from the primary until the replicas
+have caught up. The time of the last write is kept on the user row, where
+every worker can see it.
+"""
+import contextvars
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = "default"
+
+# Replica alias reads of the current request go to, None for the primary
+_replica = contextvars.ContextVar("replica", default=None)
+
+
+def choose_replica():
+    """Return the replica alias to serve a request from"""
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def record_write(user_id):
+    """Pin the user to the primary for the next DB_REPLICA_PIN_SECONDS"""
+    get_user_model().objects.using(PRIMARY).filter(pk=user_id).update(
+        last_write_at=Now()
+    )
+
+
+def recently_wrote(user_id):
+    """Return whether the user wrote within the pin window"""
+    since = timezone.now() - timedelta(seconds=settings.DB_REPLICA_PIN_SECONDS)
+    return get_user_model().objects.using(PRIMARY).filter(
+        pk=user_id, last_write_at__gte=since
+    ).exists()
+
+
+class PrimaryReplicaRouter:
+    """Send reads to the request's replica, if any, and the rest to primary"""
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaReadsMixin:
+    """Serve safe requests from a replica unless the user wrote recently"""
+
+    # Actions that only read despite an unsafe method (e.g. a POSTed query)
+    read_actions = ()
+
+    def is_read(self, request):
+        """Return whether the request only reads"""
+        return (
+            request.method in SAFE_METHODS
+            or getattr(self, "action", None) in self.read_actions
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # Authenticates
+        self._replica_token = None
+        if (
+            settings.DATABASE_REPLICAS
+            and self.is_read(request)
+            and request.user.is_authenticated
+            and not recently_wrote(request.user.pk)
+        ):
+            self._replica_token = _replica.set(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            alias = _replica.get()
+            _replica.reset(token)
+            self._replica_token = None
+            if response.streaming:  # Body is read after the view returns
+                response.streaming_content = self._stream_from(
+                    alias, response.streaming_content
+                )
+        elif (
+            settings.DATABASE_REPLICAS
+            and not self.is_read(request)
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            record_write(request.user.pk)
+        return response
+
+    def _stream_from(self, alias, content):
+        """Read from the replica while the streamed body is produced"""
+        token = _replica.set(alias)
+        try:
+            yield from content
+        finally:
+            _replica.reset(token)
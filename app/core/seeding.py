@@ -0,0 +1,293 @@
+"""
+Reproducible synthetic datasets for benchmarks
+
+The same arguments and seed always build the same users, recipes, tags,
+ingredients and links. Recipes are spread over users with a long tail
+(a few users own most of them) and each recipe gets a random number of the
+owner's tags and ingredients within the configured ranges.
+
+seed_dataset writes through the ORM and suits benchmark sized data. For
+millions of rows, the seed_data command reserves id ranges up front and
+streams rows with COPY from several processes (copy_owners/copy_recipes).
+"""
+import io
+import itertools
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import similarity
+
+# Password of every seeded user
+SEED_PASSWORD = "benchmark-pass"
+
+WORDS = [
+    "spicy", "chicken", "curry", "tomato", "soup", "roast", "garlic",
+    "lemon", "pasta", "salad", "beef", "stew", "grilled", "salmon",
+    "vegan", "chocolate", "cake", "mushroom", "risotto", "ginger",
+    "noodles", "honey", "baked", "potato", "pie", "fresh", "herb",
+    "bread", "smoky", "bean", "chili", "coconut", "rice", "pork",
+]
+
+
+def seed_email(index):
+    """Return the email of the index-th seeded user"""
+    return f"seed-user-{index}@example.com"
+
+
+def _phrase(rng, words):
+    """Return a phrase of random words"""
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _sample(rng, population, size_range):
+    """Return a random sample with a size drawn from size_range"""
+    size = min(rng.randint(*size_range), len(population))
+    return rng.sample(population, size)
+
+
+def seed_dataset(users=10, recipes=1000, tags_per_user=30,
+                 ingredients_per_user=100, tags_per_recipe=(0, 5),
+                 ingredients_per_recipe=(2, 12), seed=0, batch_size=5000):
+    """Create a synthetic dataset and return the seeded user ids
+
+    Rows are written with multi-row INSERTs of batch_size rows.
+    """
+    rng = random.Random(seed)
+    password = make_password(SEED_PASSWORD)
+
+    with transaction.atomic():
+        user_ids = [
+            user.id for user in get_user_model().objects.bulk_create([
+                get_user_model()(
+                    email=seed_email(i), name=f"Seed User {i}",
+                    password=password,
+                )
+                for i in range(users)
+            ], batch_size=batch_size)
+        ]
+        tag_ids, ingredient_ids = {}, {}
+        for model, per_user, ids in (
+            (Tag, tags_per_user, tag_ids),
+            (Ingredient, ingredients_per_user, ingredient_ids),
+        ):
+            objs = model.objects.bulk_create([
+                model(user_id=user_id, name=f"{model.__name__} {i}")
+                for user_id in user_ids for i in range(per_user)
+            ], batch_size=batch_size)
+            for obj in objs:
+                ids.setdefault(obj.user_id, []).append(obj.id)
+
+    # Long tail: the n-th user owns about 1/n as many recipes as the first
+    owners = rng.choices(
+        user_ids, weights=[1 / rank for rank in range(1, users + 1)],
+        k=recipes,
+    )
+    tag_links = Recipe.tags.through
+    ingredient_links = Recipe.ingredients.through
+    for start in range(0, recipes, batch_size):
+        with transaction.atomic():
+            objs = Recipe.objects.bulk_create([
+                Recipe(
+                    user_id=user_id,
+                    title=_phrase(rng, 3).capitalize(),
+                    description=_phrase(rng, 12),
+                    time_minutes=rng.randint(5, 240),
+                    price=Decimal(rng.randint(100, 5000)) / 100,
+                    link=f"https://example.com/recipe/{start + i}",
+                )
+                for i, user_id in enumerate(owners[start:start + batch_size])
+            ])
+            tag_links.objects.bulk_create([
+                tag_links(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe in objs
+                for tag_id in _sample(
+                    rng, tag_ids.get(recipe.user_id, []), tags_per_recipe
+                )
+            ], batch_size=batch_size)
+            ingredient_links.objects.bulk_create([
+                ingredient_links(recipe_id=recipe.id, ingredient_id=obj_id)
+                for recipe in objs
+                for obj_id in _sample(
+                    rng, ingredient_ids.get(recipe.user_id, []),
+                    ingredients_per_recipe,
+                )
+            ], batch_size=batch_size)
+    return user_ids
+
+
+# Bulk loading with COPY for staging-sized datasets (seed_data command)
+
+def zipf_cum_weights(size, exponent):
+    """Return cumulative Zipf weights, item n is 1/n**exponent as likely"""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def _pick(rng, size_range, count, cum_weights):
+    """Return distinct offsets into a list of count items
+
+    Offsets are drawn with cum_weights, or uniformly when it is None.
+    """
+    size = min(rng.randint(*size_range), count)
+    if cum_weights is None:
+        return rng.sample(range(count), size)
+    picked = set()
+    while len(picked) < size:
+        picked.update(
+            rng.choices(range(count), cum_weights=cum_weights, k=size)
+        )
+    return list(picked)[:size]
+
+
+def _array(values):
+    """Return a Postgres array literal for COPY"""
+    return "{" + ",".join(map(str, values)) + "}"
+
+
+def copy_rows(cursor, model, columns, rows):
+    """COPY rows of already formatted values into the model's table
+
+    Values must not contain tabs, newlines or backslashes; None is NULL.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(
+            "\\N" if value is None else str(value) for value in row
+        ))
+        buffer.write("\n")
+    buffer.seek(0)
+    column_names = ", ".join(
+        connection.ops.quote_name(model._meta.get_field(name).column)
+        for name in columns
+    )
+    cursor.copy_expert(
+        f"COPY {connection.ops.quote_name(model._meta.db_table)} "
+        f"({column_names}) FROM STDIN",
+        buffer,
+    )
+
+
+def reserve_ids(model, count):
+    """Take count ids from the model's sequence and return the first one"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table]
+        )
+        first = cursor.fetchone()[0]
+        if count > 1:
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                [table, first + count - 1],
+            )
+    return first
+
+
+def copy_owners(plan):
+    """COPY the plan's users and their tags/ingredients"""
+    users, first_user = plan["users"], plan["first_user"]
+    password = make_password(SEED_PASSWORD)
+    with transaction.atomic(), connection.cursor() as cursor:
+        copy_rows(cursor, get_user_model(), (
+            "id", "password", "is_superuser", "email", "name", "is_active",
+            "is_staff", "cache_generation",
+        ), (
+            (user_id, password, "f", f"seed-{user_id}@example.com",
+             f"Seed User {user_id}", "t", "f", 0)
+            for user_id in range(first_user, first_user + users)
+        ))
+        for model, per_user, first in (
+            (Tag, plan["tags_per_user"], plan["first_tag"]),
+            (Ingredient, plan["ingredients_per_user"],
+             plan["first_ingredient"]),
+        ):
+            copy_rows(cursor, model, ("id", "user", "name", "recipe_count"), (
+                (first + k * per_user + j, first_user + k,
+                 f"{model.__name__} {j}", 0)
+                for k in range(users) for j in range(per_user)
+            ))
+
+
+def copy_recipes(plan, part, first_id, count):
+    """COPY count recipes from first_id with their links
+
+    Runs in a worker process; the random stream only depends on the plan
+    seed and part, so the same plan always loads the same data. Returns
+    the number of (recipes, tag links, ingredient links) written.
+    """
+    rng = random.Random(plan["seed"] * 100003 + part)
+    users = plan["users"]
+    owner_weights = plan["owner_cum_weights"]
+    tag_weights = plan["tag_cum_weights"]
+    ingredient_weights = plan["ingredient_cum_weights"]
+    tag_links = Recipe.tags.through
+    ingredient_links = Recipe.ingredients.through
+    written = [0, 0, 0]
+
+    for start in range(first_id, first_id + count, plan["batch_size"]):
+        stop = min(start + plan["batch_size"], first_id + count)
+        if owner_weights is None:
+            owners = [rng.randrange(users) for _ in range(start, stop)]
+        else:
+            owners = rng.choices(
+                range(users), cum_weights=owner_weights, k=stop - start
+            )
+        recipes, tag_rows, ingredient_rows = [], [], []
+        for recipe_id, owner in zip(range(start, stop), owners):
+            recipe = [
+                recipe_id, plan["first_user"] + owner,
+                _phrase(rng, 3).capitalize(), _phrase(rng, 12),
+                rng.randint(5, 240), f"{rng.randint(100, 5000) / 100:.2f}",
+                f"https://example.com/recipe/{recipe_id}", None, "", "{}",
+            ]
+            first_tag = plan["first_tag"] + owner * plan["tags_per_user"]
+            tag_ids = [
+                first_tag + offset
+                for offset in _pick(
+                    rng, plan["tags_per_recipe"], plan["tags_per_user"],
+                    tag_weights,
+                )
+            ]
+            tag_rows.extend((recipe_id, tag_id) for tag_id in tag_ids)
+            first_ingredient = (
+                plan["first_ingredient"]
+                + owner * plan["ingredients_per_user"]
+            )
+            ingredient_ids = [
+                first_ingredient + offset
+                for offset in _pick(
+                    rng, plan["ingredients_per_recipe"],
+                    plan["ingredients_per_user"], ingredient_weights,
+                )
+            ]
+            ingredient_rows.extend(
+                (recipe_id, ingredient_id) for ingredient_id in ingredient_ids
+            )
+            # Written directly, seed_data disables the triggers keeping them
+            minhash = similarity.signature(tag_ids, ingredient_ids)
+            recipe.extend((
+                len(ingredient_ids), _array(minhash),
+                _array(similarity.bands(minhash)),
+            ))
+            recipes.append(recipe)
+        with transaction.atomic(), connection.cursor() as cursor:
+            copy_rows(cursor, Recipe, (
+                "id", "user", "title", "description", "time_minutes",
+                "price", "link", "image", "image_status", "image_variants",
+                "ingredient_count", "minhash", "similarity_bands",
+            ), recipes)
+            copy_rows(cursor, tag_links, ("recipe", "tag"), tag_rows)
+            copy_rows(
+                cursor, ingredient_links, ("recipe", "ingredient"),
+                ingredient_rows,
+            )
+        written[0] += len(recipes)
+        written[1] += len(tag_rows)
+        written[2] += len(ingredient_rows)
+    return tuple(written)
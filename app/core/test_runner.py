@@ -0,0 +1,25 @@
+"""
+Test runner for the project
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class PrimaryOnlyTestRunner(DiscoverRunner):
+    """Run tests with reads on the primary, whatever DB_REPLICAS says
+
+    TestCase only allows queries on the databases it declares, so routing
+    every safe request to a replica would break tests unrelated to it.
+    Replica aliases stay in DATABASES (mirroring "default"); tests of the
+    routing opt in with override_settings(DATABASE_REPLICAS=[...]) and by
+    declaring the replica in their databases.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._primary_only = override_settings(DATABASE_REPLICAS=[])
+        self._primary_only.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._primary_only.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,119 @@
+"""
+Tests for the thread pool ASGI handler
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.asgi import ASGIHandler
+from core.db.backends.postgresql.base import connection_stats
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class ASGIHandlerTests(TransactionTestCase):
+    """Test serving the API through the ASGI handler"""
+
+    def setUp(self):
+        # One request thread, closed after each test
+        self.executor = ThreadPoolExecutor(1)
+        patcher = patch("core.asgi._executor", self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(
+            lambda: self.executor.submit(connections.close_all).result()
+        )
+
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.token = Token.objects.create(user=self.user)
+        for i in range(3):
+            Recipe.objects.create(
+                user=self.user, title=f"Recipe {i}", time_minutes=5,
+                price=Decimal("2.50"),
+            )
+
+    def request(self, method, path, body=b"", content_type=None):
+        """Send a request through ASGIHandler, return (status, body)"""
+        headers = [
+            (b"host", b"testserver"),
+            (b"authorization", f"Token {self.token.key}".encode()),
+        ]
+        if content_type:
+            headers.append((b"content-type", content_type.encode()))
+            headers.append((b"content-length", str(len(body)).encode()))
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query.encode(),
+            "headers": headers,
+        }
+
+        async def run():
+            communicator = ApplicationCommunicator(ASGIHandler(), scope)
+            await communicator.send_input({
+                "type": "http.request", "body": body,
+            })
+            start = await communicator.receive_output(5)
+            chunks = []
+            while True:
+                message = await communicator.receive_output(5)
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            await communicator.wait(5)
+            return start["status"], b"".join(chunks)
+
+        return async_to_sync(run)()
+
+    def test_list(self):
+        """Test views run and read the database"""
+        status, body = self.request("GET", RECIPES_URL)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)["results"]), 3)
+
+    def test_create(self):
+        """Test request bodies reach the view"""
+        status, _ = self.request(
+            "POST", RECIPES_URL,
+            json.dumps({
+                "title": "Soup", "time_minutes": 5, "price": "2.50",
+            }).encode(),
+            "application/json",
+        )
+
+        self.assertEqual(status, 201)
+        self.assertEqual(Recipe.objects.count(), 4)
+
+    def test_streaming_export(self):
+        """Test streamed bodies can query the database as they're sent"""
+        status, body = self.request(
+            "GET", reverse("recipe:recipe-export") + "?output=json"
+        )
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)), 3)
+
+    def test_connection_reused(self):
+        """Test request threads keep their connection between requests"""
+        self.request("GET", RECIPES_URL)
+        before = connection_stats()["connects"]
+        for _ in range(3):
+            self.request("GET", reverse("user:me"))
+
+        self.assertEqual(connection_stats()["connects"], before)
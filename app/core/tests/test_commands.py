@@ -1,13 +1,32 @@
 """
 Test custom Django management commands
 """
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
+from PIL import Image
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core.models import Recipe, RecipeStat, Tag
+from core.seeding import seed_dataset
+from recipe.images import IMAGE_VARIANTS, delete_variants
+from recipe.similarity import similarity_drift
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -31,3 +50,251 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkSerializersCommandTests(SimpleTestCase):
+    # Test the serializer benchmark command
+
+    def test_benchmark_serializers(self):
+        # Benchmark runs on small sizes and reports each one
+        out = StringIO()
+        call_command(
+            "benchmark_serializers", sizes="5,20", repeat=1, stdout=out
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].strip().startswith("20 "))
+
+
+class SeedDatasetTests(TestCase):
+    # Test the synthetic dataset generator
+
+    def test_seed_is_reproducible(self):
+        # The same seed gives the same recipes and links
+        def snapshot():
+            return [
+                (r.title, r.time_minutes, r.price, r.tags.count(),
+                 r.ingredients.count())
+                for r in Recipe.objects.order_by("id")
+            ]
+
+        seed_dataset(users=3, recipes=30, seed=7, batch_size=8)
+        first = snapshot()
+        Recipe.objects.all().delete()
+        get_user_model().objects.all().delete()
+        seed_dataset(users=3, recipes=30, seed=7, batch_size=8)
+
+        self.assertEqual(len(first), 30)
+        self.assertEqual(snapshot(), first)
+
+
+@patch("core.management.commands.benchmark_api.Command.teardown_database")
+@patch("core.management.commands.benchmark_api.Command.setup_database")
+class BenchmarkApiCommandTests(TestCase):
+    # Test the API benchmark command on a tiny dataset
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command(
+            "benchmark_api", "--users=2", "--recipes=20", "--iterations=2",
+            "--warmup=0", "--only=recipe-list,recipe-retrieve,tag-list",
+            *args, stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_benchmark_reports_json(self, patched_setup, patched_teardown):
+        # Each scenario reports latency, query and memory figures
+        report = json.loads(self._run())
+
+        self.assertEqual(
+            set(report["results"]),
+            {"recipe-list", "recipe-retrieve", "tag-list"},
+        )
+        result = report["results"]["recipe-retrieve"]
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertEqual(result["queries"], 3)
+        self.assertGreater(result["peak_memory_kb"], 0)
+        patched_teardown.assert_called_once()
+
+    def test_benchmark_compare_flags_regression(self, patched_setup,
+                                                patched_teardown):
+        # Comparing against a better baseline fails the command
+        report = json.loads(self._run())
+        report["results"]["recipe-retrieve"]["queries"] = 1
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, "baseline.json")
+            with open(baseline, "w") as baseline_file:
+                json.dump(report, baseline_file)
+
+            with self.assertRaises(CommandError):
+                self._run(f"--compare={baseline}")
+
+
+class SeedDataCommandTests(TestCase):
+    # Test the COPY based seeding command
+
+    def test_seed_data(self):
+        # Rows are loaded within the configured ranges, indexes kept
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_indexes")
+            index_count = cursor.fetchone()[0]
+
+        call_command(
+            "seed_data", "--users=4", "--recipes=50", "--tags-per-user=6",
+            "--ingredients-per-user=10", "--tags-per-recipe=1-3",
+            "--ingredients-per-recipe=2", "--workers=1", "--batch-size=20",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 4)
+        self.assertEqual(Tag.objects.count(), 24)
+        recipes = Recipe.objects.prefetch_related("tags", "ingredients")
+        self.assertEqual(len(recipes), 50)
+        for recipe in recipes:
+            self.assertIn(len(recipe.tags.all()), (1, 2, 3))
+            self.assertEqual(len(recipe.ingredients.all()), 2)
+            self.assertTrue(all(
+                tag.user_id == recipe.user_id for tag in recipe.tags.all()
+            ))
+        self.assertFalse(
+            Recipe.objects.filter(search_vector__isnull=True).exists()
+        )
+        for tag in Tag.objects.annotate(links=Count("recipe")):
+            self.assertEqual(tag.recipe_count, tag.links)
+        # Signatures computed while loading match the database's
+        self.assertEqual(similarity_drift(), 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_indexes")
+            self.assertEqual(cursor.fetchone()[0], index_count)
+
+
+class RebuildRecipeStatsCommandTests(TestCase):
+    # Test checking and rebuilding the recipe summaries
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.tag = Tag.objects.create(user=user, name="Vegan")
+        for price in ["2.00", "3.00"]:
+            recipe = Recipe.objects.create(
+                user=user, title="Soup", time_minutes=10,
+                price=Decimal(price),
+            )
+            recipe.tags.add(self.tag)
+
+    def test_check_passes_when_in_sync(self):
+        # The triggers kept everything up to date
+        out = StringIO()
+        call_command("rebuild_recipe_stats", "--check", stdout=out)
+
+        self.assertIn("Recipe stats: 0 rows drifted", out.getvalue())
+
+    def test_rebuild_fixes_drift(self):
+        # Drift is reported by --check and repaired by a rebuild
+        RecipeStat.objects.filter(field="price").update(recipes=5)
+        Tag.objects.filter(id=self.tag.id).update(recipe_count=9)
+        Recipe.objects.update(minhash=[], similarity_bands=[])
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_recipe_stats", "--check", stdout=StringIO())
+        call_command("rebuild_recipe_stats", stdout=StringIO())
+
+        call_command("rebuild_recipe_stats", "--check", stdout=StringIO())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 2)
+        self.assertEqual(
+            RecipeStat.objects.filter(field="price").count(), 2
+        )
+        self.assertFalse(Recipe.objects.filter(minhash=[]).exists())
+
+
+class RequeueRecipeImagesCommandTests(TestCase):
+    # Test processing recipe images whose job was lost
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title="Soup", time_minutes=10, price=Decimal("2.00"),
+        )
+        image_file = BytesIO()
+        Image.new("RGB", (400, 300)).save(image_file, format="JPEG")
+        self.recipe.image.save("soup.jpg", ContentFile(image_file.getvalue()))
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image_status="pending"
+        )
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        delete_variants(self.recipe.image_variants)
+        self.recipe.image.delete(save=False)
+
+    def test_check_reports_pending(self):
+        # --check only counts, leaving the image pending
+        out = StringIO()
+        call_command("requeue_recipe_images", "--check", stdout=out)
+
+        self.assertIn("Pending recipe images: 1", out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, "pending")
+
+    def test_requeue_builds_variants(self):
+        # Pending images get their variants and become ready
+        out = StringIO()
+        call_command("requeue_recipe_images", stdout=out)
+
+        self.assertIn("Processed 1 images, 1 ready", out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, "ready")
+        self.assertEqual(
+            set(self.recipe.image_variants), set(IMAGE_VARIANTS)
+        )
+
+
+class BenchmarkConnectionsCommandTests(TransactionTestCase):
+    # Test the connection reuse benchmark
+
+    def test_benchmark_connections(self):
+        # Per request connections reconnect every time, persistent don't
+        out = StringIO()
+        call_command(
+            "benchmark_connections", requests=4, warmup=1, stdout=out
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split()[-1], "4")
+        self.assertEqual(lines[2].split()[-1], "0")
+
+
+@skipUnless(
+    shutil.which("uwsgi") and find_spec("uvicorn"),
+    "Needs uwsgi and uvicorn",
+)
+@patch("core.management.commands.benchmark_servers.Command.teardown_database")
+@patch("core.management.commands.benchmark_servers.Command.setup_database")
+class BenchmarkServersCommandTests(TransactionTestCase):
+    # Test the uWSGI/uvicorn load test on a tiny dataset
+
+    def test_benchmark_servers(self, patched_setup, patched_teardown):
+        # Both servers serve the requests without errors
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "servers.json")
+            call_command(
+                "benchmark_servers", "--users=2", "--recipes=10",
+                "--concurrency=4", "--duration=1", "--warmup=0",
+                "--workers=1", "--slow-fraction=0.2", f"--output={output}",
+                stdout=out, stderr=StringIO(),
+            )
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(set(report["results"]), {"uwsgi", "uvicorn"})
+        for result in report["results"].values():
+            self.assertEqual(result["errors"] + result["failed"], 0)
+            self.assertGreater(result["fast"]["p50_ms"], 0)
+            self.assertIn("slow", result)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
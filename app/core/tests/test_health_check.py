@@ -1,13 +1,18 @@
 """
 Tests for the health check api
 """
+from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
+from django.db import connections
 from django.test import TestCase
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.db.backends.postgresql.base import connection_stats
+
 
 class HealthCheckTests(TestCase):
     """Test the health check API."""
@@ -19,3 +24,77 @@ class HealthCheckTests(TestCase):
         res = client.get(url)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_health_check_pool_metrics_staff_only(self):
+        """Test staff can see connection and token cache metrics, others
+        can't"""
+        client = APIClient()
+        url = reverse("health-check")
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        client.force_authenticate(user)
+
+        res = client.get(url, {"verbose": 1})
+        self.assertNotIn("database", res.data)
+        self.assertNotIn("token_cache", res.data)
+
+        user.is_staff = True
+        res = client.get(url, {"verbose": 1})
+        database = res.data["database"]
+        self.assertIn("open", database["process"])
+        self.assertIn("conn_max_age", database)
+        self.assertIsInstance(database["server"], dict)
+        self.assertIn("hits", res.data["token_cache"])
+        self.assertIn("misses", res.data["token_cache"])
+
+
+class ConnectionHealthCheckTests(TestCase):
+    """Test reused connections are checked before use"""
+
+    def setUp(self):
+        # A separate connection, outside the test case's transaction
+        self.db = connections.create_connection("default")
+        self.db.settings_dict["CONN_HEALTH_CHECKS"] = True
+        self.db.ensure_connection()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _next_request(self):
+        """Simulate the request boundary where connections are reused"""
+        self.db.close_if_unusable_or_obsolete()
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    def test_broken_connection_replaced(self):
+        """Test a connection failing its check is reopened"""
+        before = connection_stats()
+        with patch.object(self.db, "is_usable", return_value=False):
+            self._next_request()
+        after = connection_stats()
+
+        self.assertEqual(after["health_check_failures"],
+                         before["health_check_failures"] + 1)
+        self.assertEqual(after["connects"], before["connects"] + 1)
+
+    def test_checked_once_per_request(self):
+        """Test only the first query of a request is preceded by a check"""
+        before = connection_stats()
+        self._next_request()
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        after = connection_stats()
+
+        self.assertEqual(after["health_checks"], before["health_checks"] + 1)
+        self.assertEqual(after["connects"], before["connects"])
+
+    def test_disabled(self):
+        """Test no checks run without CONN_HEALTH_CHECKS"""
+        self.db.settings_dict["CONN_HEALTH_CHECKS"] = False
+        before = connection_stats()
+        self._next_request()
+
+        self.assertEqual(
+            connection_stats()["health_checks"], before["health_checks"]
+        )
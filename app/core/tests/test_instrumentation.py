@@ -0,0 +1,111 @@
+"""
+Tests for the request timing middleware
+"""
+import json
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import instrumentation
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+EXPORT_URL = reverse("recipe:recipe-export")
+
+
+def metrics(header):
+    """Return {name: params} parsed from a Server-Timing header"""
+    parsed = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        parsed[name] = dict(param.split("=", 1) for param in params)
+    return parsed
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingMiddlewareTests(TestCase):
+    """Test Server-Timing headers and request log lines"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=5,
+            price=Decimal("2.50"),
+        )
+        # Middleware is loaded with the first request of each client
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test responses report db, view, serializer and render timings"""
+        res = self.client.get(RECIPES_URL)
+
+        timing = metrics(res["Server-Timing"])
+        self.assertEqual(
+            set(timing),
+            {"db", "view", "serialize", "render", "total", "bytes"},
+        )
+        self.assertTrue(timing["db"]["desc"].endswith(' queries"'))
+        self.assertEqual(timing["bytes"]["desc"], f'"{len(res.content)}"')
+        self.assertLessEqual(
+            float(timing["view"]["dur"]), float(timing["total"]["dur"])
+        )
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_disabled(self):
+        """Test the middleware removes itself when turned off"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn("Server-Timing", res)
+
+    @override_settings(REQUEST_TIMING_LOG=True)
+    def test_log_line(self):
+        """Test each request is logged as one JSON line"""
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            res = self.client.get(RECIPES_URL)
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["view"], "recipe:recipe-list")
+        self.assertEqual(entry["status"], 200)
+        self.assertEqual(entry["bytes"], len(res.content))
+        self.assertGreater(entry["queries"], 0)
+
+    @override_settings(REQUEST_TIMING_LOG=True)
+    def test_streaming_logged_when_sent(self):
+        """Test streamed responses are logged with their full size"""
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            res = self.client.get(EXPORT_URL)
+            self.assertNotIn("bytes", metrics(res["Server-Timing"]))
+            body = b"".join(res.streaming_content)
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["bytes"], len(body))
+
+
+class TimedTests(TestCase):
+    """Test the timed() helper"""
+
+    def test_nested_counted_once(self):
+        """Test nested blocks with the same name aren't double counted"""
+        timings = instrumentation.RequestTimings()
+        token = instrumentation._current.set(timings)
+        try:
+            with instrumentation.timed("serialize"):
+                with instrumentation.timed("serialize"):
+                    time.sleep(0.01)
+        finally:
+            instrumentation._current.reset(token)
+
+        self.assertLess(timings.durations["serialize"], 0.02)
+
+    def test_no_request(self):
+        """Test timed() does nothing outside a request"""
+        with instrumentation.timed("serialize"):
+            pass
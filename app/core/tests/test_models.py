@@ -2,6 +2,7 @@
 
 from unittest.mock import patch
 from decimal import Decimal
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -77,6 +78,16 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot have two tags with the same name"""
+        user = create_user()
+        other_user = create_user(email="other@example.com")
+        models.Tag.objects.create(user=user, name="Vegan")
+        models.Tag.objects.create(user=other_user, name="Vegan")
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name="Vegan")
+
     def test_create_ingredient(self):
         """Test creating an ingredient is successful"""
         user = create_user()
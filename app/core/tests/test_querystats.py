@@ -0,0 +1,150 @@
+"""
+Tests for the SQL statistics collector
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import querystats
+from core.models import QueryStat, Recipe, Tag
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class FingerprintTests(SimpleTestCase):
+    """Test SQL normalization"""
+
+    def test_literals_stripped(self):
+        """Test placeholders, numbers and strings become ?"""
+        key, sql = querystats.fingerprint(
+            "SELECT *  FROM t WHERE a = %s AND b = 'x''y' LIMIT 21"
+        )
+
+        self.assertEqual(sql, "SELECT * FROM t WHERE a = ? AND b = ? LIMIT ?")
+        self.assertEqual(len(key), 32)
+
+    def test_lists_collapsed(self):
+        """Test IN lists and multi-row VALUES of any length match"""
+        short = querystats.fingerprint("SELECT 1 FROM t WHERE id IN (%s)")
+        long = querystats.fingerprint(
+            "SELECT 1 FROM t WHERE id IN (%s, %s, %s)"
+        )
+        rows = querystats.fingerprint(
+            "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"
+        )
+
+        self.assertEqual(short, long)
+        self.assertEqual(rows[1], "INSERT INTO t (a, b) VALUES (?+)+")
+
+    def test_identifiers_kept(self):
+        """Test digits inside identifiers aren't treated as numbers"""
+        _, sql = querystats.fingerprint('SELECT "U0"."id" FROM t U0')
+
+        self.assertEqual(sql, 'SELECT "U0"."id" FROM t U0')
+
+
+@override_settings(QUERY_STATS=True, QUERY_STATS_FLUSH_INTERVAL=0)
+class QueryStatsMiddlewareTests(TestCase):
+    """Test queries are aggregated per fingerprint and view"""
+
+    def setUp(self):
+        querystats.buffer.stats.clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f"Recipe {i}", time_minutes=5,
+                price=Decimal("2.50"),
+            )
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f"Tag {i}")
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_requests_aggregated(self):
+        """Test repeated requests add up in one row per fingerprint"""
+        self.client.get(RECIPES_URL, {"tags": "1"})
+        self.client.get(RECIPES_URL, {"tags": "1,2,3"})
+
+        stats = QueryStat.objects.filter(view="GET recipe:recipe-list")
+        self.assertTrue(stats.exists())
+        for stat in stats:
+            self.assertEqual(stat.count % 2, 0)
+            self.assertEqual(sum(stat.histogram), stat.count)
+            self.assertGreaterEqual(stat.p95_ms, stat.mean_ms / 2)
+        self.assertNotIn("'", "".join(s.sql for s in stats))
+
+    def test_flushes_merge(self):
+        """Test flushes add up and keep the most runs in one request"""
+        sql = "SELECT ? FROM core_tag WHERE id = ?"
+        querystats.buffer.add("GET test", {"k" * 32: [sql, 3, 3.0, {1: 3}]})
+        querystats.buffer.flush()
+        querystats.buffer.add("GET test", {"k" * 32: [sql, 1, 5.0, {6: 1}]})
+        querystats.buffer.flush()
+
+        stat = QueryStat.objects.get(view="GET test")
+        self.assertEqual(stat.count, 4)
+        self.assertEqual(stat.total_ms, 8.0)
+        self.assertEqual(stat.max_per_request, 3)
+        self.assertEqual(stat.histogram[1], 3)
+        self.assertEqual(stat.histogram[6], 1)
+        self.assertEqual(stat.p95_ms, 6.4)
+
+
+class QueryStatAdminTests(TestCase):
+    """Test the query statistics admin page"""
+
+    def setUp(self):
+        self.stat = QueryStat.objects.create(
+            fingerprint="0" * 32, view="GET recipe:recipe-list",
+            sql="SELECT ? FROM core_recipe", count=4, total_ms=10,
+            histogram=[0, 4],
+        )
+        self.url = reverse("admin:core_querystat_changelist")
+
+    def test_staff_can_view(self):
+        """Test staff users see the statistics"""
+        staff = get_user_model().objects.create_user(
+            email="staff@example.com", password="testpass123",
+            is_staff=True,
+        )
+        client = Client()
+        client.force_login(staff)
+
+        res = client.get(self.url)
+
+        self.assertContains(res, "SELECT ? FROM core_recipe")
+
+    def test_staff_can_view_detail(self):
+        """Test staff users see a statistic's rounded total"""
+        staff = get_user_model().objects.create_user(
+            email="staff@example.com", password="testpass123",
+            is_staff=True,
+        )
+        client = Client()
+        client.force_login(staff)
+
+        res = client.get(reverse(
+            "admin:core_querystat_change", args=[self.stat.id]
+        ))
+
+        self.assertContains(res, "Total (ms)")
+        self.assertContains(res, "10.0")
+
+    def test_non_staff_denied(self):
+        """Test regular users are sent to the admin login"""
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        client = Client()
+        client.force_login(user)
+
+        res = client.get(self.url)
+
+        self.assertEqual(res.status_code, 302)
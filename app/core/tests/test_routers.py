@@ -0,0 +1,168 @@
+"""
+Tests for read replica routing
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+ME_URL = reverse("user:me")
+PANTRY_URL = reverse("recipe:recipe-pantry")
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {"title": "Soup", "time_minutes": 5, "price": Decimal("2.50")}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test the database router"""
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_default_to_primary(self):
+        """Test reads outside a replica request go to the primary"""
+        self.assertEqual(self.router.db_for_read(Recipe), "default")
+
+    def test_reads_follow_request_replica(self):
+        """Test reads go to the replica chosen for the request"""
+        token = routers._replica.set("replica1")
+        try:
+            self.assertEqual(self.router.db_for_read(Recipe), "replica1")
+            self.assertEqual(self.router.db_for_write(Recipe), "default")
+        finally:
+            routers._replica.reset(token)
+
+    def test_tests_read_from_primary(self):
+        """Test the test runner turns replica reads off by default"""
+        self.assertEqual(settings.DATABASE_REPLICAS, [])
+
+    def test_migrate_primary_only(self):
+        """Test migrations only run on the primary"""
+        self.assertTrue(self.router.allow_migrate("default", "core"))
+        self.assertFalse(self.router.allow_migrate("replica1", "core"))
+
+
+# Replica reads are pointed at "default" so every query has a database
+@override_settings(DATABASE_REPLICAS=["default"])
+@patch("core.routers.choose_replica", return_value="default")
+class ReplicaReadsMixinTests(TestCase):
+    """Test which requests are served from replicas"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_safe_requests_use_replica(self, patched_choose):
+        """Test recipe lists and profile fetches read from a replica"""
+        self.client.get(RECIPES_URL)
+        self.client.get(ME_URL)
+
+        self.assertEqual(patched_choose.call_count, 2)
+        self.assertIsNone(routers._replica.get())
+
+    def test_writes_pin_user_to_primary(self, patched_choose):
+        """Test a user's reads stay on the primary right after a write"""
+        self.client.post(RECIPES_URL, {
+            "title": "Soup", "time_minutes": 5, "price": "2.50",
+        })
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_write_at)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+        patched_choose.assert_not_called()
+
+    def test_read_actions_use_replica(self, patched_choose):
+        """Test POSTed queries read from a replica and don't pin the user"""
+        self.client.post(
+            PANTRY_URL, {"ingredients": [1]}, format="json"
+        )
+
+        patched_choose.assert_called_once()
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_write_at)
+
+    def test_pin_expires(self, patched_choose):
+        """Test reads return to replicas once the pin window has passed"""
+        self.user.last_write_at = timezone.now() - timedelta(
+            seconds=settings.DB_REPLICA_PIN_SECONDS + 1
+        )
+        self.user.save()
+
+        self.client.get(RECIPES_URL)
+
+        patched_choose.assert_called_once()
+
+    def test_failed_write_not_pinned(self, patched_choose):
+        """Test rejected writes don't pin the user"""
+        self.client.post(RECIPES_URL, {"title": "No time or price"})
+
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_write_at)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self, patched_choose):
+        """Test nothing is routed or recorded without replicas"""
+        self.client.post(RECIPES_URL, {
+            "title": "Soup", "time_minutes": 5, "price": "2.50",
+        })
+        self.client.get(RECIPES_URL)
+
+        patched_choose.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_write_at)
+
+
+@skipUnless("replica1" in settings.DATABASES, "Set DB_REPLICAS to test")
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Test queries reach the replica connection (needs DB_REPLICAS)"""
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        create_recipe(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.alias = "replica1"
+
+    @patch("core.routers.choose_replica")
+    def test_list_read_from_replica(self, patched_choose):
+        """Test list queries run on the replica's connection"""
+        patched_choose.return_value = self.alias
+        with CaptureQueriesContext(connections[self.alias]) as replica:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertTrue(any(
+            "core_recipe" in query["sql"] for query in replica.captured_queries
+        ))
@@ -1,11 +1,50 @@
 """
 Core views for app
 """
+from django.conf import settings
+from django.db import DatabaseError, connection
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from core.db.backends.postgresql.base import connection_stats
+from user.authentication import token_cache
+
+
+def server_connections():
+    """Return our connections to the database server by state"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) "
+            "FROM pg_stat_activity WHERE application_name = %s "
+            "GROUP BY 1",
+            [settings.DATABASES["default"]["OPTIONS"]["application_name"]],
+        )
+        return dict(cursor.fetchall())
+
 
 @api_view(["GET"])
 def health_check(request):
-    """Returns successful response"""
-    return Response({"healthy": True})
+    """Returns successful response when the database is reachable
+
+    Staff get connection pool metrics with ?verbose=1: this worker's
+    connection counters and the server side connections of all workers,
+    and this worker's token cache hit/miss counters.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError:
+        return Response(
+            {"healthy": False}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    data = {"healthy": True}
+    if request.user.is_staff and request.query_params.get("verbose"):
+        data["database"] = {
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "process": connection_stats(),
+            "server": server_connections(),
+        }
+        data["token_cache"] = token_cache.stats()
+    return Response(data)
@@ -0,0 +1,112 @@
+"""
+Per-user response cache for the recipe list APIs
+
+Cached list responses are keyed by scheme and host, user, query string
+and the user's cache generation. The generation is a counter on the user
+row that is bumped in the same transaction as any change to the user's
+recipes, tags, ingredients or the links between them, so a committed write
+is visible to readers at the same moment as the new generation and old
+entries simply stop being looked up. Entries live in the bounded "api"
+cache, which evicts them by age and size.
+
+A write touching several rows would bump the generation once per row;
+inside deferred_bumps() the bumps are collected and issued as one UPDATE
+when the block ends, still inside its transaction.
+"""
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import F
+from rest_framework.response import Response
+
+
+def api_cache():
+    """Return the cache backend used for API responses"""
+    return caches["api"]
+
+
+def autocomplete_cache():
+    """Return the cache backend used for name autocomplete responses"""
+    return caches["autocomplete"]
+
+
+# Users whose generation the current deferred_bumps() block must bump
+_pending_bumps = contextvars.ContextVar("pending_bumps", default=None)
+
+
+def bump_generation(*user_ids):
+    """Invalidate every cached response for the users"""
+    get_user_model().objects.filter(pk__in=user_ids).update(
+        cache_generation=F("cache_generation") + 1
+    )
+
+
+def invalidate(user_id):
+    """Bump a user's generation, at the end of deferred_bumps() if in one"""
+    pending = _pending_bumps.get()
+    if pending is None:
+        bump_generation(user_id)
+    else:
+        pending.add(user_id)
+
+
+@contextmanager
+def deferred_bumps():
+    """Bump the generation of every user the block invalidated, once
+
+    Use inside the block's transaction.atomic(): nothing is bumped if the
+    block raises, as its writes are rolled back. Nested blocks defer to the
+    outermost one.
+    """
+    if _pending_bumps.get() is not None:
+        yield
+        return
+    pending = set()
+    token = _pending_bumps.set(pending)
+    try:
+        yield
+    finally:
+        _pending_bumps.reset(token)
+    if pending:
+        bump_generation(*sorted(pending))
+
+
+def get_generation(user_id):
+    """Return the committed cache generation for a user"""
+    return get_user_model().objects.filter(pk=user_id).values_list(
+        "cache_generation", flat=True
+    ).first()
+
+
+def response_cache_key(request, view_name):
+    """Return the cache key for a user's request to a list view"""
+    generation = get_generation(request.user.pk)
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    # Responses hold absolute URLs (pagination links, images), so they are
+    # only valid for the scheme and host they were built for
+    origin = f"{request.scheme}://{request.get_host()}"
+    return f"{view_name}:{origin}:{request.user.pk}:{generation}:{params}"
+
+
+class CachedListMixin:
+    """Serve the list action from the per-user response cache"""
+
+    def get_list_cache(self):
+        """Return the cache backend for the request's list response"""
+        return api_cache()
+
+    def list(self, request, *args, **kwargs):
+        """Return the cached list response, building it on a miss"""
+        cache = self.get_list_cache()
+        key = response_cache_key(request, self.basename)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        return response
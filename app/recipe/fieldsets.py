@@ -0,0 +1,92 @@
+"""
+Sparse fieldsets for the recipe read APIs
+
+Clients pick the fields they need with ?fields=id,title or drop some with
+?omit=tags,ingredients. The selection is handed to the fast read
+serializers, which only render those fields, and drives the queryset:
+only the columns behind the selected fields are fetched, and the query for
+a nested relation is skipped when it isn't selected.
+"""
+from drf_spectacular.utils import OpenApiParameter, OpenApiTypes
+from rest_framework.exceptions import ValidationError
+
+
+def fieldset_parameters(serializer_class):
+    """Return the OpenAPI parameters documenting ?fields= and ?omit="""
+    available = ", ".join(serializer_class.Meta.fields)
+    return [
+        OpenApiParameter(
+            "fields",
+            OpenApiTypes.STR,
+            description=(
+                "Comma separated list of fields to return, "
+                f"from: {available}"
+            )
+        ),
+        OpenApiParameter(
+            "omit",
+            OpenApiTypes.STR,
+            description=(
+                "Comma separated list of fields to leave out, "
+                f"from: {available}"
+            )
+        ),
+    ]
+
+
+class SparseFieldsetMixin:
+    """Let ?fields= and ?omit= select what the fast serializers render"""
+
+    # Actions rendered by a fast read serializer that accept a selection
+    fieldset_actions = ("list",)
+
+    def _parse_field_names(self, param, available):
+        """Return the field names listed in a query parameter"""
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        names = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({
+                param: [f"Unknown field: {name}" for name in unknown]
+            })
+        return names
+
+    def get_selected_fields(self):
+        """Return the fields to render, in serializer order
+
+        Returns None, meaning every field, for other actions.
+        """
+        if self.action not in self.fieldset_actions:
+            return None
+
+        available = self.get_serializer_class().mirrors.Meta.fields
+        selected = self._parse_field_names("fields", available)
+        omitted = self._parse_field_names("omit", available) or ()
+        return tuple(
+            field for field in available
+            if (selected is None or field in selected)
+            and field not in omitted
+        )
+
+    def get_row_columns(self):
+        """Return the columns to fetch for the selected fields
+
+        Columns the paginator orders by are always fetched, as the cursor
+        is built from the last row even when they aren't rendered.
+        """
+        columns = list(
+            self.get_serializer_class().columns(self.get_selected_fields())
+        )
+        for field in self.get_cursor_ordering():
+            field = field.lstrip("-")
+            if field not in columns and field != "rank":  # rank is annotated
+                columns.append(field)
+        return columns
+
+    def get_serializer(self, *args, **kwargs):
+        """Pass the selected fields to the fast serializers"""
+        if self.action in self.fieldset_actions:
+            kwargs.setdefault("fields", self.get_selected_fields())
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,142 @@
+"""
+Background processing of uploaded recipe images
+
+The upload request only stores the original and marks the recipe as
+pending. Once the upload commits, a thread pool in the worker process
+decodes the original and writes resized, re-encoded variants next to it.
+Jobs still queued when a worker exits are lost; the requeue_recipe_images
+command processes the images left pending.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from core.models import Recipe
+from recipe.cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+# name: (bounding box, Pillow format, file extension)
+IMAGE_VARIANTS = {
+    "thumbnail": ((200, 200), "JPEG", "jpg"),
+    "medium": ((800, 800), "JPEG", "jpg"),
+    "webp": ((1600, 1600), "WEBP", "webp"),
+}
+
+_executor = None
+
+
+def get_executor():
+    """Return the process wide image worker pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix="recipe-images",
+        )
+    return _executor
+
+
+def render_variant(original, size, image_format):
+    """Return the bytes of original resized to fit size"""
+    image = ImageOps.exif_transpose(original)
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail(size)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=85)
+    return buffer.getvalue()
+
+
+def build_variants(recipe_id, image_name):
+    """Create the variants for a recipe's image and record them"""
+    recipe = Recipe.objects.filter(id=recipe_id, image=image_name).first()
+    if recipe is None:  # Deleted, or replaced by a newer upload
+        return
+
+    storage = recipe.image.storage
+    base = os.path.splitext(image_name)[0]
+    variants = {}
+    try:
+        with storage.open(image_name) as image_file:
+            original = Image.open(image_file)
+            original.load()
+        for name, (size, image_format, ext) in IMAGE_VARIANTS.items():
+            content = render_variant(original, size, image_format)
+            variants[name] = storage.save(
+                f"{base}_{name}.{ext}", ContentFile(content)
+            )
+        image_status = "ready"
+    except (OSError, ValueError):
+        logger.exception("Processing image for recipe %s failed", recipe_id)
+        delete_variants(variants)
+        variants, image_status = {}, "failed"
+
+    updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        image_status=image_status, image_variants=variants
+    )
+    if updated:
+        bump_generation(recipe.user_id)
+    else:
+        delete_variants(variants)
+
+
+def mark_failed(recipe_id, image_name):
+    """Flag a recipe's image as failed, unless it was replaced since"""
+    recipes = Recipe.objects.filter(id=recipe_id, image=image_name)
+    user_id = recipes.values_list("user_id", flat=True).first()
+    if user_id is not None and recipes.update(
+        image_status="failed", image_variants={}
+    ):
+        bump_generation(user_id)
+
+
+def process_image(recipe_id, image_name):
+    """Run build_variants, flagging the image failed if it crashes
+
+    Errors build_variants doesn't expect would otherwise leave the image
+    pending forever.
+    """
+    try:
+        build_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception("Image job for recipe %s crashed", recipe_id)
+        mark_failed(recipe_id, image_name)
+
+
+def _run_job(recipe_id, image_name):
+    """Run process_image in a pool thread with its own DB connection"""
+    close_old_connections()
+    try:
+        process_image(recipe_id, image_name)
+    except Exception:  # Nobody waits on the job's future
+        logger.exception("Image job for recipe %s crashed", recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe):
+    """Build variants of the recipe's current image once committed
+
+    With IMAGE_WORKERS = 0 the variants are built inline instead.
+    """
+    recipe_id, image_name = recipe.id, recipe.image.name
+    if settings.IMAGE_WORKERS <= 0:
+        transaction.on_commit(lambda: build_variants(recipe_id, image_name))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(_run_job, recipe_id, image_name)
+        )
+
+
+def delete_variants(variants):
+    """Remove variant files from storage"""
+    storage = Recipe._meta.get_field("image").storage
+    for path in variants.values():
+        storage.delete(path)
@@ -0,0 +1,182 @@
+"""
+Pagination for the recipe APIs
+"""
+import json
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowValue(Func):
+    """A row value, compared column by column: ROW(a, b) < ROW(x, y)"""
+    function = "ROW"
+    output_field = Field()
+
+
+def _reverse_ordering(ordering):
+    """Return the ordering with every field's direction flipped"""
+    return tuple(
+        field[1:] if field.startswith("-") else f"-{field}"
+        for field in ordering
+    )
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over recipes, newest first
+
+    Each page seeks past the key of the last row of the previous one,
+    comparing every ordering field at once as a row value (WHERE (price,
+    id) > (...)) rather than using OFFSET, so deep pages cost the same as
+    the first, runs of equal values page like any other rows, and rows
+    inserted while paging don't shift or repeat results.
+
+    Orderings must end in a unique field and sort every field in the same
+    direction, which lets a (user, ...fields) index serve the seek.
+    """
+    ordering = "-id"
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        """Let the view pick the ordering, e.g. by search rank"""
+        get_cursor_ordering = getattr(view, "get_cursor_ordering", None)
+        if get_cursor_ordering is not None:
+            ordering = tuple(get_cursor_ordering())
+        else:
+            ordering = super().get_ordering(request, queryset, view)
+        descending = ordering[0].startswith("-")
+        assert all(f.startswith("-") == descending for f in ordering), (
+            f"Keyset ordering {ordering} mixes directions"
+        )
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request, queryset)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor else None
+
+        queryset = queryset.order_by(
+            *(_reverse_ordering(self.ordering) if reverse else self.ordering)
+        )
+        if position is not None:
+            fields = [field.lstrip("-") for field in self.ordering]
+            # Rows after the position in query order
+            descending = self.ordering[0].startswith("-") != reverse
+            seek = LessThan if descending else GreaterThan
+            queryset = queryset.filter(seek(
+                RowValue(*map(F, fields)), RowValue(*map(Value, position))
+            ))
+
+        # One extra row tells whether there's a page after this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.next_position = (
+            self._get_key(self.page[-1]) if self.page else position
+        )
+        self.previous_position = (
+            self._get_key(self.page[0]) if self.page else position
+        )
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=self.next_position
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=True, position=self.previous_position
+        ))
+
+    def _get_key(self, row):
+        """Return the values of the ordering fields of a row"""
+        fields = [field.lstrip("-") for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[field] for field in fields]
+        return [getattr(row, field) for field in fields]
+
+    def _to_python(self, queryset, field, value):
+        """Return a cursor value as the type of its field or annotation"""
+        try:
+            output_field = queryset.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            output_field = queryset.query.annotations[field].output_field
+        return output_field.to_python(value)
+
+    def decode_cursor(self, request, queryset=None):
+        """Return the Cursor of the request, its position as a key"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = json.loads(tokens["p"][0])
+            if len(position) != len(self.ordering):
+                raise ValueError("Wrong number of key values")
+            position = [
+                self._to_python(queryset, field.lstrip("-"), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        """Return the URL of the page at the cursor"""
+        tokens = {"p": json.dumps(cursor.position, cls=DjangoJSONEncoder)}
+        if cursor.reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """Keyset pagination over tags and ingredients by name
+
+    Names are unique per user, so they end every ordering: by recipe_count
+    the key is (recipe_count, name). Name prefix lookups (?q=) return at
+    most AUTOCOMPLETE_PAGE_SIZE items a page.
+    """
+    ordering = "-name"
+
+    def get_page_size(self, request):
+        """Cap the page size of autocomplete lookups"""
+        page_size = super().get_page_size(request)
+        if request.query_params.get("q"):
+            return min(page_size, settings.AUTOCOMPLETE_PAGE_SIZE)
+        return page_size
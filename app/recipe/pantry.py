@@ -0,0 +1,68 @@
+"""
+"What can I cook" matching of recipes against a pantry of ingredients
+
+The link table has an (ingredient_id, recipe_id) index (migration 0008),
+an inverted index from each ingredient to the recipes using it, and every
+recipe carries its number of ingredients in Recipe.ingredient_count, kept
+up to date by triggers on the link table (migration 0017). A pantry match
+reads the recipes of the pantry's ingredients from that index, counts the
+hits per recipe and divides by ingredient_count in one aggregate query, so
+nothing loops over recipes in Python and recipes sharing no ingredient with
+the pantry are never read.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast
+
+# Most recipes a single match returns
+MAX_MATCHES = 1000
+
+# Recipe ingredient counts recomputed from the link table, as (id, n)
+EXPECTED_COUNTS_SQL = (
+    "SELECT r.id, coalesce(l.n, 0) AS n FROM core_recipe r LEFT JOIN ("
+    "SELECT recipe_id, count(*) AS n FROM core_recipe_ingredients "
+    "GROUP BY 1) l ON l.recipe_id = r.id"
+)
+
+
+def match_pantry(queryset, ingredient_ids):
+    """Return recipes sharing ingredients with the pantry, best first
+
+    Rows are annotated with "coverage", the fraction of the recipe's
+    ingredients in the pantry. Recipes sharing no ingredient with the
+    pantry are left out.
+    """
+    # Filtering on the link table first restricts the joined links, and so
+    # the count, to the pantry's ingredients
+    pantry = sorted(set(ingredient_ids))
+    return queryset.filter(ingredients__in=pantry).annotate(
+        coverage=Cast(Count("ingredients"), FloatField())
+        / F("ingredient_count"),
+    ).order_by(F("coverage").desc(), "-id")
+
+
+def ingredient_count_drift():
+    """Return how many recipes have a wrong ingredient_count"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM core_recipe r "
+            f"JOIN ({EXPECTED_COUNTS_SQL}) e ON e.id = r.id "
+            f"WHERE r.ingredient_count <> e.n"
+        )
+        return cursor.fetchone()[0]
+
+
+def refresh_ingredient_counts():
+    """Recount Recipe.ingredient_count from the link table
+
+    Only writes the recipes whose count changed; link writes wait for it.
+    Returns the number of recipes corrected.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE core_recipe_ingredients IN SHARE MODE")
+        cursor.execute(
+            f"UPDATE core_recipe r SET ingredient_count = e.n "
+            f"FROM ({EXPECTED_COUNTS_SQL}) e "
+            f"WHERE r.id = e.id AND r.ingredient_count <> e.n"
+        )
+        return cursor.rowcount
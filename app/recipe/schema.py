@@ -0,0 +1,22 @@
+"""
+OpenAPI schema extensions for the recipe APIs
+"""
+from drf_spectacular.extensions import OpenApiSerializerExtension
+from drf_spectacular.plumbing import force_instance
+
+
+class FastReadSerializerExtension(OpenApiSerializerExtension):
+    """Document fast read serializers as the ModelSerializer they mirror"""
+    target_class = "recipe.serializers.FastReadSerializer"
+    match_subclasses = True
+
+    def get_name(self, auto_schema, direction):
+        return auto_schema._get_serializer_name(
+            force_instance(self.target.mirrors), direction
+        )
+
+    def get_identity(self, auto_schema, direction):
+        return self.target.mirrors
+
+    def map_serializer(self, auto_schema, direction):
+        return auto_schema._map_serializer(self.target.mirrors, direction)
@@ -2,67 +2,180 @@
 Serializers for recipe APIs
 """
 
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 
+from core.instrumentation import timed
 from core.models import Recipe, Tag, Ingredient
+from recipe import images, pantry, similarity
+from recipe.cache import deferred_bumps, invalidate
+
+# Recipe.price has two decimal places, rendered like DRF's DecimalField
+PRICE_PLACES = Decimal("0.01")
+
+
+def image_url(name, request=None):
+    """Return the URL of a stored image the way DRF's ImageField does"""
+    if not name:
+        return None
+    url = Recipe._meta.get_field("image").storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_variant_urls(variants, request=None):
+    """Return {variant: URL} for a recipe's image_variants"""
+    return {name: image_url(path, request) for name, path in variants.items()}
+
 
+class RecipeAttrSerializer(serializers.ModelSerializer):
+    """Base serializer for tags and ingredients"""
 
-class IngredientSerializer(serializers.ModelSerializer):
+    def validate_name(self, value):
+        """Reject renaming to a name the user already has"""
+        if self.instance is not None:  # Nested create/update dedupe names
+            model = self.Meta.model
+            clash = model.objects.filter(
+                user=self.instance.user, name=value
+            ).exclude(id=self.instance.id)
+            if clash.exists():
+                raise serializers.ValidationError(
+                    f"{model.__name__} with this name already exists."
+                )
+        return value
+
+
+class IngredientSerializer(RecipeAttrSerializer):
     """Serializer for Ingredients"""
     class Meta:
         model = Ingredient
-        fields = ["id", "name"]
-        read_only_fields = ["id"]
+        fields = ["id", "name", "recipe_count"]
+        read_only_fields = ["id", "recipe_count"]
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(RecipeAttrSerializer):
     """Serializer for Tags"""
     class Meta:
         model = Tag
         fields = [
-            "id", "name"
+            "id", "name", "recipe_count"
         ]
-        read_only_fields = ["id"]
+        read_only_fields = ["id", "recipe_count"]
+
+
+class RecipeIngredientSerializer(IngredientSerializer):
+    """Ingredient nested in a recipe, without its usage count"""
+    class Meta(IngredientSerializer.Meta):
+        fields = ["id", "name"]
+
+
+class RecipeTagSerializer(TagSerializer):
+    """Tag nested in a recipe, without its usage count"""
+    class Meta(TagSerializer.Meta):
+        fields = ["id", "name"]
+
+
+class TimeBucketSerializer(serializers.Serializer):
+    """A time_minutes histogram bucket, from min up to (not incl.) max"""
+    min = serializers.IntegerField()
+    max = serializers.IntegerField(allow_null=True)  # None: no upper bound
+    recipes = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Aggregates over a user's recipes (recipe.stats)"""
+    recipe_count = serializers.IntegerField()
+    average_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, allow_null=True
+    )
+    median_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, allow_null=True
+    )
+    time_histogram = TimeBucketSerializer(many=True)
+    top_tags = TagSerializer(many=True)
+    top_ingredients = IngredientSerializer(many=True)
+
+
+def get_or_create_by_name(model, user, names):
+    """Return {name: obj} for the user's rows named in names
+
+    Runs a fixed number of queries however many names there are: one
+    lookup, and if needed one INSERT ... ON CONFLICT DO NOTHING plus a
+    re-read, so concurrent requests adding the same name can't race.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+
+    objs = {
+        obj.name: obj
+        for obj in model.objects.filter(user=user, name__in=names)
+    }
+    missing = [name for name in names if name not in objs]
+    if missing:
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        objs.update(
+            (obj.name, obj)
+            for obj in model.objects.filter(user=user, name__in=missing)
+        )
+    return objs
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeImageVariantsMixin(serializers.Serializer):
+    """Adds the URLs of the resized image variants"""
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj) -> dict:
+        return image_variant_urls(
+            obj.image_variants, self.context.get("request")
+        )
+
+
+class RecipeSerializer(RecipeImageVariantsMixin, serializers.ModelSerializer):
     """Serializer for recipes"""
     # Nesting Serializers
     # List of Tags in Recipe Serializer
-    tags = TagSerializer(many=True, required=False)
-    ingredients = IngredientSerializer(many=True, required=False)
+    tags = RecipeTagSerializer(many=True, required=False)
+    ingredients = RecipeIngredientSerializer(many=True, required=False)
 
     class Meta:
         model = Recipe
         fields = [
             "id", "title", "time_minutes", "price",
-            "link", "tags", "ingredients", "image"
+            "link", "tags", "ingredients", "image",
+            "image_status", "image_variants",
         ]
-        read_only_fields = ["id"]
+        read_only_fields = ["id", "image_status"]
 
-    def _get_or_create_tags(self, tags, recipe):  # Edited get_or_create
-        """Handle getting or creating tags as needed"""
+    def _get_or_create_objs(self, model, items):
+        """Return the user's objects named in items, creating missing ones"""
         auth_user = self.context["request"].user  # Getting Authenticated User
+        names = [item["name"] for item in items]
+        return list(get_or_create_by_name(model, auth_user, names).values())
 
-        for tag in tags:
-            # Original get or create
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
+    def _get_or_create_tags(self, tags, recipe):  # Edited get_or_create
+        """Handle getting or creating tags as needed"""
+        tag_objs = self._get_or_create_objs(Tag, tags)
+        # Recipe has no existing links here, so attach in a single INSERT
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tag_objs
+        ])
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed"""
-        auth_user = self.context["request"].user
-
-        for ingredient in ingredients:  # Loop through ingredient
-            ingredient_obj, create = Ingredient.objects.get_or_create(
-                user=auth_user,  # Get or create an ingredient obj
-                **ingredient,
-            )
-            # add that obj to the recipe ingredient attr
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = self._get_or_create_objs(Ingredient, ingredients)
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(recipe=recipe, ingredient=ingredient)
+            for ingredient in ingredient_objs
+        ])
 
     """
     Validated data is the data passed when the user sends data to api
@@ -78,9 +191,10 @@ class RecipeSerializer(serializers.ModelSerializer):
         # Remove tag data from validated data
         tags = validated_data.pop("tags", [])
         ingredients = validated_data.pop("ingredients", [])
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        with transaction.atomic(), deferred_bumps():
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags, recipe)
+            self._get_or_create_ingredients(ingredients, recipe)
 
         return recipe
 
@@ -93,18 +207,19 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Update recipe: for better understanding: Video 101"""
         tags = validated_data.pop("tags", None)
         ingredients = validated_data.pop("ingredients", None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-
-        if ingredients is not None:
-            instance.ingredients.clear()  # Clear all ingredients first
-            # Add all ingredients saved in the ingredients variable
-            self._get_or_create_ingredients(ingredients, instance)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-
-        instance.save()
+        with transaction.atomic(), deferred_bumps():
+            if tags is not None:
+                instance.tags.clear()
+                self._get_or_create_tags(tags, instance)
+
+            if ingredients is not None:
+                instance.ingredients.clear()  # Clear all ingredients first
+                # Add all ingredients saved in the ingredients variable
+                self._get_or_create_ingredients(ingredients, instance)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+
+            instance.save()
         return instance
 
 
@@ -117,11 +232,355 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ["description"]
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeFilterSerializer(serializers.Serializer):
+    """Range filters and ordering of the recipe list"""
+    min_time_minutes = serializers.IntegerField(required=False)
+    max_time_minutes = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    max_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    ordering = serializers.ChoiceField(
+        choices=["time_minutes", "-time_minutes", "price", "-price"],
+        required=False,
+    )
+
+    # ORM lookup of each range parameter
+    lookups = {
+        "min_time_minutes": "time_minutes__gte",
+        "max_time_minutes": "time_minutes__lte",
+        "min_price": "price__gte",
+        "max_price": "price__lte",
+    }
+
+    def get_filters(self):
+        """Return the ORM filters of the given range parameters"""
+        return {
+            self.lookups[name]: value
+            for name, value in self.validated_data.items()
+            if name in self.lookups
+        }
+
+
+class PantrySerializer(serializers.Serializer):
+    """The ingredients a user has, to rank their recipes by"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0, max_value=1, default=0
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=pantry.MAX_MATCHES,
+        default=settings.API_PAGE_SIZE,
+    )
+
+
+class PantryMatchSerializer(RecipeSerializer):
+    """A recipe ranked by how much of it a pantry covers"""
+    coverage = serializers.FloatField()
+    missing_ingredients = RecipeIngredientSerializer(many=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            "coverage", "missing_ingredients",
+        ]
+
+
+class SimilarSerializer(serializers.Serializer):
+    """Options of a similar recipe lookup"""
+    limit = serializers.IntegerField(
+        min_value=1, max_value=similarity.MAX_SIMILAR,
+        default=settings.API_PAGE_SIZE,
+    )
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """A recipe with its similarity to another one"""
+    similarity = serializers.FloatField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ["similarity"]
+
+
+class RecipeImageSerializer(RecipeImageVariantsMixin,
+                            serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
 
     class Meta:
         model = Recipe
-        fields = ["id", "image"]
-        read_only_fields = ["id"]
+        fields = ["id", "image", "image_status", "image_variants"]
+        read_only_fields = ["id", "image_status"]
         extra_kwargs = {"image": {"required": "True"}}
+
+    def update(self, instance, validated_data):
+        """Store the original and queue building its variants"""
+        old_variants = instance.image_variants
+        validated_data.update(image_status="pending", image_variants={})
+        recipe = super().update(instance, validated_data)
+        images.delete_variants(old_variants)
+        images.schedule_variants(recipe)
+        return recipe
+
+
+class RecipeBatchSerializer:
+    """Validate and save many recipe payloads in one transaction
+
+    data is a list of RecipeDetailSerializer payloads; items carrying an
+    "id" partially update that recipe, the rest are created. Every item is
+    validated before anything is written, and errors are reported per item
+    in request order; an id may only appear once. Tags and ingredients for
+    the whole batch are resolved together and rows and links are written
+    with bulk statements.
+    """
+    max_items = 500
+    related_models = {"tags": Tag, "ingredients": Ingredient}
+
+    def __init__(self, data=None, context=None):
+        self.initial_data = data
+        self.context = context or {}
+        self.errors = None
+        self._items = []
+
+    def _load_instances(self, ids):
+        """Return {id: recipe} for the user's recipes among ids"""
+        user = self.context["request"].user
+        return Recipe.objects.filter(user=user, id__in=ids).in_bulk()
+
+    @staticmethod
+    def _parse_id(value):
+        """Return value as a recipe id, or None if it isn't one"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def is_valid(self):
+        """Validate every item, collecting errors in request order"""
+        data = self.initial_data
+        if not isinstance(data, list):
+            self.errors = {"non_field_errors": ["Expected a list of items."]}
+            return False
+        if len(data) > self.max_items:
+            self.errors = {"non_field_errors": [
+                f"Ensure this list has at most {self.max_items} items."
+            ]}
+            return False
+
+        ids = [
+            self._parse_id(item.get("id"))
+            for item in data if isinstance(item, dict)
+        ]
+        instances = self._load_instances([i for i in ids if i is not None])
+        # An update per recipe, repeats would write its links twice
+        repeated = {
+            recipe_id for recipe_id, count in Counter(ids).items()
+            if recipe_id is not None and count > 1
+        }
+
+        errors, self._items = [], []
+        for item in data:
+            if not isinstance(item, dict):
+                errors.append({"non_field_errors": ["Expected an object."]})
+                self._items.append(None)
+                continue
+            instance = None
+            if item.get("id") is not None:
+                recipe_id = self._parse_id(item["id"])
+                if recipe_id in repeated:
+                    errors.append({"id": ["Repeated in this batch."]})
+                    self._items.append(None)
+                    continue
+                instance = instances.get(recipe_id)
+                if instance is None:
+                    errors.append({"id": ["Not found."]})
+                    self._items.append(None)
+                    continue
+            serializer = RecipeDetailSerializer(
+                instance, data=item, partial=instance is not None,
+                context=self.context,
+            )
+            serializer.is_valid()
+            errors.append(serializer.errors)
+            self._items.append((instance, serializer.validated_data))
+
+        if any(errors):
+            self.errors = errors
+            return False
+        self.errors = []
+        return True
+
+    def save(self):
+        """Write the batch and return the recipe ids in request order"""
+        user = self.context["request"].user
+        items = [
+            (instance, dict(validated_data))
+            for instance, validated_data in self._items
+        ]
+        # name lists per item and relation; None keeps an update's links
+        links = [
+            {field: data.pop(field, None) for field in self.related_models}
+            for _, data in items
+        ]
+
+        with transaction.atomic(), deferred_bumps():
+            resolved = {
+                field: get_or_create_by_name(model, user, [
+                    obj["name"]
+                    for item_links in links
+                    for obj in (item_links[field] or [])
+                ])
+                for field, model in self.related_models.items()
+            }
+
+            created = [
+                Recipe(user=user, **data)
+                for instance, data in items if instance is None
+            ]
+            Recipe.objects.bulk_create(created)
+
+            updated, update_fields = [], set()
+            for instance, data in items:
+                if instance is not None:
+                    for attr, value in data.items():
+                        setattr(instance, attr, value)
+                    update_fields.update(data)
+                    updated.append(instance)
+            if update_fields:
+                Recipe.objects.bulk_update(updated, sorted(update_fields))
+
+            created_iter = iter(created)
+            recipes = [
+                instance if instance is not None else next(created_iter)
+                for instance, _ in items
+            ]
+            self._write_links(recipes, links, resolved)
+            invalidate(user.id)  # Bulk writes send no model signals
+
+        return [recipe.id for recipe in recipes]
+
+    def _write_links(self, recipes, links, resolved):
+        """Replace the M2M links of every recipe that specified them"""
+        for field in self.related_models:
+            through = getattr(Recipe, field).through
+            target = Recipe._meta.get_field(field).m2m_reverse_field_name()
+            replaced = [
+                recipe.id for recipe, item_links in zip(recipes, links)
+                if item_links[field] is not None
+            ]
+            through.objects.filter(recipe_id__in=replaced).delete()
+            through.objects.bulk_create([
+                through(recipe_id=recipe.id, **{target: resolved[field][name]})
+                for recipe, item_links in zip(recipes, links)
+                for name in dict.fromkeys(
+                    obj["name"] for obj in item_links[field] or []
+                )
+            ])
+
+
+class FastReadSerializer:
+    """Read-only stand-in for a ModelSerializer on list/retrieve
+
+    Renders plain dicts straight from `.values()` rows instead of going
+    through DRF's per-field machinery. Output matches the ModelSerializer
+    named in `mirrors` key for key and value for value. Only `.data` is
+    supported; writes still go through the regular serializers.
+
+    `fields` limits the output to a subset of the mirrored fields.
+    """
+    mirrors = None  # The ModelSerializer whose output this reproduces
+
+    def __init__(self, instance=None, many=False, context=None, fields=None,
+                 **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.fields = tuple(
+            self.mirrors.Meta.fields if fields is None else fields
+        )
+
+    @classmethod
+    def columns(cls, fields=None):
+        """Return the model columns to select with `.values()`"""
+        return list(cls.mirrors.Meta.fields if fields is None else fields)
+
+    def to_representation_many(self, rows):
+        """Return the rendered dicts for a list of rows"""
+        return [{field: row[field] for field in self.fields} for row in rows]
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            rows = list(self.instance) if self.many else [self.instance]
+            data = self.to_representation_many(rows)
+        return data if self.many else data[0]
+
+
+class FastTagSerializer(FastReadSerializer):
+    """Fast read serializer for tags"""
+    mirrors = TagSerializer
+
+
+class FastIngredientSerializer(FastReadSerializer):
+    """Fast read serializer for ingredients"""
+    mirrors = IngredientSerializer
+
+
+class FastRecipeSerializer(FastReadSerializer):
+    """Fast read serializer for recipes with nested tags/ingredients"""
+    mirrors = RecipeSerializer
+    related_fields = ("tags", "ingredients")
+
+    @classmethod
+    def columns(cls, fields=None):
+        # The id is always needed to look up tags/ingredients
+        columns = ["id"]
+        for field in cls.mirrors.Meta.fields if fields is None else fields:
+            if field not in cls.related_fields and field not in columns:
+                columns.append(field)
+        return columns
+
+    def _related_map(self, field, recipe_ids):
+        """Return {recipe_id: [{"id", "name"}, ...]} in one query"""
+        model = Recipe._meta.get_field(field).related_model
+        related = {}
+        rows = model.objects.filter(recipe__in=recipe_ids).values_list(
+            "recipe", "id", "name"
+        )
+        for recipe_id, obj_id, name in rows:
+            related.setdefault(recipe_id, []).append(
+                {"id": obj_id, "name": name}
+            )
+        return related
+
+    def to_representation_many(self, rows):
+        ids = [row["id"] for row in rows]
+        related = {
+            field: self._related_map(field, ids) if ids else {}
+            for field in self.related_fields if field in self.fields
+        }
+        request = self.context.get("request")
+        data = []
+        for row in rows:
+            item = {}
+            for field in self.fields:
+                if field in related:
+                    item[field] = related[field].get(row["id"], [])
+                elif field == "price":
+                    price = row[field].quantize(PRICE_PLACES)
+                    item[field] = f"{price:f}"
+                elif field == "image":
+                    item[field] = image_url(row[field], request)
+                elif field == "image_variants":
+                    item[field] = image_variant_urls(row[field], request)
+                else:
+                    item[field] = row[field]
+            data.append(item)
+        return data
+
+
+class FastRecipeDetailSerializer(FastRecipeSerializer):
+    """Fast read serializer for the recipe detail view"""
+    mirrors = RecipeDetailSerializer
@@ -0,0 +1,29 @@
+"""
+Signal handlers keeping the recipe response cache in sync
+"""
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import invalidate
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_change(sender, instance, **kwargs):
+    """Bump the owner's cache generation when a row changes"""
+    invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_link_change(sender, instance, action, **kwargs):
+    """Bump the owner's cache generation when recipe links change"""
+    if action in ("post_add", "post_remove", "post_clear"):
+        # instance is a Recipe, or a Tag/Ingredient for reverse changes;
+        # both belong to the same user as the recipe.
+        invalidate(instance.user_id)
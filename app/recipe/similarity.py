@@ -0,0 +1,121 @@
+"""
+Similar recipe lookup with MinHash signatures and LSH bands
+
+Each recipe's tags and ingredients are summarised in Recipe.minhash, the
+minimum of SIGNATURE_SIZE hash functions over the set: two recipes agree
+on any one position with a probability equal to the Jaccard similarity of
+their sets. The signature is cut into BANDS bands of ROWS values and each
+band hashed into Recipe.similarity_bands, indexed with GIN, so recipes
+agreeing on a whole band are found through the index and only those
+candidates are scored, never every pair of recipes.
+
+Triggers on the link tables recompute both columns for the recipes whose
+links a statement changed (migration 0018). The hash functions below must
+stay identical to the core_recipe_minhash and core_recipe_similarity_bands
+functions defined there; seed_data computes signatures here instead of in
+the database to avoid rewriting every loaded recipe.
+"""
+from django.db import connection, transaction
+from django.db.models import F, FloatField, IntegerField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+# Hash functions are (a * x + b) % PRIME, x below 2 ** 30
+PRIME = 2 ** 31 - 1
+BANDS = 10
+ROWS = 3
+SIGNATURE_SIZE = BANDS * ROWS
+HASHES = [
+    (i * 2654435761 % PRIME, i * 2246822519 % PRIME)
+    for i in range(1, SIGNATURE_SIZE + 1)
+]
+# Multiplier combining the values of a band into its key
+BAND_BASE = 1000003
+
+# Most recipes a single lookup returns
+MAX_SIMILAR = 100
+
+# Agreeing signature positions, against the row being selected
+AGREEMENT_SQL = (
+    "(SELECT count(*) FROM unnest(core_recipe.minhash, %s::bigint[]) "
+    "AS s(a, b) WHERE a = b)"
+)
+
+
+def signature(tag_ids, ingredient_ids):
+    """Return the MinHash signature of a recipe's tags and ingredients"""
+    # Tags and ingredients have separate ids, kept apart by parity
+    elements = [tag_id * 2 for tag_id in tag_ids]
+    elements += [ingredient_id * 2 + 1 for ingredient_id in ingredient_ids]
+    if not elements:
+        return []
+    return list(map(min, zip(*(
+        [(a * x + b) % PRIME for a, b in HASHES] for x in elements
+    ))))
+
+
+def bands(minhash):
+    """Return the LSH band keys of a signature"""
+    keys = []
+    for band in range(BANDS if minhash else 0):
+        key = band + 1
+        for value in minhash[band * ROWS:(band + 1) * ROWS]:
+            key = (key * BAND_BASE + value) % PRIME
+        # Bands only match their own position
+        keys.append((band << 31) + key)
+    return keys
+
+
+def similar_recipes(queryset, recipe):
+    """Return recipes like recipe, most similar first
+
+    Rows are annotated with "similarity", the estimated Jaccard similarity
+    (0-1) of their tags and ingredients with the recipe's. Only recipes
+    sharing a band with it are considered, so pairs much below
+    (1 / BANDS) ** (1 / ROWS), about 0.46, are rarely found.
+    """
+    agreement = RawSQL(
+        AGREEMENT_SQL, [recipe.minhash], output_field=IntegerField()
+    )
+    queryset = queryset.filter(
+        similarity_bands__overlap=recipe.similarity_bands
+    ).exclude(pk=recipe.pk).annotate(
+        similarity=Cast(agreement, FloatField()) / SIGNATURE_SIZE,
+    ).order_by(F("similarity").desc(), "-id")
+    # Recipes without tags or ingredients have no bands to match
+    return queryset if recipe.similarity_bands else queryset.none()
+
+
+# Recipes whose signature differs from one recomputed from the links
+STALE_SQL = (
+    "SELECT id, minhash, core_recipe_similarity_bands(minhash) AS bands "
+    "FROM (SELECT id, core_recipe_minhash(id) AS minhash, "
+    "minhash AS old_minhash, similarity_bands FROM core_recipe) r "
+    "WHERE old_minhash <> minhash "
+    "OR similarity_bands <> core_recipe_similarity_bands(minhash)"
+)
+
+
+def similarity_drift():
+    """Return how many recipes have a stale signature"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM ({STALE_SQL}) s")
+        return cursor.fetchone()[0]
+
+
+def refresh_similarity():
+    """Recompute stale Recipe.minhash/similarity_bands from the links
+
+    Link writes wait for it. Returns the number of recipes corrected.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "LOCK TABLE core_recipe_tags, core_recipe_ingredients "
+            "IN SHARE MODE"
+        )
+        cursor.execute(
+            f"UPDATE core_recipe r SET minhash = s.minhash, "
+            f"similarity_bands = s.bands FROM ({STALE_SQL}) s "
+            f"WHERE r.id = s.id"
+        )
+        return cursor.rowcount
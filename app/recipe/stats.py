@@ -0,0 +1,214 @@
+"""
+Per-user recipe statistics served from summary tables
+
+core_recipestat holds how many of each user's recipes have each price (in
+cents) and each time_minutes value, and Tag/Ingredient.recipe_count how
+many recipes use each tag and ingredient. Database triggers keep both up
+to date as recipes and their links are written (migrations 0015 and
+0016), so the stats endpoint reads a few summary rows instead of every
+recipe.
+
+Loads that disable the triggers (seed_data) rebuild the summaries
+afterwards; the rebuild_recipe_stats command checks them for drift.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from core.models import Recipe, RecipeStat, Tag, Ingredient
+
+# Upper bounds (exclusive) of the time_minutes histogram buckets, the last
+# bucket has no upper bound
+TIME_BUCKETS = (10, 20, 30, 45, 60, 90, 120, 180)
+
+# Most used tags and ingredients listed in the stats
+TOP_COUNT = 10
+
+# (table, trigger) maintaining the summaries, Recipe.ingredient_count
+# (recipe.pantry) and the signatures of recipe.similarity, for bulk loads
+# to disable
+SUMMARY_TRIGGERS = [
+    ("core_recipe_tags", "core_recipe_tags_count_insert"),
+    ("core_recipe_tags", "core_recipe_tags_count_delete"),
+    ("core_recipe_ingredients", "core_recipe_ingredients_count_insert"),
+    ("core_recipe_ingredients", "core_recipe_ingredients_count_delete"),
+    ("core_recipe", "core_recipe_stat_insert"),
+    ("core_recipe", "core_recipe_stat_update"),
+    ("core_recipe", "core_recipe_stat_delete"),
+    ("core_recipe_ingredients",
+     "core_recipe_ingredients_ingredient_count_insert"),
+    ("core_recipe_ingredients",
+     "core_recipe_ingredients_ingredient_count_delete"),
+    ("core_recipe_tags", "core_recipe_tags_similarity_insert"),
+    ("core_recipe_tags", "core_recipe_tags_similarity_delete"),
+    ("core_recipe_ingredients", "core_recipe_ingredients_similarity_insert"),
+    ("core_recipe_ingredients", "core_recipe_ingredients_similarity_delete"),
+]
+
+# Models with a recipe_count, and their Recipe M2M field
+RECIPE_COUNT_MODELS = ((Tag, "tags"), (Ingredient, "ingredients"))
+
+CENTS = Decimal("0.01")
+
+
+def _from_cents(value):
+    """Return an amount of cents as a price with two decimal places"""
+    return (Decimal(value) * CENTS).quantize(CENTS)
+
+
+def _median(counts, total):
+    """Return the median of sorted (value, count) pairs"""
+    middle = ((total - 1) // 2, total // 2)
+    values = []
+    seen = 0
+    for value, count in counts:
+        seen += count
+        while len(values) < 2 and seen > middle[len(values)]:
+            values.append(value)
+        if len(values) == 2:
+            break
+    return Decimal(sum(values)) / 2
+
+
+def _histogram(counts):
+    """Return time_minutes counts grouped into TIME_BUCKETS"""
+    bounds = [None, *TIME_BUCKETS, None]
+    buckets = [
+        {"min": low or 0, "max": high, "recipes": 0}
+        for low, high in zip(bounds, bounds[1:])
+    ]
+    for value, count in counts:
+        index = sum(1 for bound in TIME_BUCKETS if value >= bound)
+        buckets[index]["recipes"] += count
+    return buckets
+
+
+def _top(model, user):
+    """Return the user's most used tags or ingredients"""
+    return list(
+        model.objects.filter(user=user, recipe_count__gt=0).order_by(
+            "-recipe_count", "-name"
+        ).values("id", "name", "recipe_count")[:TOP_COUNT]
+    )
+
+
+def get_recipe_stats(user):
+    """Return the recipe statistics of a user
+
+    Runs three queries (the user's summary rows, top tags, top
+    ingredients) however many recipes the user has.
+    """
+    prices, times = [], []
+    rows = RecipeStat.objects.filter(user=user).order_by(
+        "field", "value"
+    ).values_list("field", "value", "recipes")
+    for field, value, recipes in rows:
+        (prices if field == "price" else times).append((value, recipes))
+
+    count = sum(recipes for _, recipes in prices)
+    average = median = None
+    if count:
+        total = sum(value * recipes for value, recipes in prices)
+        average = _from_cents(Decimal(total) / count)
+        median = _from_cents(_median(prices, count))
+    return {
+        "recipe_count": count,
+        "average_price": average,
+        "median_price": median,
+        "time_histogram": _histogram(times),
+        "top_tags": _top(Tag, user),
+        "top_ingredients": _top(Ingredient, user),
+    }
+
+
+def _quote(model):
+    """Return the quoted table name of a model"""
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _expected_stats_sql():
+    """Return SQL computing core_recipestat from scratch"""
+    recipes = _quote(Recipe)
+    return (
+        f"SELECT user_id, 'price' AS field, (price * 100)::int AS value, "
+        f"count(*)::int AS recipes FROM {recipes} GROUP BY 1, 3 "
+        f"UNION ALL "
+        f"SELECT user_id, 'time_minutes', time_minutes, count(*)::int "
+        f"FROM {recipes} GROUP BY 1, 3"
+    )
+
+
+def _expected_counts_sql(model, field):
+    """Return SQL computing model.recipe_count from scratch, as (id, n)"""
+    through = getattr(Recipe, field).through
+    column = connection.ops.quote_name(
+        through._meta.get_field(model._meta.model_name).column
+    )
+    return (
+        f"SELECT o.id, coalesce(l.n, 0) AS n FROM {_quote(model)} o "
+        f"LEFT JOIN (SELECT {column} AS id, count(*) AS n "
+        f"FROM {_quote(through)} GROUP BY 1) l ON l.id = o.id"
+    )
+
+
+def recipe_stats_drift():
+    """Return how many core_recipestat rows are missing, extra or wrong"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM {_quote(RecipeStat)} s "
+            f"FULL JOIN ({_expected_stats_sql()}) e "
+            f"ON e.user_id = s.user_id AND e.field = s.field "
+            f"AND e.value = s.value "
+            f"WHERE s.recipes IS DISTINCT FROM e.recipes"
+        )
+        return cursor.fetchone()[0]
+
+
+def recipe_count_drift():
+    """Return how many tags and ingredients have a wrong recipe_count"""
+    drift = 0
+    with connection.cursor() as cursor:
+        for model, field in RECIPE_COUNT_MODELS:
+            cursor.execute(
+                f"SELECT count(*) FROM {_quote(model)} c "
+                f"JOIN ({_expected_counts_sql(model, field)}) e "
+                f"ON e.id = c.id WHERE c.recipe_count <> e.n"
+            )
+            drift += cursor.fetchone()[0]
+    return drift
+
+
+def refresh_recipe_counts():
+    """Recount Tag/Ingredient.recipe_count from the link tables
+
+    One aggregated UPDATE per model, only writing the rows whose count
+    changed; link writes wait for it. Returns the number of rows
+    corrected.
+    """
+    corrected = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, field in RECIPE_COUNT_MODELS:
+            through = getattr(Recipe, field).through
+            cursor.execute(f"LOCK TABLE {_quote(through)} IN SHARE MODE")
+            cursor.execute(
+                f"UPDATE {_quote(model)} c SET recipe_count = e.n "
+                f"FROM ({_expected_counts_sql(model, field)}) e "
+                f"WHERE c.id = e.id AND c.recipe_count <> e.n"
+            )
+            corrected += cursor.rowcount
+    return corrected
+
+
+def rebuild_recipe_stats():
+    """Rebuild core_recipestat from the recipes, return the rows written
+
+    Recipe writes wait for the rebuild, so none are lost in between.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_quote(Recipe)} IN SHARE MODE")
+        cursor.execute(f"DELETE FROM {_quote(RecipeStat)}")
+        cursor.execute(
+            f"INSERT INTO {_quote(RecipeStat)} "
+            f"(user_id, field, value, recipes) {_expected_stats_sql()}"
+        )
+        return cursor.rowcount
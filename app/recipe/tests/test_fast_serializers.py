@@ -0,0 +1,98 @@
+"""
+Tests for the fast read serializers.
+"""
+import tempfile
+
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import serializers
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        "title": "Sample recipe title",
+        "time_minutes": 22,
+        "price": Decimal("5.20"),
+        "description": "Sample description",
+        "link": "http://example.com/recipe.pdf",
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FastSerializerTests(TestCase):
+    """Test fast serializers render exactly like the ModelSerializers"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "testpass123"
+        )
+        self.request = APIRequestFactory().get("/")
+        self.context = {"request": self.request}
+        self.recipe = create_recipe(user=self.user)
+        self.recipe.tags.add(
+            Tag.objects.create(user=self.user, name="Vegan"),
+            Tag.objects.create(user=self.user, name="Dinner"),
+        )
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Salt")
+        )
+        self.recipe.image = SimpleUploadedFile("x.jpg", b"data")
+        self.recipe.save()
+        create_recipe(user=self.user, title="Plain", price=Decimal("7"))
+
+    def assertRendersLike(self, fast, slow):
+        """Check both serializers produce byte identical JSON"""
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(fast.data), renderer.render(slow.data)
+        )
+
+    def test_recipe_list_identical(self):
+        """Test list output matches RecipeSerializer"""
+        queryset = Recipe.objects.order_by("-id")
+        fast_cls = serializers.FastRecipeSerializer
+        self.assertRendersLike(
+            fast_cls(
+                queryset.values(*fast_cls.columns()),
+                many=True, context=self.context,
+            ),
+            serializers.RecipeSerializer(
+                queryset.prefetch_related("tags", "ingredients"),
+                many=True, context=self.context,
+            ),
+        )
+
+    def test_recipe_detail_identical(self):
+        """Test detail output matches RecipeDetailSerializer"""
+        fast_cls = serializers.FastRecipeDetailSerializer
+        row = Recipe.objects.values(*fast_cls.columns()).get(
+            id=self.recipe.id
+        )
+        self.assertRendersLike(
+            fast_cls(row),
+            serializers.RecipeDetailSerializer(self.recipe),
+        )
+
+    def test_tag_list_identical(self):
+        """Test tag list output matches TagSerializer"""
+        queryset = Tag.objects.order_by("-name")
+        fast_cls = serializers.FastTagSerializer
+        self.assertRendersLike(
+            fast_cls(queryset.values(*fast_cls.columns()), many=True),
+            serializers.TagSerializer(queryset, many=True),
+        )
+
+    def test_empty_list(self):
+        """Test an empty page renders without extra queries"""
+        fast_cls = serializers.FastRecipeSerializer
+        with self.assertNumQueries(0):
+            self.assertEqual(fast_cls([], many=True).data, [])
@@ -12,6 +12,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Ingredient, Recipe
+from recipe.cache import api_cache
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse("recipe:ingredient-list")
@@ -47,6 +48,7 @@ class PrivateIngredientsAPITests(TestCase):
         self.user = create_user()
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        api_cache().clear()
 
     def test_retrieve_ingredients(self):
         """Test retreiving a list of ingredients"""
@@ -61,7 +63,7 @@ class PrivateIngredientsAPITests(TestCase):
         ingredients = Ingredient.objects.all().order_by("-name")
         serializer = IngredientSerializer(ingredients, many=True)
 
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test list of ingredients is limted in authenticated user"""
@@ -73,8 +75,8 @@ class PrivateIngredientsAPITests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], ingredient.name)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], ingredient.name)
 
     def test_update_ingredient(self):
         """Test updating an ingredient"""
@@ -113,14 +115,15 @@ class PrivateIngredientsAPITests(TestCase):
             user=self.user
         )
         recipe.ingredients.add(in1)
+        in1.refresh_from_db()  # Loads the updated recipe_count
 
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
 
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data["results"])
+        self.assertNotIn(s2.data, res.data["results"])
 
     def test_filtered_ingredients_unique(self):
         """Test filtered ingredient return a unique list."""
@@ -143,4 +146,56 @@ class PrivateIngredientsAPITests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_recipe_count(self):
+        """Test ingredients list the number of recipes using them"""
+        eggs = Ingredient.objects.create(user=self.user, name="Eggs")
+        Ingredient.objects.create(user=self.user, name="Lentils")
+        for title in ["Omelette", "Frittata"]:
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=10, price=Decimal("3.00"),
+                user=self.user,
+            )
+            recipe.ingredients.add(eggs)
+
+        res = self.client.get(INGREDIENTS_URL)
+
+        counts = {i["name"]: i["recipe_count"] for i in res.data["results"]}
+        self.assertEqual(counts, {"Eggs": 2, "Lentils": 0})
+
+    def test_order_by_popular(self):
+        """Test ordering=popular lists the most used ingredients first"""
+        names = ["Eggs", "Flour", "Milk"]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in names
+        ]
+        for uses, ingredient in zip([1, 3, 2], ingredients):
+            for _ in range(uses):
+                recipe = Recipe.objects.create(
+                    title="Batter", time_minutes=5, price=Decimal("1.00"),
+                    user=self.user,
+                )
+                recipe.ingredients.add(ingredient)
+
+        res = self.client.get(INGREDIENTS_URL, {"ordering": "popular"})
+
+        self.assertEqual(
+            [i["name"] for i in res.data["results"]],
+            ["Flour", "Milk", "Eggs"],
+        )
+
+    def test_filter_by_name_prefix(self):
+        """Test q lists ingredients starting with it, literally"""
+        for name in ["Olive oil", "Olives", "100% juice", "Oats"]:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(INGREDIENTS_URL, {"q": "oliv"})
+        self.assertEqual(
+            [i["name"] for i in res.data["results"]], ["Olives", "Olive oil"]
+        )
+        res = self.client.get(INGREDIENTS_URL, {"q": "100%"})
+        self.assertEqual(
+            [i["name"] for i in res.data["results"]], ["100% juice"]
+        )
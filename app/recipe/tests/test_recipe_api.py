@@ -2,13 +2,17 @@
 Tests for recipe APIs
 """
 
+import json
 import tempfile
 import os
+from unittest.mock import patch
 
 from PIL import Image
 from decimal import Decimal
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -19,8 +23,15 @@ from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
+from recipe.cache import api_cache
+from recipe import images
+from recipe.views import RecipeViewSet
 
 RECIPES_URL = reverse("recipe:recipe-list")
+EXPORT_URL = reverse("recipe:recipe-export")
+BATCH_URL = reverse("recipe:recipe-batch")
+STATS_URL = reverse("recipe:recipe-stats")
+PANTRY_URL = reverse("recipe:recipe-pantry")
 
 
 def detail_url(recipe_id):
@@ -28,6 +39,11 @@ def detail_url(recipe_id):
     return reverse("recipe:recipe-detail", args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL"""
+    return reverse("recipe:recipe-similar", args=[recipe_id])
+
+
 def image_upload_url(recipe_id):
     """CReate and return an image upload URL"""
     return reverse("recipe:recipe-upload-image", args=[recipe_id])
@@ -74,6 +90,7 @@ class PrivateRecipeAPITests(TestCase):
             email="user@example.com",
             password="testpass123")
         self.client.force_authenticate(self.user)
+        api_cache().clear()
 
     def test_retrieve_recipes(self):
         """Test retreiving a list of recipes."""
@@ -85,7 +102,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.all().order_by("-id")
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user"""
@@ -104,7 +121,38 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
+
+    def test_recipes_paginated_by_cursor(self):
+        """Test recipe list is split into cursor linked pages"""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {"page_size": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data["previous"])
+        self.assertEqual(
+            [r["id"] for r in res.data["results"]],
+            [recipes[4].id, recipes[3].id],
+        )
+        seen = [r["id"] for r in res.data["results"]]
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            seen += [r["id"] for r in res.data["results"]]
+        self.assertEqual(seen, [r.id for r in reversed(recipes)])
+
+    def test_recipe_cursor_stable_under_inserts(self):
+        """Test recipes created while paging don't repeat or skip rows"""
+        recipes = [create_recipe(user=self.user) for _ in range(4)]
+
+        res = self.client.get(RECIPES_URL, {"page_size": 2})
+        create_recipe(user=self.user)
+        res = self.client.get(res.data["next"])
+
+        self.assertEqual(
+            [r["id"] for r in res.data["results"]],
+            [recipes[1].id, recipes[0].id],
+        )
 
     def test_get_recipe_detail(self):
         """Test get recipe detail"""
@@ -342,6 +390,39 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated tag names in a payload create a single tag"""
+        payload = {
+            "title": "Pad Thai",
+            "time_minutes": 20,
+            "price": Decimal("3.50"),
+            "tags": [{"name": "Thai"}, {"name": "Thai"}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_recipe_does_not_use_other_users_tags(self):
+        """Test a tag with the same name owned by another user is not
+        attached to the recipe"""
+        other_user = create_user(email="other@example.com", password="pw1234")
+        other_tag = Tag.objects.create(user=other_user, name="Thai")
+        payload = {
+            "title": "Pad Thai",
+            "time_minutes": 20,
+            "price": Decimal("3.50"),
+            "tags": [{"name": "Thai"}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertNotIn(other_tag, recipe.tags.all())
+        self.assertEqual(recipe.tags.get().user, self.user)
+
     def test_create_ingredient_on_update(self):
         """Test creating an ingredient when updating a recipe"""
         recipe = create_recipe(user=self.user)
@@ -401,9 +482,9 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data["results"])
+        self.assertIn(s2.data, res.data["results"])
+        self.assertNotIn(s3.data, res.data["results"])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients"""
@@ -421,11 +502,1108 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data["results"])
+        self.assertIn(s2.data, res.data["results"])
+        self.assertNotIn(s3.data, res.data["results"])
+
+    def test_filter_by_tags_returns_unique_recipes(self):
+        """Test a recipe matching several filter tags is listed once"""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Dinner")
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {"tags": f"{tag1.id},{tag2.id}"})
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_filter_by_all_tags(self):
+        """Test match=all returns only recipes carrying every tag"""
+        r1 = create_recipe(user=self.user, title="Vegan Curry")
+        r2 = create_recipe(user=self.user, title="Vegan Salad")
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Dinner")
+        r1.tags.add(tag1, tag2)
+        r2.tags.add(tag1)
+
+        params = {"tags": f"{tag1.id},{tag2.id}", "match": "all"}
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_by_all_tags_and_ingredients(self):
+        """Test match=all applies to both tags and ingredients"""
+        r1 = create_recipe(user=self.user, title="Cheese Toast")
+        r2 = create_recipe(user=self.user, title="Cheese Omelette")
+        tag = Tag.objects.create(user=self.user, name="Breakfast")
+        in1 = Ingredient.objects.create(user=self.user, name="Cheese")
+        in2 = Ingredient.objects.create(user=self.user, name="Bread")
+        r1.tags.add(tag)
+        r2.tags.add(tag)
+        r1.ingredients.add(in1, in2)
+        r2.ingredients.add(in1)
+
+        params = {
+            "tags": f"{tag.id}",
+            "ingredients": f"{in1.id},{in2.id},{in2.id}",
+            "match": "all",
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [r1.id])
+
+    def test_search_title_and_description(self):
+        """Test full-text search matches words in title or description"""
+        r1 = create_recipe(user=self.user, title="Spicy Noodles")
+        r2 = create_recipe(
+            user=self.user, title="Soup", description="Hearty noodle broth"
+        )
+        create_recipe(user=self.user, title="Fish and Chips")
 
+        res = self.client.get(RECIPES_URL, {"search": "noodles"})
 
+        ids = {r["id"] for r in res.data["results"]}
+        self.assertEqual(ids, {r1.id, r2.id})
+
+    def test_search_ranked_by_relevance(self):
+        """Test title matches rank above description matches"""
+        r1 = create_recipe(
+            user=self.user, title="Soup", description="Tomato soup"
+        )
+        r2 = create_recipe(
+            user=self.user, title="Tomato Salad", description="Fresh"
+        )
+
+        res = self.client.get(RECIPES_URL, {"search": "tomato"})
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [r2.id, r1.id])
+
+    def test_search_combined_with_tag_filter(self):
+        """Test search results can be narrowed down by tag"""
+        r1 = create_recipe(user=self.user, title="Vegan Curry")
+        create_recipe(user=self.user, title="Chicken Curry")
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        r1.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL, {"search": "curry", "tags": tag.id})
+
+        self.assertEqual([r["id"] for r in res.data["results"]], [r1.id])
+
+    def test_search_reflects_updates(self):
+        """Test the search index follows title changes"""
+        recipe = create_recipe(user=self.user, title="Pancakes")
+        self.client.patch(detail_url(recipe.id), {"title": "Waffles"})
+
+        res = self.client.get(RECIPES_URL, {"search": "waffles"})
+        self.assertEqual(len(res.data["results"]), 1)
+        res = self.client.get(RECIPES_URL, {"search": "pancakes"})
+        self.assertEqual(len(res.data["results"]), 0)
+
+    def test_search_paginated(self):
+        """Test ranked search results page through every match once"""
+        recipes = [
+            create_recipe(user=self.user, title=f"Curry {i}")
+            for i in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {"search": "curry", "page_size": 2})
+        seen = [r["id"] for r in res.data["results"]]
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            seen += [r["id"] for r in res.data["results"]]
+
+        self.assertCountEqual(seen, [r.id for r in recipes])
+
+    def test_search_paginated_past_equal_ranks(self):
+        """Test more equally ranked matches than DRF's offset cutoff page
+        through once, forwards and back"""
+        recipes = Recipe.objects.bulk_create(
+            Recipe(user=self.user, title="Pasta dish", time_minutes=10,
+                   price=Decimal("5.00"))
+            for _ in range(1250)
+        )
+
+        res = self.client.get(
+            RECIPES_URL, {"search": "pasta", "page_size": 100}
+        )
+        pages = [[r["id"] for r in res.data["results"]]]
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            pages.append([r["id"] for r in res.data["results"]])
+        res = self.client.get(res.data["previous"])
+
+        seen = [recipe_id for page in pages for recipe_id in page]
+        self.assertEqual(len(pages), 13)
+        self.assertCountEqual(seen, [r.id for r in recipes])
+        self.assertEqual([r["id"] for r in res.data["results"]], pages[-2])
+
+    def test_filter_by_time_and_price(self):
+        """Test min/max time_minutes and price bound the recipes, inclusive"""
+        for title, minutes, price in [("Salad", 10, "4.00"),
+                                      ("Soup", 30, "9.99"),
+                                      ("Stew", 90, "8.00"),
+                                      ("Steak", 25, "25.00")]:
+            create_recipe(
+                user=self.user, title=title, time_minutes=minutes,
+                price=Decimal(price),
+            )
+
+        res = self.client.get(
+            RECIPES_URL, {"max_time_minutes": 30, "max_price": "10"}
+        )
+        self.assertCountEqual(
+            [r["title"] for r in res.data["results"]], ["Salad", "Soup"]
+        )
+        res = self.client.get(
+            RECIPES_URL, {"min_time_minutes": 25, "min_price": "8.00"}
+        )
+        self.assertCountEqual(
+            [r["title"] for r in res.data["results"]],
+            ["Soup", "Stew", "Steak"],
+        )
+
+    def test_order_by_time_and_price_paginated(self):
+        """Test ordering pages through recipes by time or price, then id"""
+        recipes = [
+            create_recipe(
+                user=self.user, time_minutes=minutes, price=Decimal(price)
+            )
+            for minutes, price in [(30, "5.00"), (10, "7.00"), (30, "2.00"),
+                                   (20, "7.00")]
+        ]
+
+        for ordering, order in [("time_minutes", [1, 3, 0, 2]),
+                                ("-time_minutes", [2, 0, 3, 1]),
+                                ("price", [2, 0, 1, 3]),
+                                ("-price", [3, 1, 0, 2])]:
+            res = self.client.get(
+                RECIPES_URL, {"ordering": ordering, "page_size": 3}
+            )
+            seen = [r["id"] for r in res.data["results"]]
+            res = self.client.get(res.data["next"])
+            seen += [r["id"] for r in res.data["results"]]
+
+            self.assertEqual(seen, [recipes[i].id for i in order], ordering)
+
+    def test_order_by_time_and_price_past_ties(self):
+        """Test more recipes with the same time and price than DRF's
+        offset cutoff page through once"""
+        recipes = Recipe.objects.bulk_create(
+            Recipe(user=self.user, title="Soup", time_minutes=30,
+                   price=Decimal("5.00"))
+            for _ in range(1250)
+        )
+
+        for ordering in ["time_minutes", "-price"]:
+            res = self.client.get(
+                RECIPES_URL, {"ordering": ordering, "page_size": 100}
+            )
+            seen = [r["id"] for r in res.data["results"]]
+            pages = 1
+            while res.data["next"]:
+                res = self.client.get(res.data["next"])
+                seen += [r["id"] for r in res.data["results"]]
+                pages += 1
+
+            self.assertEqual(pages, 13, ordering)
+            self.assertCountEqual(seen, [r.id for r in recipes])
+
+    def test_invalid_range_filter_rejected(self):
+        """Test malformed bounds and orderings return 400"""
+        for params in [{"max_price": "cheap"}, {"min_time_minutes": "1.5"},
+                       {"ordering": "title"}]:
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params
+            )
+
+
+class RecipeExportTests(TestCase):
+    """Test streaming exports of a user's recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        self.recipes = [
+            create_recipe(user=self.user, title=f"Recipe {i}")
+            for i in range(5)
+        ]
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        self.recipes[0].tags.add(tag)
+        self.recipes[1].ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Salt")
+        )
+
+    def _expected(self):
+        """Return detail responses for the user's recipes, newest first"""
+        return [
+            json.loads(json.dumps(self.client.get(detail_url(r.id)).data))
+            for r in reversed(self.recipes)
+        ]
+
+    def test_export_ndjson(self):
+        """Test the default export streams one recipe per line"""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        recipes = [json.loads(line) for line in lines]
+        self.assertEqual(recipes, self._expected())
+
+    def test_export_json_array(self):
+        """Test output=json streams a single JSON array"""
+        res = self.client.get(EXPORT_URL, {"output": "json"})
+
+        self.assertEqual(res["Content-Type"], "application/json")
+        body = b"".join(res.streaming_content)
+        self.assertEqual(json.loads(body), self._expected())
+
+    def test_export_empty(self):
+        """Test exporting with no recipes gives an empty array"""
+        Recipe.objects.all().delete()
+        res = self.client.get(EXPORT_URL, {"output": "json"})
+
+        self.assertEqual(json.loads(b"".join(res.streaming_content)), [])
+
+    def test_export_limited_to_user(self):
+        """Test export only includes the authenticated user's recipes"""
+        other_user = create_user(email="other@example.com", password="pw1234")
+        create_recipe(user=other_user)
+
+        res = self.client.get(EXPORT_URL)
+
+        lines = b"".join(res.streaming_content).splitlines()
+        self.assertEqual(len(lines), len(self.recipes))
+
+    def test_export_reads_in_chunks(self):
+        """Test nested data is loaded per chunk, not per recipe"""
+        with patch.object(RecipeViewSet, "export_chunk_size", 2):
+            res = self.client.get(EXPORT_URL)
+            with CaptureQueriesContext(connection) as ctx:
+                lines = b"".join(res.streaming_content).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        # 3 chunks x (tags + ingredients) plus the recipe cursor itself
+        nested = [q for q in ctx.captured_queries if "recipe_id" in q["sql"]]
+        self.assertEqual(len(nested), 6)
+
+
+class RecipeSparseFieldsetTests(TestCase):
+    """Test selecting recipe fields with ?fields= and ?omit="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        api_cache().clear()
+        self.recipes = [
+            create_recipe(user=self.user, title=f"Recipe {i}")
+            for i in range(3)
+        ]
+        self.recipes[0].tags.add(
+            Tag.objects.create(user=self.user, name="Vegan")
+        )
+
+    def test_list_fields(self):
+        """Test fields= limits the list to the given fields"""
+        res = self.client.get(RECIPES_URL, {"fields": "title,id"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["results"], [
+            {"id": r.id, "title": r.title} for r in reversed(self.recipes)
+        ])
+
+    def test_list_omit(self):
+        """Test omit= drops the given fields from the list"""
+        res = self.client.get(RECIPES_URL, {"omit": "tags,ingredients"})
+
+        full = self.client.get(RECIPES_URL).data["results"]
+        for recipe in full:
+            del recipe["tags"], recipe["ingredients"]
+        self.assertEqual(res.data["results"], full)
+
+    def test_omitted_relations_not_queried(self):
+        """Test unselected columns and relations are never fetched"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(
+                RECIPES_URL, {"fields": "id,title,time_minutes"}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("core_tag", sql)
+        self.assertNotIn("core_ingredient", sql)
+        self.assertNotIn('"core_recipe"."price"', sql)
+
+    def test_unknown_field_rejected(self):
+        """Test selecting a field that doesn't exist returns 400"""
+        res = self.client.get(RECIPES_URL, {"fields": "id,secret"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", res.data)
+
+    def test_fields_paginate(self):
+        """Test cursor pagination works when the id isn't selected"""
+        res = self.client.get(RECIPES_URL, {"fields": "title", "page_size": 2})
+        titles = [r["title"] for r in res.data["results"]]
+        res = self.client.get(res.data["next"])
+        titles += [r["title"] for r in res.data["results"]]
+
+        self.assertEqual(titles, ["Recipe 2", "Recipe 1", "Recipe 0"])
+        self.assertEqual(res.data["results"], [{"title": "Recipe 0"}])
+
+    def test_retrieve_fields(self):
+        """Test fields= applies to the recipe detail"""
+        recipe = self.recipes[0]
+        res = self.client.get(
+            detail_url(recipe.id), {"fields": "description,tags"}
+        )
+
+        self.assertEqual(res.data, {
+            "description": recipe.description,
+            "tags": [{"id": recipe.tags.get().id, "name": "Vegan"}],
+        })
+
+    def test_export_fields(self):
+        """Test fields= applies to exports"""
+        res = self.client.get(EXPORT_URL, {"fields": "id"})
+
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"id": r.id} for r in reversed(self.recipes)],
+        )
+
+
+class RecipeBatchTests(TestCase):
+    """Test creating and updating recipes in batches"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        api_cache().clear()
+
+    def test_batch_create(self):
+        """Test creating several recipes with tags and ingredients"""
+        Tag.objects.create(user=self.user, name="Vegan")
+        payload = [
+            {
+                "title": f"Recipe {i}",
+                "time_minutes": 10 + i,
+                "price": "3.50",
+                "tags": [{"name": "Vegan"}, {"name": f"Tag {i}"}],
+                "ingredients": [{"name": "Salt"}],
+            }
+            for i in range(3)
+        ]
+        res = self.client.post(BATCH_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["title"] for r in res.data], [
+            "Recipe 0", "Recipe 1", "Recipe 2",
+        ])
+        recipe = Recipe.objects.get(id=res.data[2]["id"])
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(recipe.time_minutes, 12)
+        self.assertEqual(
+            sorted(t.name for t in recipe.tags.all()), ["Tag 2", "Vegan"]
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 1
+        )
+        self.assertEqual(res.data[2], self.client.get(
+            detail_url(recipe.id)
+        ).data)
+
+    def test_batch_mixed_create_and_update(self):
+        """Test items with an id update, the rest are created"""
+        recipe = create_recipe(user=self.user, title="Old title")
+        recipe.tags.add(Tag.objects.create(user=self.user, name="Old"))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Salt")
+        )
+        payload = [
+            {"id": recipe.id, "title": "New title", "tags": [{"name": "New"}]},
+            {"title": "Soup", "time_minutes": 5, "price": "1.00"},
+        ]
+        res = self.client.post(BATCH_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "New title")
+        self.assertEqual(recipe.time_minutes, 22)
+        self.assertEqual([t.name for t in recipe.tags.all()], ["New"])
+        self.assertEqual(recipe.ingredients.count(), 1)  # Left untouched
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def test_batch_invalid_item_writes_nothing(self):
+        """Test a single invalid item rejects the batch with item errors"""
+        recipe = create_recipe(user=self.user, title="Untouched")
+        payload = [
+            {"title": "Soup", "time_minutes": 5, "price": "1.00"},
+            {"title": "No time or price"},
+            {"id": recipe.id, "title": "Changed"},
+        ]
+        res = self.client.post(BATCH_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("time_minutes", res.data[1])
+        self.assertEqual(res.data[2], {})
+        self.assertEqual(Recipe.objects.count(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Untouched")
+
+    def test_batch_other_users_recipe_not_found(self):
+        """Test a batch can't update another user's recipe"""
+        other_user = create_user(email="other@example.com", password="pw1234")
+        recipe = create_recipe(user=other_user, title="Theirs")
+
+        res = self.client.post(
+            BATCH_URL, [{"id": recipe.id, "title": "Mine"}], format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data, [{"id": ["Not found."]}])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Theirs")
+
+    def test_batch_repeated_id_rejected(self):
+        """Test a batch can't update the same recipe twice"""
+        recipe = create_recipe(user=self.user, title="Soup")
+        item = {"id": recipe.id, "tags": [{"name": "Vegan"}]}
+
+        res = self.client.post(
+            BATCH_URL,
+            [item, {"title": "Stew", "time_minutes": 5, "price": "1.00"},
+             item],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data, [
+            {"id": ["Repeated in this batch."]}, {},
+            {"id": ["Repeated in this batch."]},
+        ])
+        self.assertFalse(recipe.tags.exists())
+
+    def test_batch_requires_list(self):
+        """Test the batch payload must be a list"""
+        res = self.client.post(BATCH_URL, {"title": "x"}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_refreshes_cached_list(self):
+        """Test batch writes invalidate the cached recipe list"""
+        self.client.get(RECIPES_URL)
+        payload = [{"title": "Soup", "time_minutes": 5, "price": "1.00"}]
+        self.client.post(BATCH_URL, payload, format="json")
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_batch_query_count_independent_of_size(self):
+        """Test a batch runs the same number of queries for any size"""
+        def run(count):
+            payload = [
+                {
+                    "title": f"Recipe {i}", "time_minutes": 5,
+                    "price": "1.00",
+                    "tags": [{"name": f"Tag {count}-{i}"}, {"name": "Shared"}],
+                    "ingredients": [{"name": f"Ingredient {count}-{i}"}],
+                }
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(BATCH_URL, payload, format="json")
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(ctx)
+
+        self.assertEqual(run(2), run(40))
+
+
+class RecipeQueryBudgetTests(TestCase):
+    """Test recipe endpoints stay within their per-action query budget"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        api_cache().clear()
+
+    def _create_recipes(self, count, tags_per_recipe=3):
+        """Create recipes each with their own tags and ingredients"""
+        recipes = []
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f"Recipe {i}")
+            for j in range(tags_per_recipe):
+                recipe.tags.add(Tag.objects.create(
+                    user=self.user, name=f"Tag {recipe.id}-{j}"
+                ))
+                recipe.ingredients.add(Ingredient.objects.create(
+                    user=self.user, name=f"Ingredient {recipe.id}-{j}"
+                ))
+            recipes.append(recipe)
+        return recipes
+
+    def assertWithinBudget(self, action, func):
+        """Run func and check it stays within the query budget of action"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = func()
+        budget = RecipeViewSet.query_budget[action]
+        self.assertLessEqual(
+            len(ctx), budget,
+            f"{action} ran {len(ctx)} queries (budget {budget}):\n" +
+            "\n".join(q["sql"] for q in ctx.captured_queries)
+        )
+        return res
+
+    def test_list_query_budget(self):
+        """Test listing recipes runs a fixed number of queries"""
+        self._create_recipes(1)
+        res = self.assertWithinBudget(
+            "list", lambda: self.client.get(RECIPES_URL)
+        )
+        self.assertEqual(len(res.data["results"]), 1)
+
+        self._create_recipes(20)
+        res = self.assertWithinBudget(
+            "list", lambda: self.client.get(RECIPES_URL)
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 21)
+        self.assertEqual(len(res.data["results"][0]["tags"]), 3)
+        self.assertEqual(len(res.data["results"][0]["ingredients"]), 3)
+
+    def test_retrieve_query_budget(self):
+        """Test retrieving a recipe runs a fixed number of queries"""
+        recipe = self._create_recipes(1, tags_per_recipe=10)[0]
+        res = self.assertWithinBudget(
+            "retrieve", lambda: self.client.get(detail_url(recipe.id))
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["tags"]), 10)
+
+    def test_create_query_budget(self):
+        """Test creating a recipe runs a fixed number of queries"""
+        payload = {
+            "title": "Sample recipe",
+            "time_minutes": 30,
+            "price": Decimal("5.99"),
+        }
+        res = self.assertWithinBudget(
+            "create",
+            lambda: self.client.post(RECIPES_URL, payload, format="json")
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_create_with_many_tags_query_budget(self):
+        """Test creating a recipe with many new and existing tags and
+        ingredients runs a fixed number of queries"""
+        for i in range(20):
+            Tag.objects.create(user=self.user, name=f"Tag {i}")
+            Ingredient.objects.create(user=self.user, name=f"Ingredient {i}")
+        payload = {
+            "title": "Sample recipe",
+            "time_minutes": 30,
+            "price": Decimal("5.99"),
+            "tags": [{"name": f"Tag {i}"} for i in range(40)],
+            "ingredients": [{"name": f"Ingredient {i}"} for i in range(40)],
+        }
+        res = self.assertWithinBudget(
+            "create",
+            lambda: self.client.post(RECIPES_URL, payload, format="json")
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(recipe.tags.count(), 40)
+        self.assertEqual(recipe.ingredients.count(), 40)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 40)
+
+    def test_update_with_many_tags_query_budget(self):
+        """Test replacing a recipe's tags and ingredients runs a fixed
+        number of queries"""
+        recipe = self._create_recipes(1, tags_per_recipe=10)[0]
+        payload = {
+            "tags": [{"name": f"New tag {i}"} for i in range(40)],
+            "ingredients": [
+                {"name": f"New ingredient {i}"} for i in range(40)
+            ],
+        }
+        res = self.assertWithinBudget(
+            "partial_update",
+            lambda: self.client.patch(
+                detail_url(recipe.id), payload, format="json"
+            )
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["tags"]), 40)
+        self.assertEqual(recipe.ingredients.count(), 40)
+
+    def test_partial_update_query_budget(self):
+        """Test updating a recipe runs a fixed number of queries"""
+        recipe = self._create_recipes(1, tags_per_recipe=10)[0]
+        payload = {"title": "New title"}
+        res = self.assertWithinBudget(
+            "partial_update",
+            lambda: self.client.patch(
+                detail_url(recipe.id), payload, format="json"
+            )
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["tags"]), 10)
+
+    def test_destroy_query_budget(self):
+        """Test deleting a recipe runs a fixed number of queries"""
+        recipe = self._create_recipes(1, tags_per_recipe=10)[0]
+        res = self.assertWithinBudget(
+            "destroy", lambda: self.client.delete(detail_url(recipe.id))
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_pantry_query_budget(self):
+        """Test pantry matching runs a fixed number of queries"""
+        recipes = self._create_recipes(20)
+        pantry = [
+            ingredient.id
+            for recipe in recipes for ingredient in recipe.ingredients.all()
+        ]
+        res = self.assertWithinBudget(
+            "pantry", lambda: self.client.post(
+                PANTRY_URL, {"ingredients": pantry}, format="json"
+            )
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 20)
+
+    def test_similar_query_budget(self):
+        """Test similar recipe lookups run a fixed number of queries"""
+        recipes = self._create_recipes(21)
+        tags = recipes[0].tags.all()
+        for recipe in recipes[1:]:
+            recipe.tags.set(tags)
+            recipe.ingredients.clear()
+        recipes[0].ingredients.clear()
+        res = self.assertWithinBudget(
+            "similar", lambda: self.client.get(similar_url(recipes[0].id))
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 20)
+
+    def test_stats_query_budget(self):
+        """Test recipe stats run a fixed number of queries"""
+        self._create_recipes(20)
+        res = self.assertWithinBudget(
+            "stats", lambda: self.client.get(STATS_URL)
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["recipe_count"], 20)
+
+
+class RecipePantryTests(TestCase):
+    """Test ranking recipes by how much of them a pantry covers"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        self.ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in ["Eggs", "Flour", "Milk", "Sugar"]
+        }
+
+    def _create_recipe(self, title, names):
+        """Create a recipe using the named ingredients"""
+        recipe = create_recipe(user=self.user, title=title)
+        recipe.ingredients.add(*(self.ingredients[name] for name in names))
+        return recipe
+
+    def _pantry(self, names, **params):
+        """Post a pantry of the named ingredients"""
+        ids = [self.ingredients[name].id for name in names]
+        return self.client.post(
+            PANTRY_URL, {"ingredients": ids, **params}, format="json"
+        )
+
+    def test_ranked_by_coverage(self):
+        """Test recipes come best covered first with what's missing"""
+        self._create_recipe("Omelette", ["Eggs", "Milk"])
+        self._create_recipe("Cake", ["Eggs", "Flour", "Milk", "Sugar"])
+        self._create_recipe("Syrup", ["Sugar"])
+
+        res = self._pantry(["Eggs", "Milk", "Flour"])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r["title"], r["coverage"]) for r in res.data],
+            [("Omelette", 1.0), ("Cake", 0.75)],
+        )
+        self.assertEqual(res.data[0]["missing_ingredients"], [])
+        self.assertEqual(
+            res.data[1]["missing_ingredients"],
+            [{"id": self.ingredients["Sugar"].id, "name": "Sugar"}],
+        )
+
+    def test_min_coverage_and_limit(self):
+        """Test min_coverage and limit narrow the matches"""
+        self._create_recipe("Omelette", ["Eggs", "Milk"])
+        self._create_recipe("Pancakes", ["Eggs", "Flour", "Milk"])
+        self._create_recipe("Cake", ["Eggs", "Flour", "Milk", "Sugar"])
+
+        res = self._pantry(["Eggs", "Milk"], min_coverage=0.6)
+        self.assertEqual(
+            [r["title"] for r in res.data], ["Omelette", "Pancakes"]
+        )
+
+        res = self._pantry(["Eggs", "Milk"], limit=1)
+        self.assertEqual([r["title"] for r in res.data], ["Omelette"])
+
+    def test_follows_ingredient_changes(self):
+        """Test matches follow a recipe's ingredients being replaced"""
+        recipe = self._create_recipe("Omelette", ["Eggs", "Milk"])
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {"title": "Sweet omelette",
+             "ingredients": [{"name": "Eggs"}, {"name": "Sugar"}]},
+            format="json",
+        )
+
+        res = self._pantry(["Milk"])
+        self.assertEqual(res.data, [])
+        res = self._pantry(["Eggs"])
+        self.assertEqual(res.data[0]["coverage"], 0.5)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 2)
+
+    def test_other_users_recipes_excluded(self):
+        """Test only the user's own recipes are matched"""
+        other = create_user(email="other@example.com")
+        recipe = create_recipe(user=other)
+        recipe.ingredients.add(self.ingredients["Eggs"])
+
+        res = self._pantry(["Eggs"])
+
+        self.assertEqual(res.data, [])
+
+    def test_empty_pantry_rejected(self):
+        """Test a pantry needs at least one ingredient"""
+        res = self.client.post(PANTRY_URL, {"ingredients": []}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSimilarTests(TestCase):
+    """Test looking up recipes similar to a recipe"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f"Ingredient {i}")
+            for i in range(12)
+        ]
+        self.vegan = Tag.objects.create(user=self.user, name="Vegan")
+
+    def _create_recipe(self, title, ingredients, user=None):
+        """Create a vegan recipe using ingredients of the given indexes"""
+        recipe = create_recipe(user=user or self.user, title=title)
+        recipe.tags.add(self.vegan)
+        recipe.ingredients.add(*(self.ingredients[i] for i in ingredients))
+        return recipe
+
+    def test_most_similar_first(self):
+        """Test recipes sharing the most come first, unrelated ones not"""
+        recipe = self._create_recipe("Curry", range(6))
+        self._create_recipe("Same curry", range(6))
+        self._create_recipe("Other", range(6, 12))
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r["title"], r["similarity"]) for r in res.data],
+            [("Same curry", 1.0)],
+        )
+
+    def test_limit(self):
+        """Test limit caps the number of recipes returned"""
+        recipe = self._create_recipe("Curry", range(6))
+        for i in range(3):
+            self._create_recipe(f"Curry {i}", range(6))
+
+        res = self.client.get(similar_url(recipe.id), {"limit": 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_follows_link_changes(self):
+        """Test signatures follow tags and ingredients being replaced"""
+        recipe = self._create_recipe("Curry", range(6))
+        other = self._create_recipe("Stew", range(6, 12))
+        self.assertEqual(self.client.get(similar_url(recipe.id)).data, [])
+
+        self.client.patch(
+            detail_url(other.id),
+            {"ingredients": [
+                {"name": ingredient.name}
+                for ingredient in self.ingredients[:6]
+            ]},
+            format="json",
+        )
+
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual([r["title"] for r in res.data], ["Stew"])
+
+    def test_no_tags_or_ingredients(self):
+        """Test a recipe without tags or ingredients has no similar ones"""
+        recipe = create_recipe(user=self.user)
+        create_recipe(user=self.user)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_other_users_recipe_not_found(self):
+        """Test looking up another user's recipe returns 404"""
+        other = create_user(email="other@example.com")
+        recipe = create_recipe(user=other)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeStatsTests(TestCase):
+    """Test the per-user recipe statistics"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+
+    def test_stats(self):
+        """Test count, price, time and top tag/ingredient aggregates"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        quick = Tag.objects.create(user=self.user, name="Quick")
+        rice = Ingredient.objects.create(user=self.user, name="Rice")
+        for price, minutes in [("2.00", 5), ("3.00", 15), ("3.00", 25),
+                               ("10.00", 300)]:
+            recipe = create_recipe(
+                user=self.user, price=Decimal(price), time_minutes=minutes
+            )
+            recipe.tags.add(vegan)
+            recipe.ingredients.add(rice)
+        recipe.tags.add(quick)
+        create_recipe(user=create_user(email="other@example.com"))
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["recipe_count"], 4)
+        self.assertEqual(res.data["average_price"], "4.50")
+        self.assertEqual(res.data["median_price"], "3.00")
+        histogram = {
+            bucket["min"]: bucket["recipes"]
+            for bucket in res.data["time_histogram"]
+        }
+        self.assertEqual(histogram[0], 1)
+        self.assertEqual(histogram[10], 1)
+        self.assertEqual(histogram[20], 1)
+        self.assertEqual(histogram[180], 1)
+        self.assertEqual(sum(histogram.values()), 4)
+        self.assertEqual(
+            [(t["name"], t["recipe_count"]) for t in res.data["top_tags"]],
+            [("Vegan", 4), ("Quick", 1)],
+        )
+        self.assertEqual(res.data["top_ingredients"][0]["name"], "Rice")
+
+    def test_stats_follow_updates_and_deletes(self):
+        """Test the summary follows recipes being changed and removed"""
+        recipes = [
+            create_recipe(user=self.user, price=Decimal(price))
+            for price in ["1.00", "2.00", "6.00"]
+        ]
+
+        self.client.patch(
+            detail_url(recipes[0].id), {"price": "4.00"}, format="json"
+        )
+        self.client.delete(detail_url(recipes[2].id))
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data["recipe_count"], 2)
+        self.assertEqual(res.data["average_price"], "3.00")
+        self.assertEqual(res.data["median_price"], "3.00")
+
+    def test_stats_without_recipes(self):
+        """Test a user without recipes gets empty stats"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data["recipe_count"], 0)
+        self.assertIsNone(res.data["average_price"])
+        self.assertIsNone(res.data["median_price"])
+        self.assertEqual(res.data["top_tags"], [])
+
+
+class RecipeResponseCacheTests(TestCase):
+    """Test caching of recipe list responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="user@example.com",
+            password="testpass123")
+        self.client.force_authenticate(self.user)
+        api_cache().clear()
+
+    def test_list_served_from_cache(self):
+        """Test a repeated list request skips the recipe queries"""
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(len(ctx), 1)  # Only the cache generation lookup
+
+    def test_cache_keyed_by_query_params(self):
+        """Test different filters are cached separately"""
+        r1 = create_recipe(user=self.user)
+        create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        r1.tags.add(tag)
+
+        res_all = self.client.get(RECIPES_URL)
+        res_tag = self.client.get(RECIPES_URL, {"tags": tag.id})
+
+        self.assertEqual(len(res_all.data["results"]), 2)
+        self.assertEqual(len(res_tag.data["results"]), 1)
+
+    def test_cache_limited_to_user(self):
+        """Test cached lists are not shared between users"""
+        other_user = create_user(email="other@example.com", password="pw1234")
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        self.client.force_authenticate(other_user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data["results"], [])
+
+    @override_settings(ALLOWED_HOSTS=["api.example.com", "testserver"])
+    def test_cache_keyed_by_origin(self):
+        """Test responses with absolute links aren't shared across hosts"""
+        create_recipe(user=self.user)
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL, {"page_size": 1})
+
+        res = self.client.get(
+            RECIPES_URL, {"page_size": 1},
+            HTTP_HOST="api.example.com", secure=True,
+        )
+
+        self.assertTrue(
+            res.data["next"].startswith("https://api.example.com/")
+        )
+
+    def test_create_invalidates_cache(self):
+        """Test creating a recipe through the API refreshes the list"""
+        self.client.get(RECIPES_URL)
+        payload = {"title": "Soup", "time_minutes": 5, "price": "1.00"}
+        self.client.post(RECIPES_URL, payload)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_update_tags_invalidates_cache(self):
+        """Test replacing a recipe's tags refreshes the cached list"""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        payload = {"tags": [{"name": "Lunch"}]}
+        self.client.patch(detail_url(recipe.id), payload, format="json")
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data["results"][0]["tags"][0]["name"], "Lunch")
+
+    def test_update_bumps_generation_once(self):
+        """Test an update changing fields and links bumps the cache
+        generation once"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name="Vegan"))
+        self.user.refresh_from_db()
+        generation = self.user.cache_generation
+
+        payload = {
+            "title": "Stew",
+            "tags": [{"name": "Lunch"}],
+            "ingredients": [{"name": "Salt"}],
+        }
+        self.client.patch(detail_url(recipe.id), payload, format="json")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.cache_generation, generation + 1)
+
+    def test_link_change_invalidates_cache(self):
+        """Test M2M changes made outside the API refresh the list"""
+        recipe = create_recipe(user=self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name="Salt")
+        self.client.get(RECIPES_URL)
+
+        recipe.ingredients.add(ingredient)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"][0]["ingredients"]), 1)
+
+    def test_tag_rename_invalidates_cache(self):
+        """Test renaming a tag refreshes cached tag and recipe lists"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+        tags_url = reverse("recipe:tag-list")
+        self.client.get(tags_url)
+
+        self.client.patch(
+            reverse("recipe:tag-detail", args=[tag.id]), {"name": "Plant"}
+        )
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data["results"][0]["tags"][0]["name"], "Plant")
+        res = self.client.get(tags_url)
+        self.assertEqual(res.data["results"][0]["name"], "Plant")
+
+
+@override_settings(IMAGE_WORKERS=0)  # Build variants inline on commit
 class ImageUploadTests(TestCase):
     """Tests for the Image upload API"""
     def setUp(self):
@@ -435,12 +1613,28 @@ class ImageUploadTests(TestCase):
             "password123"
         )
         self.client.force_authenticate(self.user)
+        api_cache().clear()
         self.recipe = create_recipe(user=self.user)
 
     # After every test, we "teardown" image after every test
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_variants(self.recipe.image_variants)
         self.recipe.image.delete()
 
+    def _upload(self, size=(1000, 600), process=True):
+        """Upload a JPEG of size and run the queued processing, if process"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new("RGB", size).save(image_file, format="JPEG")
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=process):
+                res = self.client.post(
+                    url, {"image": image_file}, format="multipart"
+                )
+        self.recipe.refresh_from_db()
+        return res
+
     def test_upload_image(self):
         """Test uploading an image to a recipe"""
         url = image_upload_url(self.recipe.id)
@@ -471,3 +1665,81 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_pending_until_processed(self):
+        """Test the upload responds before variants are built"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new("RGB", (10, 10)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks() as callbacks:
+                res = self.client.post(
+                    url, {"image": image_file}, format="multipart"
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["image_status"], "pending")
+        self.assertEqual(res.data["image_variants"], {})
+        self.assertEqual(len(callbacks), 1)
+
+    def test_upload_image_builds_variants(self):
+        """Test resized and re-encoded variants are created"""
+        self._upload()
+
+        self.assertEqual(self.recipe.image_status, "ready")
+        variants = self.recipe.image_variants
+        self.assertEqual(set(variants), set(images.IMAGE_VARIANTS))
+        storage = self.recipe.image.storage
+        with Image.open(storage.path(variants["thumbnail"])) as thumb:
+            self.assertEqual(thumb.size, (200, 120))
+        with Image.open(storage.path(variants["webp"])) as webp:
+            self.assertEqual(webp.format, "WEBP")
+
+    def test_variant_urls_in_list_and_detail(self):
+        """Test list and detail responses link to the variants"""
+        self._upload()
+
+        res = self.client.get(RECIPES_URL)
+        listed = res.data["results"][0]
+        self.assertEqual(listed["image_status"], "ready")
+        self.assertTrue(
+            listed["image_variants"]["thumbnail"].startswith("http://")
+        )
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data["image_variants"], listed["image_variants"])
+
+    def test_reupload_replaces_variants(self):
+        """Test uploading again removes the previous variants"""
+        self._upload()
+        old_variants = self.recipe.image_variants
+        old_image = self.recipe.image.name
+        self._upload()
+
+        storage = self.recipe.image.storage
+        for path in old_variants.values():
+            self.assertFalse(storage.exists(path))
+        self.assertNotEqual(self.recipe.image_variants, old_variants)
+        storage.delete(old_image)
+
+    def test_processing_failure_marks_failed(self):
+        """Test an image that can't be processed is flagged"""
+        with patch(
+            "recipe.images.render_variant", side_effect=OSError("broken")
+        ), self.assertLogs("recipe.images", level="ERROR"):
+            self._upload()
+
+        self.assertEqual(self.recipe.image_status, "failed")
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_unexpected_failure_marks_failed(self):
+        """Test a crashing image job doesn't leave the image pending"""
+        self._upload(process=False)
+        self.assertEqual(self.recipe.image_status, "pending")
+
+        with patch(
+            "recipe.images.render_variant", side_effect=RuntimeError("bug")
+        ), self.assertLogs("recipe.images", level="ERROR"):
+            images.process_image(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, "failed")
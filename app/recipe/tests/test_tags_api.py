@@ -4,13 +4,14 @@ Tests for the tags API.
 from decimal import Decimal
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
 
+from recipe.cache import api_cache, autocomplete_cache
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse("recipe:tag-list")
@@ -46,6 +47,8 @@ class PrivateTagAPITests(TestCase):
         self.client = APIClient()
         self.user = create_user()
         self.client.force_authenticate(self.user)
+        api_cache().clear()
+        autocomplete_cache().clear()
 
     def test_retrieve_tags(self):
         """Test retreiving a list of tags"""
@@ -57,7 +60,7 @@ class PrivateTagAPITests(TestCase):
         tags = Tag.objects.all().order_by("-name")
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         serializer = TagSerializer(tags, many=True)
-        self.assertEqual(serializer.data, res.data)
+        self.assertEqual(serializer.data, res.data["results"])
 
     def test_tags_limited_to_user(self):
         """Test list of tags is limited to authenticated user"""
@@ -68,9 +71,30 @@ class PrivateTagAPITests(TestCase):
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], tag.name)
-        self.assertEqual(res.data[0]["id"], tag.id)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], tag.name)
+        self.assertEqual(res.data["results"][0]["id"], tag.id)
+
+    def test_tags_paginated_by_cursor(self):
+        """Test tag list is split into cursor linked pages by name"""
+        for name in ["Breakfast", "Dinner", "Lunch"]:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {"page_size": 2})
+        names = [t["name"] for t in res.data["results"]]
+        res = self.client.get(res.data["next"])
+        names += [t["name"] for t in res.data["results"]]
+
+        self.assertEqual(names, ["Lunch", "Dinner", "Breakfast"])
+        self.assertIsNone(res.data["next"])
+
+    def test_tags_sparse_fields(self):
+        """Test fields= limits the tag list to the given fields"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.get(TAGS_URL, {"fields": "id"})
+
+        self.assertEqual(res.data["results"], [{"id": tag.id}])
 
     def test_update_tag(self):
         """Test updating a tag"""
@@ -83,6 +107,17 @@ class PrivateTagAPITests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload["name"])
 
+    def test_update_tag_duplicate_name_error(self):
+        """Test renaming a tag to an existing tag name is rejected"""
+        Tag.objects.create(user=self.user, name="Dessert")
+        tag = Tag.objects.create(user=self.user, name="After Dinner")
+        url = detail_url(tag.id)
+        res = self.client.patch(url, {"name": "Dessert"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, "After Dinner")
+
     def test_delete_tag(self):
         """Test deleting a Tag"""
         tag = Tag.objects.create(user=self.user, name="Breakfast")
@@ -105,14 +140,15 @@ class PrivateTagAPITests(TestCase):
             user=self.user
         )
         recipe.tags.add(tag1)
+        tag1.refresh_from_db()  # Loads the updated recipe_count
 
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data["results"])
+        self.assertNotIn(s2.data, res.data["results"])
 
     def test_filtered_tags_unique(self):
         """Test filtered tags returns a unique list"""
@@ -134,4 +170,112 @@ class PrivateTagAPITests(TestCase):
         recipe2.tags.add(tag)
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_recipe_count_follows_links(self):
+        """Test recipe_count follows recipes being linked and deleted"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipes = []
+        for title in ["Curry", "Salad"]:
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=10, price=Decimal("5.00"),
+                user=self.user,
+            )
+            recipe.tags.add(tag)
+            recipes.append(recipe)
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+
+        recipes[0].tags.clear()
+        recipes[1].delete()
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+
+    def test_rename_keeps_recipe_count(self):
+        """Test saving a tag doesn't overwrite its count with a stale one"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe = Recipe.objects.create(
+            title="Curry", time_minutes=10, price=Decimal("5.00"),
+            user=self.user,
+        )
+        recipe.tags.add(tag)  # tag.recipe_count is still 0 in memory
+
+        tag.name = "Plant based"
+        tag.save()
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
+    def test_order_by_popular_paginated(self):
+        """Test ordering=popular pages through tags by use, then name"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ["Breakfast", "Dinner", "Lunch", "Snack"]
+        ]
+        for uses, tag in zip([2, 1, 2, 0], tags):
+            for _ in range(uses):
+                recipe = Recipe.objects.create(
+                    title="Meal", time_minutes=10, price=Decimal("5.00"),
+                    user=self.user,
+                )
+                recipe.tags.add(tag)
+
+        res = self.client.get(
+            TAGS_URL, {"ordering": "popular", "page_size": 2}
+        )
+        results = res.data["results"]
+        res = self.client.get(res.data["next"])
+        results += res.data["results"]
+
+        self.assertEqual(
+            [(t["name"], t["recipe_count"]) for t in results],
+            [("Lunch", 2), ("Breakfast", 2), ("Dinner", 1), ("Snack", 0)],
+        )
+        self.assertIsNone(res.data["next"])
+
+    def test_order_by_popular_past_equal_counts(self):
+        """Test more tags with the same count than DRF's offset cutoff
+        page through once"""
+        tags = Tag.objects.bulk_create(
+            Tag(user=self.user, name=f"Tag {i}") for i in range(1250)
+        )
+
+        res = self.client.get(
+            TAGS_URL, {"ordering": "popular", "page_size": 100}
+        )
+        seen = [t["id"] for t in res.data["results"]]
+        pages = 1
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            seen += [t["id"] for t in res.data["results"]]
+            pages += 1
+
+        self.assertEqual(pages, 13)
+        self.assertCountEqual(seen, [t.id for t in tags])
+
+    @override_settings(AUTOCOMPLETE_PAGE_SIZE=2)
+    def test_filter_by_name_prefix(self):
+        """Test q lists the user's tags starting with it, capped"""
+        for name in ["Vegan", "vegetarian", "Veggie", "Dessert"]:
+            Tag.objects.create(user=self.user, name=name)
+        Tag.objects.create(user=create_user("other@example.com"), name="Vex")
+
+        res = self.client.get(TAGS_URL, {"q": "VEG", "page_size": 10})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [t["name"] for t in res.data["results"]], ["vegetarian", "Veggie"]
+        )
+        res = self.client.get(res.data["next"])
+        self.assertEqual([t["name"] for t in res.data["results"]], ["Vegan"])
+
+    def test_name_prefix_cached_until_change(self):
+        """Test autocomplete responses are cached until tags change"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        self.client.get(TAGS_URL, {"q": "ve"})
+
+        self.client.patch(detail_url(tag.id), {"name": "Dessert"})
+        res = self.client.get(TAGS_URL, {"q": "ve"})
+
+        self.assertEqual(res.data["results"], [])
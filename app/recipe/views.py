@@ -1,6 +1,7 @@
 """
 Views for the Recipe APIs
 """
+import json
 
 from drf_spectacular.utils import (  # For specific query apis
     extend_schema_view,
@@ -8,14 +9,34 @@ from drf_spectacular.utils import (  # For specific query apis
     OpenApiParameter,
     OpenApiTypes
 )
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.http import StreamingHttpResponse
+from django.db.models import (
+    Count, Exists, F, FloatField, OuterRef, Subquery,
+)
+from django.db.models.functions import Cast
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
 from core.models import Recipe, Tag, Ingredient
+from core.routers import ReplicaReadsMixin
+from user.authentication import CachedTokenAuthentication
 from recipe import serializers
+from recipe.cache import CachedListMixin, autocomplete_cache
+from recipe.fieldsets import SparseFieldsetMixin, fieldset_parameters
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
+from recipe.pantry import match_pantry
+from recipe.similarity import similar_recipes
+from recipe.stats import get_recipe_stats
+
+# Text search configuration used by the Recipe.search_vector trigger
+SEARCH_CONFIG = "english"
 
 
 # Making a Base Class for TagViewSet and Ingredients ViewSet
@@ -26,17 +47,42 @@ from recipe import serializers
                 "assigned_only",
                 OpenApiTypes.INT, enum=[0, 1],
                 description="Filter by items assigned to recipes"
-            )
+            ),
+            OpenApiParameter(
+                "q",
+                OpenApiTypes.STR,
+                description=(
+                    "Only names starting with this, case-insensitive, in "
+                    "short pages for autocomplete (10 items by default)"
+                )
+            ),
+            OpenApiParameter(
+                "ordering",
+                OpenApiTypes.STR, enum=["name", "popular"],
+                description=(
+                    "Order by name (default) or by recipe_count, most "
+                    "used first"
+                )
+            ),
+            # Tags and ingredients render the same fields
+            *fieldset_parameters(serializers.TagSerializer),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            SparseFieldsetMixin,
+                            ReplicaReadsMixin,
+                            mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for recipe attributes"""
-    authentication_classes = [TokenAuthentication]  # Supports Token Auth
+    authentication_classes = [CachedTokenAuthentication]  # Token Auth
     permission_classes = [IsAuthenticated]  # Need to be Auth to use API
+    pagination_class = RecipeAttrCursorPagination
+
+    # Read-only serializer rendering list rows (see FastReadSerializer)
+    fast_serializer_class = None
 
     # Custom Method so we don't get recipes from other users
     def get_queryset(self):
@@ -46,11 +92,40 @@ class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # The maintained count, no look at the link table needed
+            queryset = queryset.filter(recipe_count__gt=0)
+        prefix = self.request.query_params.get("q")
+        if prefix:
+            # Range scan of the (user, UPPER(name) text_pattern_ops) index
+            queryset = queryset.filter(name__istartswith=prefix)
 
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by("-name").distinct()
+        ).order_by(*self.get_cursor_ordering())
+
+        if self.action == "list":
+            queryset = queryset.values(*self.get_row_columns())
+        return queryset
+
+    def get_cursor_ordering(self):
+        """Return the ordering the list is paginated by"""
+        if self.request.query_params.get("ordering") == "popular":
+            # Served by the (user, -recipe_count, -name) index, pages seek
+            # on (recipe_count, name) as names are unique per user
+            return ("-recipe_count", "-name")
+        return ("-name",)
+
+    def get_list_cache(self):
+        """Keep autocomplete responses apart from the full lists"""
+        if self.request.query_params.get("q"):
+            return autocomplete_cache()
+        return super().get_list_cache()
+
+    def get_serializer_class(self):
+        """Return the fast read serializer for lists"""
+        if self.action == "list":
+            return self.fast_serializer_class
+        return self.serializer_class
 
 
 @extend_schema_view(  # Extend auto-generated schema by drf spectacular
@@ -65,43 +140,185 @@ class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
                 "ingredients",
                 OpenApiTypes.STR,
                 description="Comma separated list of ingredients to filter"
-            )
+            ),
+            OpenApiParameter(
+                "search",
+                OpenApiTypes.STR,
+                description=(
+                    "Full-text search over title and description, results "
+                    "ranked by relevance (supports quotes, OR and -word)"
+                )
+            ),
+            OpenApiParameter(
+                "match",
+                OpenApiTypes.STR, enum=["any", "all"],
+                description=(
+                    "Return recipes with any (default) or all of the "
+                    "given tags and ingredients"
+                )
+            ),
+            *(
+                OpenApiParameter(
+                    f"{bound}_{field}", param_type,
+                    description=f"{bound.capitalize()}imum {field}, inclusive"
+                )
+                for field, param_type in [
+                    ("time_minutes", OpenApiTypes.INT),
+                    ("price", OpenApiTypes.DECIMAL),
+                ]
+                for bound in ["min", "max"]
+            ),
+            OpenApiParameter(
+                "ordering",
+                OpenApiTypes.STR,
+                enum=["time_minutes", "-time_minutes", "price", "-price"],
+                description=(
+                    "Order by time or price, ascending or descending (-). "
+                    "Newest first by default, or by relevance with search"
+                )
+            ),
+            *fieldset_parameters(serializers.RecipeSerializer),
         ]
-    )
+    ),
+    retrieve=extend_schema(
+        parameters=fieldset_parameters(serializers.RecipeDetailSerializer)
+    ),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin,
+                    SparseFieldsetMixin,
+                    ReplicaReadsMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs"""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]  # Supports Token Auth
+    authentication_classes = [CachedTokenAuthentication]  # Token Auth
     permission_classes = [IsAuthenticated]  # Need to be Auth to use API
+    pagination_class = RecipeCursorPagination
+
+    # Maximum number of SQL queries each action may issue, independent of
+    # how many recipes, tags or ingredients are involved. Enforced by the
+    # query budget tests so N+1 patterns can't creep back in.
+    query_budget = {
+        "list": 4,
+        "retrieve": 3,
+        "create": 14,
+        "update": 17,
+        "partial_update": 17,
+        "destroy": 5,
+        "stats": 3,
+        "pantry": 3,
+        "similar": 4,
+    }
+
+    # Actions served from replicas like GETs (see ReplicaReadsMixin)
+    read_actions = ("pantry",)
+
+    # Actions accepting ?fields= and ?omit=
+    fieldset_actions = ("list", "retrieve", "export")
+
+    # Cursor ordering of each ?ordering=. Ties go by id in the same
+    # direction, so the cursor seeks on (field, id) and one (user, field,
+    # id) index serves both directions.
+    orderings = {
+        "time_minutes": ("time_minutes", "id"),
+        "-time_minutes": ("-time_minutes", "-id"),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+    }
+
+    # Recipes fetched per server-side cursor round trip by export
+    export_chunk_size = 1000
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers [1, 2, 3]"""
         return [int(str_id) for str_id in qs.split(",")]
 
+    def _filter_by_related(self, queryset, field, ids, match_all):
+        """Filter recipes linked to any/all of ids through the M2M field
+
+        Uses a semi-join on the link table so recipe rows never need to be
+        de-duplicated. For match_all, the recipe must link to every
+        distinct id, counted in the database.
+        """
+        through = getattr(Recipe, field).through
+        target = Recipe._meta.get_field(field).m2m_reverse_field_name()
+        links = through.objects.filter(
+            recipe=OuterRef("pk"), **{f"{target}__in": ids}
+        )
+        if not match_all:
+            return queryset.filter(Exists(links))
+
+        matched = links.values("recipe").annotate(
+            matched=Count("*")
+        ).values("matched")
+        return queryset.alias(
+            **{f"{field}_matched": Subquery(matched)}
+        ).filter(**{f"{field}_matched": len(set(ids))})
+
     # Custom Method So we don't get recipes from other users
     def get_queryset(self):
         """Retrieve recipes for authenticated user"""
         tags = self.request.query_params.get("tags")
         ingredients = self.request.query_params.get("ingredients")
+        match_all = self.request.query_params.get("match") == "all"
         queryset = self.queryset  # Original queryset
         if tags:  # Editing it so it filters by tag and ingredients
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_by_related(
+                queryset, "tags", tag_ids, match_all
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_by_related(
+                queryset, "ingredients", ingredient_ids, match_all
+            )
+
+        params = serializers.RecipeFilterSerializer(
+            data=self.request.query_params
+        )
+        params.is_valid(raise_exception=True)
+        queryset = queryset.filter(**params.get_filters())
 
         # Return the NEW queryset (only from current user)
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by("-id").distinct()
+        ).order_by("-id")
+
+        if self.action in ("list", "retrieve", "export"):
+            # Plain rows for the fast serializers, which load nested
+            # tags/ingredients in one query each, only fetching the columns
+            # and relations behind the selected fields
+            queryset = queryset.values(*self.get_row_columns())
+
+        search = self.request.query_params.get("search")
+        if search and self.action == "list":
+            query = SearchQuery(
+                search, search_type="websearch", config=SEARCH_CONFIG
+            )
+            # Uses the GIN index on search_vector; rank is kept in the row
+            # so the paginator can build cursors from it. ts_rank is a
+            # real, whose text form doesn't round-trip through a Python
+            # float; as a double the cursor seeks past exactly this rank.
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+            )
+        return queryset
+
+    def get_cursor_ordering(self):
+        """Return the ordering the list is paginated by"""
+        ordering = self.request.query_params.get("ordering")
+        if ordering in self.orderings:
+            return self.orderings[ordering]
+        if self.request.query_params.get("search"):
+            return ("-rank", "-id")
+        return ("-id",)
 
     def get_serializer_class(self):  # Figuring out with serializer to use
         """Return the serializer class for request"""
         if self.action == "list":  # Default Action in viewset
-            return serializers.RecipeSerializer  # reference to class
+            return serializers.FastRecipeSerializer  # reference to class
+        elif self.action in ("retrieve", "export"):
+            return serializers.FastRecipeDetailSerializer
         elif self.action == "upload_image":   # Custom Action we create
             return serializers.RecipeImageSerializer
         return self.serializer_class
@@ -129,14 +346,196 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses=serializers.RecipeDetailSerializer(many=True),
+    )
+    @action(methods=["POST"], detail=False)
+    def batch(self, request):
+        """Create and update many recipes in a single transaction
+
+        Items with an "id" partially update that recipe, the others are
+        created. Nothing is written unless every item is valid; errors are
+        returned as a list matching the items.
+        """
+        batch = serializers.RecipeBatchSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        if not batch.is_valid():
+            return Response(batch.errors, status=status.HTTP_400_BAD_REQUEST)
+        ids = batch.save()
+
+        serializer_class = serializers.FastRecipeDetailSerializer
+        rows = Recipe.objects.filter(id__in=ids).values(
+            *serializer_class.columns()
+        )
+        data = {
+            recipe["id"]: recipe
+            for recipe in serializer_class(
+                rows, many=True, context=self.get_serializer_context()
+            ).data
+        }
+        return Response([data[recipe_id] for recipe_id in ids])
+
+    def _export_chunks(self, queryset):
+        """Yield lists of rendered recipes, export_chunk_size at a time
+
+        Rows come from a server-side cursor and each chunk's tags and
+        ingredients are loaded in one query per relation, so memory use
+        doesn't grow with the number of recipes.
+        """
+        chunk = []
+        for row in queryset.iterator(chunk_size=self.export_chunk_size):
+            chunk.append(row)
+            if len(chunk) == self.export_chunk_size:
+                yield self.get_serializer(chunk, many=True).data
+                chunk = []
+        if chunk:
+            yield self.get_serializer(chunk, many=True).data
+
+    def _export_ndjson(self, queryset):
+        """Yield one JSON document per line"""
+        for chunk in self._export_chunks(queryset):
+            yield "".join(
+                json.dumps(recipe, cls=JSONEncoder) + "\n" for recipe in chunk
+            )
+
+    def _export_json(self, queryset):
+        """Yield a single JSON array, piece by piece"""
+        yield "["
+        separator = ""
+        for chunk in self._export_chunks(queryset):
+            for recipe in chunk:
+                yield separator + json.dumps(recipe, cls=JSONEncoder)
+                separator = ","
+        yield "]"
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "output",
+                OpenApiTypes.STR, enum=["ndjson", "json"],
+                description="Newline delimited JSON (default) or a JSON array"
+            ),
+            *fieldset_parameters(serializers.RecipeDetailSerializer),
+        ],
+        responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+    )
+    @action(methods=["GET"], detail=False)
+    def export(self, request):
+        """Stream all of the user's recipes with their tags/ingredients"""
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get("output") == "json":
+            content, content_type = self._export_json(queryset), "json"
+        else:
+            content = self._export_ndjson(queryset)
+            content_type = "x-ndjson"
+        response = StreamingHttpResponse(
+            content, content_type=f"application/{content_type}"
+        )
+        extension = "json" if content_type == "json" else "ndjson"
+        response["Content-Disposition"] = (
+            f'attachment; filename="recipes.{extension}"'
+        )
+        return response
+
+    @extend_schema(
+        request=serializers.PantrySerializer,
+        responses=serializers.PantryMatchSerializer(many=True),
+    )
+    @action(methods=["POST"], detail=False)
+    def pantry(self, request):
+        """Rank the user's recipes by how much of each the pantry covers
+
+        Takes the ingredient ids the user has. Recipes sharing at least one
+        of them (and min_coverage of their ingredients) are returned best
+        covered first, newest first among equals, each with its coverage
+        (0-1) and the ingredients still missing.
+        """
+        params = serializers.PantrySerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        queryset = match_pantry(
+            Recipe.objects.filter(user=request.user),
+            params.validated_data["ingredients"],
+        )
+        min_coverage = params.validated_data["min_coverage"]
+        if min_coverage:
+            queryset = queryset.filter(coverage__gte=min_coverage)
+
+        serializer_class = serializers.FastRecipeSerializer
+        rows = list(queryset.values(
+            *serializer_class.columns(), "coverage"
+        )[:params.validated_data["limit"]])
+        data = serializer_class(
+            rows, many=True, context=self.get_serializer_context()
+        ).data
+        pantry = set(params.validated_data["ingredients"])
+        for item, row in zip(data, rows):
+            item["coverage"] = row["coverage"]
+            item["missing_ingredients"] = [
+                ingredient for ingredient in item["ingredients"]
+                if ingredient["id"] not in pantry
+            ]
+        return Response(data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "limit",
+                OpenApiTypes.INT,
+                description="Most recipes to return"
+            ),
+        ],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=["GET"], detail=True)
+    def similar(self, request, pk=None):
+        """Return the user's recipes most like this one
+
+        Similarity is the estimated overlap (0-1) of the recipes' tags and
+        ingredients, looked up from precomputed signatures
+        (recipe.similarity) rather than by comparing every recipe.
+        """
+        params = serializers.SimilarSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = similar_recipes(
+            Recipe.objects.filter(user=request.user), self.get_object()
+        )
+
+        serializer_class = serializers.FastRecipeSerializer
+        rows = list(queryset.values(
+            *serializer_class.columns(), "similarity"
+        )[:params.validated_data["limit"]])
+        data = serializer_class(
+            rows, many=True, context=self.get_serializer_context()
+        ).data
+        for item, row in zip(data, rows):
+            item["similarity"] = row["similarity"]
+        return Response(data)
+
+    @extend_schema(responses=serializers.RecipeStatsSerializer)
+    @action(methods=["GET"], detail=False)
+    def stats(self, request):
+        """Return aggregates over the user's recipes
+
+        Read from the summary tables kept up to date as recipes are
+        written (recipe.stats), not from the recipes themselves.
+        """
+        serializer = serializers.RecipeStatsSerializer(
+            get_recipe_stats(request.user)
+        )
+        return Response(serializer.data)
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
     serializer_class = serializers.TagSerializer
+    fast_serializer_class = serializers.FastTagSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage Ingredients in the DB"""
     serializer_class = serializers.IngredientSerializer
+    fast_serializer_class = serializers.FastIngredientSerializer
     queryset = Ingredient.objects.all()
@@ -0,0 +1,102 @@
+"""
+Authentication classes for the APIs
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Bounded, thread safe LRU cache of token key -> (user, token)
+
+    Entries expire after ttl seconds. The cache lives in each worker
+    process; signal handlers evict entries when a token is deleted or its
+    user is saved, but only in the worker making the change. Other workers,
+    and every worker for changes sending no signals, keep trusting an entry
+    until it expires, so the TTL is the window in which a revoked token or
+    deactivated user is still accepted and must stay short.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (user, token) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Cache value under key, evicting the least recently used entry"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, key):
+        """Drop the entry for a token key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        """Drop every entry belonging to a user"""
+        with self._lock:
+            for key, (_, (user, _)) in list(self._entries.items()):
+                if user.pk == user_id:
+                    del self._entries[key]
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches token lookups in-process"""
+
+    def authenticate_credentials(self, key):
+        """Return (user, token) for key, from the cache when possible"""
+        cached = token_cache.get(key)
+        if cached is None:
+            # Raises AuthenticationFailed for unknown keys/inactive users
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # Each request gets its own copy so views can't mutate the cache
+        return copy.copy(user), token
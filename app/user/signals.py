@@ -0,0 +1,22 @@
+"""
+Signal handlers keeping the token authentication cache in sync
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a token as soon as it is deleted"""
+    token_cache.evict(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def evict_changed_user(sender, instance, **kwargs):
+    """Reload a user (e.g. deactivated in the admin) on the next request"""
+    token_cache.evict_user(instance.pk)
@@ -0,0 +1,152 @@
+"""
+Tests for the cached token authentication.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import TokenCache, token_cache
+
+ME_URL = reverse("user:me")
+
+
+def create_user(email="user@example.com", password="testpass123"):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+class TokenCacheTests(TestCase):
+    """Test the in-process token cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows past its maximum size"""
+        cache = TokenCache(max_size=2, ttl=60)
+        user = create_user()
+        cache.set("a", (user, None))
+        cache.set("b", (user, None))
+        cache.get("a")
+        cache.set("c", (user, None))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_entries_expire(self):
+        """Test entries are dropped once their TTL has passed"""
+        cache = TokenCache(max_size=2, ttl=0)
+        cache.set("a", (create_user(), None))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating API requests with a cached token"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_repeat_request_skips_token_lookup(self):
+        """Test a second request is authenticated without a token query"""
+        self.client.get(ME_URL)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], self.user.email)
+        self.assertFalse(any(
+            "authtoken_token" in query["sql"]
+            for query in ctx.captured_queries
+        ))
+        self.assertEqual(token_cache.stats()["hits"], 1)
+        self.assertEqual(token_cache.stats()["misses"], 1)
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test a deactivated user's token stops working immediately"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch.object(token_cache, "ttl", 0)
+    def test_deactivated_without_signals_rejected_on_expiry(self):
+        """Test a user deactivated by a queryset update is rejected once
+        their cache entry expires"""
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_in_admin_rejected(self):
+        """Test deactivating a user through the admin evicts their token"""
+        self.client.get(ME_URL)
+        admin_user = get_user_model().objects.create_superuser(
+            "admin@example.com", "testpass123"
+        )
+        admin_client = APIClient()
+        admin_client.force_login(admin_user)
+        url = reverse("admin:core_user_change", args=[self.user.id])
+        admin_client.post(url, {
+            "email": self.user.email,
+            "name": "Test Name",
+            "is_active": "",
+            "is_staff": "",
+            "is_superuser": "",
+        })
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_changed_elsewhere_visible(self):
+        """Test the profile isn't served from the cached user"""
+        self.client.get(ME_URL)
+        # Another worker's update, which evicts nothing in this process
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            name="Other Name"
+        )
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data["name"], "Other Name")
+
+    def test_profile_update_visible_on_next_request(self):
+        """Test updating the profile through the API isn't masked"""
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {"name": "New Name"})
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data["name"], "New Name")
@@ -1,9 +1,13 @@
 """
 Views for the user API
 """
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+
+from core.routers import ReplicaReadsMixin
+from user.authentication import CachedTokenAuthentication
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
@@ -21,15 +25,17 @@ class CreateTokenView(ObtainAuthToken):
     rendered_classes = api_settings.DEFAULT_RENDERER_CLASSES  # Browsable API
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(ReplicaReadsMixin, generics.RetrieveUpdateAPIView):
     """Manage the Authenticated User"""
     serializer_class = UserSerializer
     # Authentication: Is the user who they say they are
     # Permissions: What is the user allowed to do
     # We auth using TokenAuth, Only requirement for permission is Auth
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return the authenticated user"""
-        return self.request.user
+        # request.user may come from this worker's token cache, which only
+        # decides authentication; the profile is always read fresh
+        return get_user_model().objects.get(pk=self.request.user.pk)
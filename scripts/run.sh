@@ -6,4 +6,10 @@ python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+# APP_SERVER=uvicorn serves the app over ASGI (see app/core/asgi.py)
+if [ "$APP_SERVER" = "uvicorn" ]; then
+    uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers 4 \
+        --proxy-headers --no-access-log
+else
+    uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+fi